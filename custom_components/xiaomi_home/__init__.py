@@ -62,7 +62,7 @@ from .miot.miot_spec import (
 from .miot.const import (
     DEFAULT_INTEGRATION_LANGUAGE, DOMAIN, SUPPORTED_PLATFORMS)
 from .miot.miot_error import MIoTOauthError
-from .miot.miot_device import MIoTDevice
+from .miot.miot_device import MIoTDevice, MIoTEntityPlan
 from .miot.miot_client import MIoTClient, get_miot_instance_async
 
 _LOGGER = logging.getLogger(__name__)
@@ -123,13 +123,33 @@ async def async_setup_entry(
             storage=miot_client.miot_storage,
             loop=miot_client.main_loop)
         await manufacturer.init_async()
+        # Parse each distinct urn once, concurrently
+        spec_start_ts = miot_client.main_loop.time()
+        spec_instances = await spec_parser.parse_many_async(
+            urn_list=[
+                info['urn'] for info in miot_client.device_list.values()])
+        _LOGGER.info(
+            'parse specs, %d devices, %d urns, %.3fs, %s',
+            len(miot_client.device_list), len(spec_instances),
+            miot_client.main_loop.time() - spec_start_ts,
+            spec_parser.cache_stats)
+        # spec_transform() marks the spec objects, devices of the same urn
+        # get their own copy, loaded from the cached spec dict of the parser
+        used_urns: set[str] = set()
+        entity_plans: dict[str, MIoTEntityPlan] = {}
         miot_devices: list[MIoTDevice] = []
         er = entity_registry.async_get(hass=hass)
         for did, info in miot_client.device_list.items():
-            spec_instance = await spec_parser.parse(urn=info['urn'])
+            spec_instance = spec_instances.get(info['urn'], None)
+            if (
+                isinstance(spec_instance, MIoTSpecInstance)
+                and info['urn'] in used_urns
+            ):
+                spec_instance = await spec_parser.parse(urn=info['urn'])
             if not isinstance(spec_instance, MIoTSpecInstance):
                 _LOGGER.error('spec content is None, %s, %s', did, info)
                 continue
+            used_urns.add(info['urn'])
             device: MIoTDevice = MIoTDevice(
                 miot_client=miot_client,
                 device_info={
@@ -137,7 +157,7 @@ async def async_setup_entry(
                         info.get('manufacturer', ''))},
                 spec_instance=spec_instance)
             miot_devices.append(device)
-            device.spec_transform()
+            device.spec_transform(entity_plans=entity_plans)
             # Remove filter entities and non-standard entities
             for platform in SUPPORTED_PLATFORMS:
                 # ONLY support filter spec service translate entity
@@ -313,6 +333,9 @@ async def async_remove_entry(
     # Clean device list
     await miot_storage.remove_async(
         domain='miot_devices', name=f'{uid}_{cloud_server}', type_=dict)
+    # Clean property snapshot
+    await miot_storage.remove_async(
+        domain='miot_props', name=f'{uid}_{cloud_server}', type_=dict)
     # Clean user configuration
     await miot_storage.update_user_config_async(
         uid=uid, cloud_server=cloud_server, config=None)
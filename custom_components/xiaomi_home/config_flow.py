@@ -78,6 +78,9 @@ from .miot.const import (
     DEFAULT_COVER_DEAD_ZONE_WIDTH,
     MIN_COVER_DEAD_ZONE_WIDTH,
     MAX_COVER_DEAD_ZONE_WIDTH,
+    DEFAULT_PROP_SNAPSHOT_TTL,
+    MIN_PROP_SNAPSHOT_TTL,
+    MAX_PROP_SNAPSHOT_TTL,
     DEFAULT_NICK_NAME,
     DEFAULT_OAUTH2_API_HOST,
     DEFAULT_CLOUD_BROKER_HOST,
@@ -1004,6 +1007,9 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
     _display_binary_mode: list[str]
     _display_devs_notify: list[str]
     _cover_dz_width: int
+    _hedged_reads: bool
+    _prop_snapshot_ttl: int
+    _mips_shared_io: bool
 
     _oauth_redirect_url_full: str
     _auth_info: dict
@@ -1025,6 +1031,9 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
     _opt_network_detect_cfg: bool
     _opt_check_network_deps: bool
     _cover_width_new: int
+    _hedged_reads_new: bool
+    _prop_snapshot_ttl_new: int
+    _mips_shared_io_new: bool
 
     _trans_rules_count: int
     _trans_rules_count_success: int
@@ -1063,6 +1072,10 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
             'display_binary_mode', ['text'])
         self._display_devs_notify = self._entry_data.get(
             'display_devices_changed_notify', ['add', 'del', 'offline'])
+        self._hedged_reads = self._entry_data.get('hedged_reads', False)
+        self._prop_snapshot_ttl = self._entry_data.get(
+            'prop_snapshot_ttl', DEFAULT_PROP_SNAPSHOT_TTL)
+        self._mips_shared_io = self._entry_data.get('mips_shared_io', False)
         self._home_selected_list = list(
             self._entry_data['home_selected'].keys())
         self._devices_filter = self._entry_data.get('devices_filter', {})
@@ -1081,6 +1094,9 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
         self._hide_non_standard_entities_new = False
         self._display_binary_mode_new = []
         self._cover_width_new = self._cover_dz_width
+        self._hedged_reads_new = self._hedged_reads
+        self._prop_snapshot_ttl_new = self._prop_snapshot_ttl
+        self._mips_shared_io_new = self._mips_shared_io
         self._update_user_info = False
         self._update_devices = False
         self._update_trans_rules = False
@@ -1359,6 +1375,21 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
                     ): vol.All(vol.Coerce(int), vol.Range(
                         min=MIN_COVER_DEAD_ZONE_WIDTH,
                         max=MAX_COVER_DEAD_ZONE_WIDTH)),
+                    # Performance configure
+                    vol.Required(
+                        'hedged_reads',
+                        default=self._hedged_reads  # type: ignore
+                    ): bool,
+                    vol.Optional(
+                        'prop_snapshot_ttl',
+                        default=self._prop_snapshot_ttl  # type: ignore
+                    ): vol.All(vol.Coerce(int), vol.Range(
+                        min=MIN_PROP_SNAPSHOT_TTL,
+                        max=MAX_PROP_SNAPSHOT_TTL)),
+                    vol.Required(
+                        'mips_shared_io',
+                        default=self._mips_shared_io  # type: ignore
+                    ): bool,
                     vol.Required(
                         'update_trans_rules',
                         default=self._update_trans_rules  # type: ignore
@@ -1399,6 +1430,12 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
             'network_detect_config', self._opt_network_detect_cfg)
         self._cover_width_new = user_input.get(
             'cover_dead_zone_width', self._cover_dz_width)
+        self._hedged_reads_new = user_input.get(
+            'hedged_reads', self._hedged_reads)
+        self._prop_snapshot_ttl_new = user_input.get(
+            'prop_snapshot_ttl', self._prop_snapshot_ttl)
+        self._mips_shared_io_new = user_input.get(
+            'mips_shared_io', self._mips_shared_io)
 
         return await self.async_step_update_user_info()
 
@@ -1978,6 +2015,17 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
         if self._cover_width_new != self._cover_dz_width:
             self._entry_data['cover_dead_zone_width'] = self._cover_width_new
             self._need_reload = True
+        if self._hedged_reads_new != self._hedged_reads:
+            # Takes effect on the next read, no reload
+            self._entry_data['hedged_reads'] = self._hedged_reads_new
+            self._miot_client.hedged_reads = self._hedged_reads_new
+        if self._prop_snapshot_ttl_new != self._prop_snapshot_ttl:
+            self._entry_data['prop_snapshot_ttl'] = (
+                self._prop_snapshot_ttl_new)
+            self._need_reload = True
+        if self._mips_shared_io_new != self._mips_shared_io:
+            self._entry_data['mips_shared_io'] = self._mips_shared_io_new
+            self._need_reload = True
         if self._update_user_info:
             self._entry_data['nick_name'] = self._nick_name_new
         if self._update_devices:
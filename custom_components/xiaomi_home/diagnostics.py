@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (C) 2024 Xiaomi Corporation.
+
+The ownership and intellectual property rights of Xiaomi Home Assistant
+Integration and related Xiaomi cloud service API interface provided under this
+license, including source code and object code (collectively, "Licensed Work"),
+are owned by Xiaomi. Subject to the terms and conditions of this License, Xiaomi
+hereby grants you a personal, limited, non-exclusive, non-transferable,
+non-sublicensable, and royalty-free license to reproduce, use, modify, and
+distribute the Licensed Work only for your use of Home Assistant for
+non-commercial purposes. For the avoidance of doubt, Xiaomi does not authorize
+you to use the Licensed Work for any other purpose, including but not limited
+to use Licensed Work to develop applications (APP), Web services, and other
+forms of software.
+
+You may reproduce and distribute copies of the Licensed Work, with or without
+modifications, whether in source or object form, provided that you must give
+any other recipients of the Licensed Work a copy of this License and retain all
+copyright and disclaimers.
+
+Xiaomi provides the Licensed Work on an "AS IS" BASIS, WITHOUT WARRANTIES OR
+CONDITIONS OF ANY KIND, either express or implied, including, without
+limitation, any warranties, undertakes, or conditions of TITLE, NO ERROR OR
+OMISSION, CONTINUITY, RELIABILITY, NON-INFRINGEMENT, MERCHANTABILITY, or
+FITNESS FOR A PARTICULAR PURPOSE. In any event, you are solely responsible
+for any direct, indirect, special, incidental, or consequential damages or
+losses arising from the use or inability to use the Licensed Work.
+
+Xiaomi reserves all rights not expressly granted to you in this License.
+Except for the rights expressly granted by Xiaomi under this License, Xiaomi
+does not authorize you in any form to use the trademarks, copyrights, or other
+forms of intellectual property rights of Xiaomi and its affiliates, including,
+without limitation, without obtaining other written permission from Xiaomi, you
+shall not use "Xiaomi", "Mijia" and other words related to Xiaomi or words that
+may make the public associate with Xiaomi in any form to publicize or promote
+the software or hardware devices that use the Licensed Work.
+
+Xiaomi has the right to immediately terminate all your authorization under this
+License in the event:
+1. You assert patent invalidation, litigation, or other claims against patents
+or other intellectual property rights of Xiaomi or its affiliates; or,
+2. You make, have made, manufacture, sell, or offer to sell products that knock
+off Xiaomi or its affiliates' products.
+
+Diagnostics for Xiaomi Home.
+"""
+from __future__ import annotations
+from typing import Any
+
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .miot.miot_client import MIoTClient
+from .miot.miot_spec import MIoTSpecParser
+from .miot.const import DOMAIN
+
+
+def _redact_keys(
+    data: dict[str, Any], ids: dict[str, str], prefix: str
+) -> dict[str, Any]:
+    """Replace device dids and gateway group ids used as keys by stable
+    placeholders, async_redact_data only redacts values."""
+    return {
+        ids.setdefault(key, f'{prefix}_{len(ids)}'): value
+        for key, value in data.items()}
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, config_entry: ConfigEntry
+) -> dict[str, Any]:
+    """Return diagnostics for a config entry."""
+    miot_client: MIoTClient = hass.data[DOMAIN].get(
+        'miot_clients', {}).get(config_entry.entry_id, None)
+    if miot_client is None:
+        return {}
+    handler_stats: dict[str, dict[str, int]] = {}
+    for device in hass.data[DOMAIN].get('devices', {}).get(
+            config_entry.entry_id, []):
+        for handler, stats in device.handler_stats.items():
+            total = handler_stats.setdefault(
+                handler, {'count': 0, 'unmatched': 0, 'total_us': 0,
+                          'max_us': 0})
+            total['count'] += stats['count']
+            total['unmatched'] += stats['unmatched']
+            total['total_us'] += stats['total_us']
+            total['max_us'] = max(total['max_us'], stats['max_us'])
+    gateway_ids: dict[str, str] = {'cloud': 'cloud'}
+    return {
+        'refresh_props': miot_client.refresh_props_stats,
+        'prop_shadow': miot_client.prop_shadow_stats,
+        'route_latency': _redact_keys(
+            data=miot_client.route_latency_stats, ids={}, prefix='device'),
+        'gateway_get_prop': _redact_keys(
+            data=miot_client.gateway_get_prop_stats, ids=gateway_ids,
+            prefix='gateway'),
+        'mips_dispatch': _redact_keys(
+            data=miot_client.mips_dispatch_stats, ids=gateway_ids,
+            prefix='gateway'),
+        'lan': {
+            'read': miot_client.miot_lan.read_stats,
+            'dispatch': miot_client.miot_lan.dispatch_stats},
+        'spec_cache': MIoTSpecParser.shared_cache().stats,
+        'entity_handlers': handler_stats}
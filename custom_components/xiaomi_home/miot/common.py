@@ -47,9 +47,12 @@ Common utilities.
 """
 import asyncio
 import json
+import logging
 from os import path
 import random
-from typing import Any, Optional
+import time
+from collections import deque
+from typing import Any, Callable, Hashable, Optional
 import hashlib
 from urllib.parse import urlencode
 from urllib.request import Request, urlopen
@@ -59,6 +62,8 @@ from slugify import slugify
 
 MIOT_ROOT_PATH: str = path.dirname(path.abspath(__file__))
 
+_LOGGER = logging.getLogger(__name__)
+
 
 def gen_absolute_path(relative_path: str) -> str:
     """Generate an absolute path."""
@@ -123,6 +128,228 @@ class MIoTMatcher(MQTTMatcher):
             return None
 
 
+class MIoTDispatchIndex:
+    """Device message subscription index.
+
+    Keys are (did, kind, siid, iid) tuples, kind is 'p' for properties and
+    'e' for events. A key with siid or iid None subscribes all messages of
+    the kind of the device, like the topic '{did}/{kind}/#'. Exact keys are
+    matched with one hash lookup, wildcards with another.
+    """
+    _exact: dict[tuple, Any]
+    _wildcard: dict[tuple, Any]
+
+    def __init__(self) -> None:
+        self._exact = {}
+        self._wildcard = {}
+
+    def __len__(self) -> int:
+        return len(self._exact) + len(self._wildcard)
+
+    def __contains__(self, key: tuple) -> bool:
+        return self.get(key) is not None
+
+    def __setitem__(self, key: tuple, value: Any) -> None:
+        if key[2] is None or key[3] is None:
+            self._wildcard[key[:2]] = value
+        else:
+            self._exact[key] = value
+
+    def get(self, key: tuple) -> Optional[Any]:
+        if key[2] is None or key[3] is None:
+            return self._wildcard.get(key[:2], None)
+        return self._exact.get(key, None)
+
+    def pop(self, key: tuple) -> Optional[Any]:
+        if key[2] is None or key[3] is None:
+            return self._wildcard.pop(key[:2], None)
+        return self._exact.pop(key, None)
+
+    def items(self) -> list[tuple[tuple, Any]]:
+        return [
+            *self._exact.items(),
+            *((key + (None, None), value)
+              for key, value in self._wildcard.items())]
+
+    def match(self, did: str, kind: str, siid: Any, iid: Any) -> list[Any]:
+        """Get the values subscribed to the message."""
+        result: list[Any] = []
+        value = self._exact.get((did, kind, siid, iid), None)
+        if value is not None:
+            result.append(value)
+        if self._wildcard:
+            value = self._wildcard.get((did, kind), None)
+            if value is not None:
+                result.append(value)
+        return result
+
+
+class MIoTTimerWheel:
+    """Time-bucketed expiry for many short-lived timers.
+
+    Entries are stored in per-tick buckets, insert and cancel are O(1) and a
+    single loop timer drives all expiries. Expiry is rounded up to the next
+    tick, all methods must be called from the owner loop.
+    """
+    _loop: asyncio.AbstractEventLoop
+    _tick: float
+    _buckets: dict[int, dict[Hashable, tuple[Optional[Callable], tuple]]]
+    _index: dict[Hashable, int]
+    _current_tick: int
+    _timer: Optional[asyncio.TimerHandle]
+
+    def __init__(
+        self, loop: asyncio.AbstractEventLoop, tick: float = 0.1
+    ) -> None:
+        self._loop = loop
+        self._tick = tick
+        self._buckets = {}
+        self._index = {}
+        self._current_tick = int(loop.time() / tick)
+        self._timer = None
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._index
+
+    def add(
+        self, key: Hashable, delay: float,
+        handler: Optional[Callable[..., None]] = None, *args
+    ) -> None:
+        """Add or replace a timer, handler is optional for pure expiry."""
+        self.cancel(key)
+        tick = max(
+            -int(-(self._loop.time() + delay) // self._tick),
+            self._current_tick + 1)
+        self._buckets.setdefault(tick, {})[key] = (handler, args)
+        self._index[key] = tick
+        if self._timer is None:
+            self._timer = self._loop.call_later(self._tick, self.__on_tick)
+
+    def cancel(self, key: Hashable) -> bool:
+        tick = self._index.pop(key, None)
+        if tick is None:
+            return False
+        bucket = self._buckets[tick]
+        bucket.pop(key, None)
+        if not bucket:
+            self._buckets.pop(tick, None)
+        return True
+
+    def clear(self) -> None:
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        self._buckets.clear()
+        self._index.clear()
+
+    def __on_tick(self) -> None:
+        self._timer = None
+        now_tick = int(self._loop.time() / self._tick)
+        expired: list[tuple[Optional[Callable], tuple]] = []
+        if now_tick - self._current_tick > len(self._buckets):
+            # Long gap, walk the buckets instead of every elapsed tick
+            for tick in [t for t in self._buckets if t <= now_tick]:
+                expired.extend(self.__pop_bucket(tick))
+        else:
+            for tick in range(self._current_tick + 1, now_tick + 1):
+                expired.extend(self.__pop_bucket(tick))
+        self._current_tick = max(self._current_tick, now_tick)
+        if self._index:
+            self._timer = self._loop.call_later(self._tick, self.__on_tick)
+        for handler, args in expired:
+            if not handler:
+                continue
+            try:
+                handler(*args)
+            except Exception as err:  # pylint: disable=broad-exception-caught
+                _LOGGER.error('timer wheel handler error, %s', err)
+
+    def __pop_bucket(
+        self, tick: int
+    ) -> list[tuple[Optional[Callable], tuple]]:
+        bucket = self._buckets.pop(tick, None)
+        if not bucket:
+            return []
+        for key in bucket:
+            self._index.pop(key, None)
+        return list(bucket.values())
+
+
+class MIoTDispatcher:
+    """Batched hand-off of handler calls to the owner loop.
+
+    Producer threads queue the calls, only the first call of a batch wakes up
+    the loop, the others ride along. A drain runs the queued calls within a
+    time budget and defers the rest to the next loop iteration.
+    """
+    # Max loop time spent per drain, the rest is deferred
+    BUDGET_S: float = 0.005
+    _loop: asyncio.AbstractEventLoop
+    _name: str
+    _queue: deque[tuple[Callable[..., Any], tuple]]
+    _scheduled: bool
+    _stats: dict[str, int]
+
+    def __init__(
+        self, loop: asyncio.AbstractEventLoop, name: str = 'dispatch'
+    ) -> None:
+        self._loop = loop
+        self._name = name
+        self._queue = deque()
+        self._scheduled = False
+        self._stats = {
+            'wakeups': 0, 'callbacks': 0, 'last_batch': 0, 'max_batch': 0,
+            'max_depth': 0, 'deferred': 0}
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    @property
+    def stats(self) -> dict[str, int]:
+        """Dispatch counters, batch size and queue depth."""
+        return {**self._stats, 'depth': len(self._queue)}
+
+    def dispatch(self, handler: Callable[..., Any], *args) -> None:
+        """Queue a handler call for the owner loop, thread safe."""
+        self._queue.append((handler, args))
+        depth = len(self._queue)
+        if depth > self._stats['max_depth']:
+            self._stats['max_depth'] = depth
+        if self._scheduled:
+            return
+        self._scheduled = True
+        self._loop.call_soon_threadsafe(self.__drain)
+
+    def __drain(self) -> None:
+        # Runs in the owner loop
+        self._scheduled = False
+        queue = self._queue
+        deadline = time.monotonic() + self.BUDGET_S
+        count: int = 0
+        while queue:
+            handler, args = queue.popleft()
+            count += 1
+            try:
+                handler(*args)
+            except Exception as err:  # pylint: disable=broad-exception-caught
+                _LOGGER.error('%s handler error, %s', self._name, err)
+            if queue and time.monotonic() > deadline:
+                # Out of budget, yield to other loop callbacks
+                self._stats['deferred'] += 1
+                self._scheduled = True
+                self._loop.call_soon(self.__drain)
+                break
+        stats = self._stats
+        stats['wakeups'] += 1
+        stats['callbacks'] += count
+        stats['last_batch'] = count
+        if count > stats['max_batch']:
+            stats['max_batch'] = count
+
+
 class MIoTHttp:
     """MIoT Common HTTP API."""
     @staticmethod
@@ -64,6 +64,8 @@ DEFAULT_CLOUD_BROKER_HOST: str = 'ha.mqtt.io.mi.com'
 
 # seconds, 14 days
 SPEC_STD_LIB_EFFECTIVE_TIME = 3600*24*14
+# seconds, 7 days
+SPEC_MULTI_LANG_EFFECTIVE_TIME = 3600*24*7
 # seconds, 14 days
 MANUFACTURER_EFFECTIVE_TIME = 3600*24*14
 
@@ -130,6 +132,11 @@ MAX_COVER_DEAD_ZONE_WIDTH: int = 5
 
 DEFAULT_CTRL_MODE: str = 'auto'
 
+# Restored property values younger than this are not refreshed at startup
+DEFAULT_PROP_SNAPSHOT_TTL: int = 600
+MIN_PROP_SNAPSHOT_TTL: int = 0
+MAX_PROP_SNAPSHOT_TTL: int = 3600*24
+
 # Registered in Xiaomi OAuth 2.0 Service
 # DO NOT CHANGE UNLESS YOU HAVE AN ADMINISTRATOR PERMISSION
 OAUTH_REDIRECT_URL: str = 'http://homeassistant.local:8123'
@@ -59,10 +59,11 @@ from homeassistant.core import HomeAssistant
 from homeassistant.components import zeroconf
 
 # pylint: disable=relative-beyond-top-level
-from .common import MIoTMatcher, slugify_did
+from .common import MIoTDispatchIndex, slugify_did
 from .const import (
     DEFAULT_CTRL_MODE, DEFAULT_INTEGRATION_LANGUAGE, DEFAULT_NICK_NAME, DOMAIN,
-    MIHOME_CERT_EXPIRE_MARGIN, NETWORK_REFRESH_INTERVAL,
+    DEFAULT_PROP_SNAPSHOT_TTL, MIHOME_CERT_EXPIRE_MARGIN,
+    NETWORK_REFRESH_INTERVAL,
     OAUTH2_CLIENT_ID, SUPPORT_CENTRAL_GATEWAY_CTRL,
     DEFAULT_COVER_DEAD_ZONE_WIDTH)
 from .miot_cloud import MIoTHttpClient, MIoTOauthClient
@@ -72,6 +73,10 @@ from .miot_mips import (
     MipsLocalClient)
 from .miot_lan import MIoTLan
 from .miot_network import MIoTNetwork
+from .miot_prop import (
+    MIoTPropRefresher, MIoTPropShadow, MIoTPropShadowTable, MIoTPropWriter,
+    MIoTRefreshPriority)
+from .miot_route import MIoTRouter
 from .miot_storage import MIoTCert, MIoTStorage
 from .miot_mdns import MipsService, MipsServiceState
 from .miot_i18n import MIoTI18n
@@ -79,11 +84,12 @@ from .miot_i18n import MIoTI18n
 _LOGGER = logging.getLogger(__name__)
 
 
-REFRESH_PROPS_DELAY = 0.2
-REFRESH_PROPS_RETRY_DELAY = 3
 REFRESH_CLOUD_DEVICES_DELAY = 6
 REFRESH_CLOUD_DEVICES_RETRY_DELAY = 60
 REFRESH_GATEWAY_DEVICES_DELAY = 3
+# Property snapshot save interval
+PROP_SNAPSHOT_SAVE_INTERVAL = 300
+
 
 @dataclass
 class MIoTClientSub:
@@ -158,7 +164,7 @@ class MIoTClient:
     _device_list_update_ts: int
 
     _sub_source_list: dict[str, Optional[str]]
-    _sub_tree: MIoTMatcher
+    _sub_index: MIoTDispatchIndex
     _sub_device_state: dict[str, MipsDeviceState]
 
     _mips_local_state_changed_timers: dict[str, asyncio.TimerHandle]
@@ -166,9 +172,16 @@ class MIoTClient:
     _refresh_cert_timer: Optional[asyncio.TimerHandle]
     _refresh_cloud_devices_timer: Optional[asyncio.TimerHandle]
     # Refresh prop
-    _refresh_props_list: dict[str, dict]
-    _refresh_props_timer: Optional[asyncio.TimerHandle]
-    _refresh_props_retry_count: int
+    _prop_refresher: MIoTPropRefresher
+    # Set prop coalescing
+    _prop_writer: MIoTPropWriter
+    # Property shadow and its snapshot
+    _prop_shadow: MIoTPropShadowTable
+    _prop_snapshot_timer: Optional[asyncio.TimerHandle]
+    # Route latency and order of the devices, 'gw', 'lan' or 'cloud'
+    _router: MIoTRouter
+    # Run all MIPS connections on one shared I/O thread
+    _mips_shared_io: bool
 
     # Persistence notify handler, params: notify_id, title, message
     _persistence_notify: Callable[[str, Optional[str], Optional[str]], None]
@@ -228,7 +241,7 @@ class MIoTClient:
         self._device_list_lan = {}
         self._device_list_update_ts = 0
         self._sub_source_list = {}
-        self._sub_tree = MIoTMatcher()
+        self._sub_index = MIoTDispatchIndex()
         self._sub_device_state = {}
 
         self._mips_local_state_changed_timers = {}
@@ -237,9 +250,28 @@ class MIoTClient:
         self._refresh_cloud_devices_timer = None
 
         # Refresh prop
-        self._refresh_props_list = {}
-        self._refresh_props_timer = None
-        self._refresh_props_retry_count = 0
+        self._prop_refresher = MIoTPropRefresher(
+            loop=self._main_loop, get_route=self.__get_refresh_route,
+            get_local=lambda route: (
+                self._miot_lan if route == 'lan'
+                else self._mips_local[route]),
+            get_cloud_props=lambda params: self._http.get_props_async(
+                params=params),
+            on_prop=lambda params, route: self.__on_prop_msg(
+                params=params, ctx=route),
+            get_model=lambda did: self._device_list_cache.get(
+                did, {}).get('model', ''))
+        self._prop_writer = MIoTPropWriter(
+            loop=self._main_loop, write=self.__write_prop_async)
+        self._prop_shadow = MIoTPropShadowTable(
+            storage=self._storage, name=f'{self._uid}_{self._cloud_server}',
+            snapshot_ttl=entry_data.get(
+                'prop_snapshot_ttl', DEFAULT_PROP_SNAPSHOT_TTL))
+        self._prop_snapshot_timer = None
+        self._router = MIoTRouter(
+            loop=self._main_loop,
+            hedged_reads=entry_data.get('hedged_reads', False))
+        self._mips_shared_io = entry_data.get('mips_shared_io', False)
 
         self._persistence_notify = None
         self._show_devices_changed_notify_timer = None
@@ -279,6 +311,11 @@ class MIoTClient:
         await self._i18n.init_async()
         # Load cache device list
         await self.__load_cache_device_async()
+        # Last known property values
+        await self._prop_shadow.load_async(dids=self._device_list_cache)
+        self._prop_snapshot_timer = self._main_loop.call_later(
+            PROP_SNAPSHOT_SAVE_INTERVAL, lambda: self._main_loop.create_task(
+                self.__save_prop_snapshot_handler()))
         # MIoT oauth client instance
         self._oauth = MIoTOauthClient(
             client_id=OAUTH2_CLIENT_ID,
@@ -303,7 +340,8 @@ class MIoTClient:
             cloud_server=self._cloud_server,
             app_id=OAUTH2_CLIENT_ID,
             token=self._user_config['auth_info']['access_token'],
-            loop=self._main_loop)
+            loop=self._main_loop,
+            shared_io=self._mips_shared_io)
         self._mips_cloud.enable_logger(logger=_LOGGER)
         self._mips_cloud.sub_mips_state(
             key=f'{self._uid}-{self._cloud_server}',
@@ -343,7 +381,8 @@ class MIoTClient:
                         key_file=self._cert.key_file,
                         port=service_data['port'],
                         home_name=info['home_name'],
-                        loop=self._main_loop)
+                        loop=self._main_loop,
+                        shared_io=self._mips_shared_io)
                     self._mips_local[info['group_id']] = mips
                     mips.enable_logger(logger=_LOGGER)
                     mips.on_dev_list_changed = self.__on_gw_device_list_changed
@@ -376,11 +415,14 @@ class MIoTClient:
         self._network.unsub_network_status(
             key=f'{self._uid}-{self._cloud_server}')
         # Cancel refresh props
-        if self._refresh_props_timer:
-            self._refresh_props_timer.cancel()
-            self._refresh_props_timer = None
-        self._refresh_props_list.clear()
-        self._refresh_props_retry_count = 0
+        self._prop_refresher.deinit()
+        self._router.deinit()
+        self._prop_writer.deinit()
+        # Save the property snapshot
+        if self._prop_snapshot_timer:
+            self._prop_snapshot_timer.cancel()
+            self._prop_snapshot_timer = None
+        await self._prop_shadow.save_async()
         # Cloud mips
         self._mips_cloud.unsub_mips_state(
             key=f'{self._uid}-{self._cloud_server}')
@@ -524,6 +566,46 @@ class MIoTClient:
     def device_list(self) -> dict:
         return self._device_list_cache
 
+    @property
+    def refresh_props_stats(self) -> dict[str, Any]:
+        """Property refresh queue length and wait time stats."""
+        return self._prop_refresher.stats
+
+    @property
+    def prop_shadow_stats(self) -> dict[str, int]:
+        """Property shadow size and unchanged reports dropped."""
+        return self._prop_shadow.stats
+
+    @property
+    def route_latency_stats(self) -> dict[str, dict[str, dict]]:
+        """Round-trip time of each device route, {did: {route: stats}}."""
+        return self._router.stats
+
+    @property
+    def gateway_get_prop_stats(self) -> dict[str, dict[str, Any]]:
+        """Get prop request queue of each central hub gateway."""
+        return {
+            group_id: mips.get_prop_stats
+            for group_id, mips in self._mips_local.items()}
+
+    @property
+    def mips_dispatch_stats(self) -> dict[str, dict[str, int]]:
+        """Main loop dispatch of the cloud and gateway MIPS clients."""
+        stats: dict[str, dict[str, int]] = {
+            group_id: mips.dispatch_stats
+            for group_id, mips in self._mips_local.items()}
+        if self._mips_cloud:
+            stats['cloud'] = self._mips_cloud.dispatch_stats
+        return stats
+
+    @property
+    def hedged_reads(self) -> bool:
+        return self._router.hedged_reads
+
+    @hedged_reads.setter
+    def hedged_reads(self, value: bool) -> None:
+        self._router.hedged_reads = value
+
     @property
     def persistent_notify(self) -> Callable:
         return self._persistence_notify
@@ -638,52 +720,69 @@ class MIoTClient:
     async def set_prop_async(
         self, did: str, siid: int, piid: int, value: Any
     ) -> bool:
+        """Write a property without coalescing, return the result."""
+        result = await self.__set_prop_async(
+            did=did, siid=siid, piid=piid, value=value)
+        if result:
+            self._prop_shadow.set(did=did, siid=siid, piid=piid, value=value)
+        return result
+
+    def request_set_prop(
+        self, did: str, siid: int, piid: int, value: Any
+    ) -> asyncio.Future:
+        """Write a property with last-write-wins coalescing.
+        While a write of the same property is in flight, a new value replaces
+        the pending one. The returned future resolves to the value that was
+        actually sent, or raises MIoTClientError."""
         if did not in self._device_list_cache:
             raise MIoTClientError(f'did not exist, {did}')
-        # Priority local control
-        if self._ctrl_mode == CtrlMode.AUTO:
-            # Gateway control
-            device_gw = self._device_list_gateway.get(did, None)
-            if (
-                device_gw and device_gw.get('online', False)
-                and device_gw.get('specv2_access', False)
-                and 'group_id' in device_gw
-            ):
-                mips = self._mips_local.get(device_gw['group_id'], None)
-                if mips is None:
-                    _LOGGER.error(
-                        'no gateway route, %s, try control through cloud',
-                        device_gw)
-                else:
-                    result = await mips.set_prop_async(
-                        did=did, siid=siid, piid=piid, value=value)
-                    _LOGGER.debug(
-                        'gateway set prop, %s.%d.%d, %s -> %s',
-                        did, siid, piid, value, result)
-                    rc = (result or {}).get(
-                        'code', MIoTErrorCode.CODE_MIPS_INVALID_RESULT.value)
-                    if rc in [0, 1]:
-                        return True
-                    raise MIoTClientError(
-                        self.__get_exec_error_with_rc(rc=rc))
-            # Lan control
-            device_lan = self._device_list_lan.get(did, None)
-            if device_lan and device_lan.get('online', False):
-                result = await self._miot_lan.set_prop_async(
-                    did=did, siid=siid, piid=piid, value=value)
-                _LOGGER.debug(
-                    'lan set prop, %s.%d.%d, %s -> %s',
-                    did, siid, piid, value, result)
-                rc = (result or {}).get(
-                    'code', MIoTErrorCode.CODE_MIPS_INVALID_RESULT.value)
-                if rc in [0, 1]:
-                    return True
-                raise MIoTClientError(
-                    self.__get_exec_error_with_rc(rc=rc))
+        return self._prop_writer.request(
+            did=did, siid=siid, piid=piid, value=value)
 
-        # Cloud control
-        device_cloud = self._device_list_cloud.get(did, None)
-        if device_cloud and device_cloud.get('online', False):
+    async def __write_prop_async(
+        self, did: str, siid: int, piid: int, value: Any
+    ) -> None:
+        if not await self.__set_prop_async(
+                did=did, siid=siid, piid=piid, value=value):
+            raise MIoTClientError(
+                f'{self._i18n.translate("miot.client.device_exec_error")}, '
+                f'{self._i18n.translate("error.common.-10007")}')
+        self._prop_shadow.set(did=did, siid=siid, piid=piid, value=value)
+
+    async def __set_prop_async(
+        self, did: str, siid: int, piid: int, value: Any
+    ) -> bool:
+        if did not in self._device_list_cache:
+            raise MIoTClientError(f'did not exist, {did}')
+        # Priority local control, unhealthy routes last. Fall back to the
+        # next route only if the request was certainly not sent.
+        route, rc = await self._router.write_async(
+            did=did, routes=self.__get_ctrl_routes(did=did),
+            write=lambda route: self.__set_prop_on_route_async(
+                route=route, did=did, siid=siid, piid=piid, value=value))
+        if route and rc in [0, 1]:
+            return True
+        if route == 'cloud' and rc in [-704010000, -704042011]:
+            # Device remove or offline
+            _LOGGER.error('device may be removed or offline, %s', did)
+            self._main_loop.create_task(
+                await self.__refresh_cloud_device_with_dids_async(
+                    dids=[did]))
+        if rc is not None:
+            raise MIoTClientError(
+                self.__get_exec_error_with_rc(rc=rc))
+
+        # Show error message
+        raise MIoTClientError(
+            f'{self._i18n.translate("miot.client.device_exec_error")}, '
+            f'{self._i18n.translate("error.common.-10007")}')
+
+    async def __set_prop_on_route_async(
+        self, route: str, did: str, siid: int, piid: int, value: Any
+    ) -> Optional[int]:
+        """Set a prop through one route, return the result code or None if
+        the route is not available and nothing was sent."""
+        if route == 'cloud':
             result = await self._http.set_prop_async(
                 params=[
                     {'did': did, 'siid': siid, 'piid': piid, 'value': value}
@@ -692,26 +791,38 @@ class MIoTClient:
                 'cloud set prop, %s.%d.%d, %s -> %s',
                 did, siid, piid, value, result)
             if result and len(result) == 1:
-                rc = result[0].get(
+                return result[0].get(
                     'code', MIoTErrorCode.CODE_MIPS_INVALID_RESULT.value)
-                if rc in [0, 1]:
-                    return True
-                if rc in [-704010000, -704042011]:
-                    # Device remove or offline
-                    _LOGGER.error('device may be removed or offline, %s', did)
-                    self._main_loop.create_task(
-                        await self.__refresh_cloud_device_with_dids_async(
-                            dids=[did]))
-                raise MIoTClientError(
-                    self.__get_exec_error_with_rc(rc=rc))
-
-        # Show error message
-        raise MIoTClientError(
-            f'{self._i18n.translate("miot.client.device_exec_error")}, '
-            f'{self._i18n.translate("error.common.-10007")}')
+            return MIoTErrorCode.CODE_MIPS_INVALID_RESULT.value
+        if route == 'lan':
+            result = await self._miot_lan.set_prop_async(
+                did=did, siid=siid, piid=piid, value=value)
+        else:
+            mips = self.__get_device_mips(did=did)
+            if mips is None:
+                return None
+            result = await mips.set_prop_async(
+                did=did, siid=siid, piid=piid, value=value)
+        _LOGGER.debug(
+            '%s set prop, %s.%d.%d, %s -> %s',
+            route, did, siid, piid, value, result)
+        return (result or {}).get(
+            'code', MIoTErrorCode.CODE_MIPS_INVALID_RESULT.value)
 
     async def set_props_async(
         self, props_list: List[Dict[str, Any]],
+    ) -> bool:
+        result = await self.__set_props_async(props_list=props_list)
+        if not result:
+            return result
+        for prop in props_list:
+            self._prop_shadow.set(
+                did=prop['did'], siid=prop['siid'], piid=prop['piid'],
+                value=prop['value'])
+        return result
+
+    async def __set_props_async(
+        self, props_list: List[Dict[str, Any]],
     ) -> bool:
         # props_list = [{'did': str, 'siid': int, 'piid': int, 'value': Any}......]
         # 判断是不是只有一个did
@@ -788,21 +899,24 @@ class MIoTClient:
             f'{self._i18n.translate("miot.client.device_exec_error")}, '
             f'{self._i18n.translate("error.common.-10007")}')
 
-    def request_refresh_prop(
+    def get_prop_shadow(
         self, did: str, siid: int, piid: int
+    ) -> Optional[MIoTPropShadow]:
+        """Return the last known value of a property, without a network
+        read."""
+        return self._prop_shadow.get(did=did, siid=siid, piid=piid)
+
+    def request_refresh_prop(
+        self, did: str, siid: int, piid: int,
+        priority: MIoTRefreshPriority = MIoTRefreshPriority.NORMAL
     ) -> None:
         if did not in self._device_list_cache:
             raise MIoTClientError(f'did not exist, {did}')
-        key: str = f'{did}|{siid}|{piid}'
-        if key in self._refresh_props_list:
-            return
-        self._refresh_props_list[key] = {
-            'did': did, 'siid': siid, 'piid': piid}
-        if self._refresh_props_timer:
+        if self._prop_shadow.fresh_restored(did=did, siid=siid, piid=piid):
+            # Restored at startup and recent enough
             return
-        self._refresh_props_timer = self._main_loop.call_later(
-            REFRESH_PROPS_DELAY, lambda: self._main_loop.create_task(
-                self.__refresh_props_handler()))
+        self._prop_refresher.request(
+            did=did, siid=siid, piid=piid, priority=priority)
 
     async def get_prop_async(self, did: str, siid: int, piid: int) -> Any:
         if did not in self._device_list_cache:
@@ -810,40 +924,65 @@ class MIoTClient:
 
         # NOTICE: Since there are too many request attributes and obtaining
         # them directly from the hub or device will cause device abnormalities,
-        # so obtaining the cache from the cloud is the priority here.
-        try:
-            if self._network.network_status:
-                result = await self._http.get_prop_async(
-                    did=did, siid=siid, piid=piid)
-                if result:
-                    return result
-        except Exception as err:  # pylint: disable=broad-exception-caught
-            # Catch all exceptions
-            _LOGGER.error(
-                'client get prop from cloud error, %s, %s',
-                err, traceback.format_exc())
+        # so obtaining the cache from the cloud is the priority here, a local
+        # route is only preferred once both are measured and it is faster.
+        return await self._router.read_async(
+            did=did, routes=self.__get_read_routes(did=did),
+            read=lambda route: self.__get_prop_on_route_async(
+                route=route, did=did, siid=siid, piid=piid))
+
+    async def __get_prop_on_route_async(
+        self, route: str, did: str, siid: int, piid: int
+    ) -> Any:
+        if route == 'cloud':
+            return await self._http.get_prop_async(
+                did=did, siid=siid, piid=piid)
+        if route == 'lan':
+            return await self._miot_lan.get_prop_async(
+                did=did, siid=siid, piid=piid)
+        mips = self.__get_device_mips(did=did)
+        if mips is None:
+            return None
+        return await mips.get_prop_safe_async(did=did, siid=siid, piid=piid)
+
+    def __get_device_mips(self, did: str) -> Optional[MipsLocalClient]:
+        """Return the central hub gateway of a device, if it is online."""
+        device_gw = self._device_list_gateway.get(did, None)
+        if not (
+            device_gw and device_gw.get('online', False)
+            and device_gw.get('specv2_access', False)
+            and 'group_id' in device_gw
+        ):
+            return None
+        mips = self._mips_local.get(device_gw['group_id'], None)
+        if mips is None:
+            _LOGGER.error('no gw route, %s', device_gw)
+        return mips
+
+    def __get_ctrl_routes(self, did: str) -> list[str]:
+        """Return the control routes of a device, gateway, lan, cloud."""
+        routes: list[str] = []
         if self._ctrl_mode == CtrlMode.AUTO:
-            # Central hub gateway
-            device_gw = self._device_list_gateway.get(did, None)
-            if (
-                device_gw and device_gw.get('online', False)
-                and device_gw.get('specv2_access', False)
-                and 'group_id' in device_gw
-            ):
-                mips = self._mips_local.get(device_gw['group_id'], None)
-                if mips is None:
-                    _LOGGER.error('no gw route, %s', device_gw)
-                else:
-                    return await mips.get_prop_async(
-                        did=did, siid=siid, piid=piid)
-            # Lan
+            if self.__get_device_mips(did=did):
+                routes.append('gw')
             device_lan = self._device_list_lan.get(did, None)
             if device_lan and device_lan.get('online', False):
-                return await self._miot_lan.get_prop_async(
-                    did=did, siid=siid, piid=piid)
-        # _LOGGER.error(
-        #     'client get prop failed, no-link, %s.%d.%d', did, siid, piid)
-        return None
+                routes.append('lan')
+        device_cloud = self._device_list_cloud.get(did, None)
+        if device_cloud and device_cloud.get('online', False):
+            routes.append('cloud')
+        return routes
+
+    def __get_read_routes(self, did: str) -> list[str]:
+        """Return the read routes of a device, cloud, gateway, lan."""
+        routes: list[str] = []
+        if self._network.network_status:
+            routes.append('cloud')
+        if self._ctrl_mode == CtrlMode.AUTO:
+            routes.extend(
+                route for route in self.__get_ctrl_routes(did=did)
+                if route != 'cloud')
+        return routes
 
     async def action_async(
         self, did: str, siid: int, aiid: int, in_list: list
@@ -919,7 +1058,7 @@ class MIoTClient:
         topic = (
             f'{did}/p/'
             f'{"#" if siid is None or piid is None else f"{siid}/{piid}"}')
-        self._sub_tree[topic] = MIoTClientSub(
+        self._sub_index[(did, 'p', siid, piid)] = MIoTClientSub(
             topic=topic, handler=handler, handler_ctx=handler_ctx)
         _LOGGER.debug('client sub prop, %s', topic)
         return True
@@ -927,12 +1066,8 @@ class MIoTClient:
     def unsub_prop(
         self, did: str, siid: Optional[int] = None, piid: Optional[int] = None
     ) -> bool:
-        topic = (
-            f'{did}/p/'
-            f'{"#" if siid is None or piid is None else f"{siid}/{piid}"}')
-        if self._sub_tree.get(topic=topic):
-            del self._sub_tree[topic]
-        _LOGGER.debug('client unsub prop, %s', topic)
+        self._sub_index.pop((did, 'p', siid, piid))
+        _LOGGER.debug('client unsub prop, %s, %s, %s', did, siid, piid)
         return True
 
     def sub_event(
@@ -945,7 +1080,7 @@ class MIoTClient:
         topic = (
             f'{did}/e/'
             f'{"#" if siid is None or eiid is None else f"{siid}/{eiid}"}')
-        self._sub_tree[topic] = MIoTClientSub(
+        self._sub_index[(did, 'e', siid, eiid)] = MIoTClientSub(
             topic=topic, handler=handler, handler_ctx=handler_ctx)
         _LOGGER.debug('client sub event, %s', topic)
         return True
@@ -953,12 +1088,8 @@ class MIoTClient:
     def unsub_event(
         self, did: str, siid: Optional[int] = None, eiid: Optional[int] = None
     ) -> bool:
-        topic = (
-            f'{did}/e/'
-            f'{"#" if siid is None or eiid is None else f"{siid}/{eiid}"}')
-        if self._sub_tree.get(topic=topic):
-            del self._sub_tree[topic]
-        _LOGGER.debug('client unsub event, %s', topic)
+        self._sub_index.pop((did, 'e', siid, eiid))
+        _LOGGER.debug('client unsub event, %s, %s, %s', did, siid, eiid)
         return True
 
     def sub_device_state(
@@ -985,6 +1116,8 @@ class MIoTClient:
         # Unsub
         if sub_from:
             self.__unsub_from(sub_from, did)
+        self._prop_shadow.remove_device(did=did)
+        self._router.remove_device(did=did)
         # Storage
         await self._storage.save_async(
             domain='miot_devices',
@@ -1062,7 +1195,8 @@ class MIoTClient:
         elif sub_from in self._mips_local:
             mips = self._mips_local[sub_from]
         if mips is not None:
-            mips.sub_prop(did=did, handler=self.__on_prop_msg)
+            mips.sub_prop(
+                did=did, handler=self.__on_prop_msg, handler_ctx=sub_from)
             mips.sub_event(did=did, handler=self.__on_event_msg)
 
     @final
@@ -1157,7 +1291,8 @@ class MIoTClient:
             key_file=self._cert.key_file,
             port=data['port'],
             home_name=home_name,
-            loop=self._main_loop)
+            loop=self._main_loop,
+            shared_io=self._mips_shared_io)
         self._mips_local[group_id] = mips
         mips.enable_logger(logger=_LOGGER)
         mips.on_dev_list_changed = self.__on_gw_device_list_changed
@@ -1394,12 +1529,16 @@ class MIoTClient:
 
     @final
     def __on_prop_msg(self, params: dict, ctx: Any) -> None:
-        """params MUST contain did, siid, piid, value"""
+        """params MUST contain did, siid, piid, value, ctx is the source"""
         # BLE device has no online/offline msg
         try:
-            subs: list[MIoTClientSub] = list(self._sub_tree.iter_match(
-                f'{params["did"]}/p/{params["siid"]}/{params["piid"]}'))
-            for sub in subs:
+            if not self._prop_shadow.update(
+                    did=params['did'], siid=params['siid'],
+                    piid=params['piid'], value=params['value'], source=ctx):
+                # Duplicate report or unchanged refresh
+                return
+            for sub in self._sub_index.match(
+                    params['did'], 'p', params['siid'], params['piid']):
                 sub.handler(params, sub.handler_ctx)
         except Exception as err:  # pylint: disable=broad-exception-caught
             _LOGGER.error('on prop msg error, %s, %s', params, err)
@@ -1407,9 +1546,8 @@ class MIoTClient:
     @final
     def __on_event_msg(self, params: dict, ctx: Any) -> None:
         try:
-            subs: list[MIoTClientSub] = list(self._sub_tree.iter_match(
-                f'{params["did"]}/e/{params["siid"]}/{params["eiid"]}'))
-            for sub in subs:
+            for sub in self._sub_index.match(
+                    params['did'], 'e', params['siid'], params['eiid']):
                 sub.handler(params, sub.handler_ctx)
         except Exception as err:  # pylint: disable=broad-exception-caught
             _LOGGER.error('on event msg error, %s, %s', params, err)
@@ -1458,6 +1596,14 @@ class MIoTClient:
                 'push_available': False}
             for did, info in self._device_list_cache.items()}
 
+    @final
+    async def __save_prop_snapshot_handler(self) -> None:
+        self._prop_snapshot_timer = None
+        await self._prop_shadow.save_async()
+        self._prop_snapshot_timer = self._main_loop.call_later(
+            PROP_SNAPSHOT_SAVE_INTERVAL, lambda: self._main_loop.create_task(
+                self.__save_prop_snapshot_handler()))
+
     @final
     async def __update_devices_from_cloud_async(
         self, cloud_list: dict[str, dict],
@@ -1725,177 +1871,29 @@ class MIoTClient:
                     self.__refresh_gw_devices_with_group_id_async(
                         group_id=group_id))))
 
-    @final
-    async def __refresh_props_from_cloud(self, patch_len: int = 150) -> bool:
-        if not self._network.network_status:
-            return False
-
-        request_list = None
-        if len(self._refresh_props_list) < patch_len:
-            request_list = self._refresh_props_list
-            self._refresh_props_list = {}
-        else:
-            request_list = {}
-            for _ in range(patch_len):
-                key, value = self._refresh_props_list.popitem()
-                request_list[key] = value
-        try:
-            results = await self._http.get_props_async(
-                params=list(request_list.values()))
-            if not results:
-                raise MIoTClientError('get_props_async failed')
-            for result in results:
-                if (
-                    'did' not in result
-                    or 'siid' not in result
-                    or 'piid' not in result
-                    or 'value' not in result
-                ):
-                    continue
-                request_list.pop(
-                    f'{result["did"]}|{result["siid"]}|{result["piid"]}',
-                    None)
-                self.__on_prop_msg(params=result, ctx=None)
-            if request_list:
-                _LOGGER.info(
-                    'refresh props failed, cloud, %s',
-                    list(request_list.keys()))
-                request_list = None
-            return True
-        except Exception as err:  # pylint:disable=broad-exception-caught
-            _LOGGER.error(
-                'refresh props error, cloud, %s, %s',
-                err, traceback.format_exc())
-            # Add failed request back to the list
-            self._refresh_props_list.update(request_list)
-            return False
-
-    @final
-    async def __refresh_props_from_gw(self) -> bool:
-        if not self._mips_local or not self._device_list_gateway:
-            return False
-        request_list = {}
-        succeed_once = False
-        for key in list(self._refresh_props_list.keys()):
-            did = key.split('|')[0]
-            if did in request_list:
-                # NOTICE: A device only requests once a cycle, continuous
-                # acquisition of properties can cause device exceptions.
-                continue
-            params = self._refresh_props_list.pop(key)
-            device_gw = self._device_list_gateway.get(did, None)
-            if not device_gw:
-                # Device not exist
-                continue
-            mips_gw = self._mips_local.get(device_gw['group_id'], None)
-            if not mips_gw:
-                _LOGGER.error('mips gateway not exist, %s', key)
-                continue
-            request_list[did] = {
-                **params,
-                'fut': mips_gw.get_prop_async(
-                    did=did, siid=params['siid'], piid=params['piid'],
-                    timeout_ms=6000)}
-        results = await asyncio.gather(
-            *[v['fut'] for v in request_list.values()])
-        for (did, param), result in zip(request_list.items(), results):
-            if result is None:
-                # Don't use "not result", it will be skipped when result
-                # is 0, false
-                continue
-            self.__on_prop_msg(
-                params={
-                    'did': did,
-                    'siid': param['siid'],
-                    'piid': param['piid'],
-                    'value': result},
-                ctx=None)
-            succeed_once = True
-        if succeed_once:
-            return True
-        _LOGGER.info(
-            'refresh props failed, gw, %s', list(request_list.keys()))
-        # Add failed request back to the list
-        self._refresh_props_list.update(request_list)
-        return False
-
-    @final
-    async def __refresh_props_from_lan(self) -> bool:
-        if not self._miot_lan.init_done or len(self._mips_local) > 0:
-            return False
-        request_list = {}
-        succeed_once = False
-        for key in list(self._refresh_props_list.keys()):
-            did = key.split('|')[0]
-            if did in request_list:
-                # NOTICE: A device only requests once a cycle, continuous
-                # acquisition of properties can cause device exceptions.
-                continue
-            params = self._refresh_props_list.pop(key)
-            if did not in self._device_list_lan:
-                continue
-            request_list[did] = {
-                **params,
-                'fut': self._miot_lan.get_prop_async(
-                    did=did, siid=params['siid'], piid=params['piid'],
-                    timeout_ms=6000)}
-        results = await asyncio.gather(
-            *[v['fut'] for v in request_list.values()])
-        for (did, param), result in zip(request_list.items(), results):
-            if result is None:
-                # Don't use "not result", it will be skipped when result
-                # is 0, false
-                continue
-            self.__on_prop_msg(
-                params={
-                    'did': did,
-                    'siid': param['siid'],
-                    'piid': param['piid'],
-                    'value': result},
-                ctx=None)
-            succeed_once = True
-        if succeed_once:
-            return True
-        _LOGGER.info(
-            'refresh props failed, lan, %s', list(request_list.keys()))
-        # Add failed request back to the list
-        self._refresh_props_list.update(request_list)
-        return False
-
-    @final
-    async def __refresh_props_handler(self) -> None:
-        if not self._refresh_props_list:
-            return
-        # Cloud, Central hub gateway, Lan control
+    def __get_refresh_route(self, did: str, retry: bool) -> Optional[str]:
+        """Return the gateway group_id, 'lan', 'cloud' or None."""
+        source: Optional[str] = self._sub_source_list.get(did, None)
         if (
-            await self.__refresh_props_from_cloud()
-            or await self.__refresh_props_from_gw()
-            or await self.__refresh_props_from_lan()
+            retry
+            and self._network.network_status
+            and did in self._device_list_cloud
         ):
-            self._refresh_props_retry_count = 0
-            if self._refresh_props_list:
-                self._refresh_props_timer = self._main_loop.call_later(
-                    REFRESH_PROPS_DELAY, lambda: self._main_loop.create_task(
-                        self.__refresh_props_handler()))
-            else:
-                self._refresh_props_timer = None
-            return
-
-        # Try three times, and if it fails three times, empty the list.
-        if self._refresh_props_retry_count >= 3:
-            self._refresh_props_list = {}
-            self._refresh_props_retry_count = 0
-            if self._refresh_props_timer:
-                self._refresh_props_timer.cancel()
-                self._refresh_props_timer = None
-            _LOGGER.info('refresh props failed, retry count exceed')
-            return
-        self._refresh_props_retry_count += 1
-        _LOGGER.info(
-            'refresh props failed, retry, %s', self._refresh_props_retry_count)
-        self._refresh_props_timer = self._main_loop.call_later(
-            REFRESH_PROPS_RETRY_DELAY, lambda: self._main_loop.create_task(
-                self.__refresh_props_handler()))
+            # The local route failed, fall back to cloud
+            return 'cloud'
+        if source in self._mips_local:
+            return source
+        if source == 'lan' and self._miot_lan.init_done:
+            return 'lan'
+        if self._network.network_status:
+            return 'cloud'
+        # Cloud unavailable, try any local route
+        group_id = self._device_list_gateway.get(did, {}).get('group_id', None)
+        if group_id in self._mips_local:
+            return group_id
+        if did in self._device_list_lan and self._miot_lan.init_done:
+            return 'lan'
+        return None
 
     @final
     def __show_client_error_notify(
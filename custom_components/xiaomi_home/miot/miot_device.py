@@ -47,10 +47,12 @@ MIoT device instance.
 """
 import asyncio
 from abc import abstractmethod
+import time
 from typing import Any, Callable, Optional, Dict, List
 import logging
 
 from homeassistant.helpers.entity import Entity
+from homeassistant.util import dt as dt_util
 from homeassistant.const import (
     CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,
     CONCENTRATION_MILLIGRAMS_PER_CUBIC_METER,
@@ -92,7 +94,8 @@ from .specs.specv2entity import (
 )
 from .common import slugify_name, slugify_did
 from .const import DOMAIN
-from .miot_client import MIoTClient
+from .miot_client import MIoTClient, MIoTRefreshPriority
+from .miot_entity import MIoTEntityData, MIoTEntityPlan
 from .miot_error import MIoTClientError, MIoTDeviceError
 from .miot_mips import MIoTDeviceState
 from .miot_spec import (
@@ -108,25 +111,13 @@ from .miot_spec import (
 _LOGGER = logging.getLogger(__name__)
 
 
-class MIoTEntityData:
-    """MIoT Entity Data."""
-    platform: str
-    device_class: Any
-    spec: MIoTSpecInstance | MIoTSpecService
-
-    props: set[MIoTSpecProperty]
-    events: set[MIoTSpecEvent]
-    actions: set[MIoTSpecAction]
-
-    def __init__(
-        self, platform: str, spec: MIoTSpecInstance | MIoTSpecService
-    ) -> None:
-        self.platform = platform
-        self.spec = spec
-        self.device_class = None
-        self.props = set()
-        self.events = set()
-        self.actions = set()
+def _get_refresh_priority(entity: Entity) -> MIoTRefreshPriority:
+    """Refresh the properties of the entities shown to the user first."""
+    if entity.registry_entry and entity.registry_entry.hidden_by:
+        return MIoTRefreshPriority.LOW
+    if entity.entity_category:
+        return MIoTRefreshPriority.NORMAL
+    return MIoTRefreshPriority.HIGH
 
 
 class MIoTDevice:
@@ -162,6 +153,10 @@ class MIoTDevice:
     _event_list: dict[str, list[MIoTSpecEvent]]
     _action_list: dict[str, list[MIoTSpecAction]]
 
+    # Entity message handler cost, {handler: {count, unmatched, total_us,
+    # max_us}}
+    _handler_stats: dict[str, dict[str, int]]
+
     def __init__(
         self, miot_client: MIoTClient,
         device_info: dict[str, Any],
@@ -201,6 +196,7 @@ class MIoTDevice:
         self._prop_list = {}
         self._event_list = {}
         self._action_list = {}
+        self._handler_stats = {}
 
         # Sub devices name
         sub_devices: dict[str, dict] = device_info.get('sub_devices', None)
@@ -390,6 +386,28 @@ class MIoTDevice:
     def icon(self) -> str:
         return self._icon
 
+    @property
+    def handler_stats(self) -> dict[str, dict[str, int]]:
+        """Cost of the entity message handlers of the device."""
+        return {
+            handler: dict(stats)
+            for handler, stats in self._handler_stats.items()}
+
+    def record_handler_cost(
+        self, handler: str, cost: float, matched: bool = True
+    ) -> None:
+        stats = self._handler_stats.get(handler, None)
+        if stats is None:
+            stats = self._handler_stats[handler] = {
+                'count': 0, 'unmatched': 0, 'total_us': 0, 'max_us': 0}
+        cost_us = int(cost * 1000000)
+        stats['count'] += 1
+        stats['total_us'] += cost_us
+        if cost_us > stats['max_us']:
+            stats['max_us'] = cost_us
+        if not matched:
+            stats['unmatched'] += 1
+
     def append_entity(self, entity_data: MIoTEntityData) -> None:
         self._entity_list.setdefault(entity_data.platform, [])
         self._entity_list[entity_data.platform].append(entity_data)
@@ -619,8 +637,23 @@ class MIoTDevice:
         miot_prop.platform = platform
         return True
 
-    def spec_transform(self) -> None:
-        """Parse service, property, event, action from device spec."""
+    def spec_transform(
+        self, entity_plans: Optional[dict[str, MIoTEntityPlan]] = None
+    ) -> None:
+        """Parse service, property, event, action from device spec.
+        entity_plans, {urn: plan}, the plan of the same urn is applied
+        instead of parsing again. The spec instances of the same urn MUST
+        be loaded from the same spec."""
+        if entity_plans is None:
+            self.__spec_transform()
+            return
+        plan = entity_plans.get(self.spec_instance.urn, None)
+        if plan and plan.apply(device=self):
+            return
+        self.__spec_transform()
+        entity_plans[self.spec_instance.urn] = MIoTEntityPlan(device=self)
+
+    def __spec_transform(self) -> None:
         # STEP 1: device conversion
         device_entity = self.parse_miot_device_entity(
             spec_instance=self.spec_instance)
@@ -914,6 +947,13 @@ class MIoTServiceEntity(Entity):
         Callable[[MIoTSpecEvent, dict], None]]
     _prop_changed_subs: dict[
         MIoTSpecProperty, Callable[[MIoTSpecProperty, Any], None]]
+    # {(siid, piid): prop}
+    _prop_index: dict[tuple[int, int], MIoTSpecProperty]
+    # {(siid, eiid): (event, {piid: argument prop})}
+    _event_index: dict[
+        tuple[int, int], tuple[MIoTSpecEvent, dict[int, MIoTSpecProperty]]]
+    # Values restored from the property snapshot, {prop: report ts}
+    _restored_ts: dict[MIoTSpecProperty, float]
 
     _pending_write_ha_state_timer: Optional[asyncio.TimerHandle]
 
@@ -932,6 +972,7 @@ class MIoTServiceEntity(Entity):
         self._prop_value_map = {}
         self._state_sub_id = 0
         self._value_sub_ids = {}
+        self._restored_ts = {}
         # Gen entity id
         if isinstance(self.entity_data.spec, MIoTSpecInstance):
             self.entity_id = miot_device.gen_device_entity_id(DOMAIN)
@@ -953,6 +994,17 @@ class MIoTServiceEntity(Entity):
         self._event_occurred_handler = None
         self._prop_changed_subs = {}
         self._pending_write_ha_state_timer = None
+        # Dispatch the messages without scanning the props and events
+        self._prop_index = {}
+        for prop in self.entity_data.props:
+            self._prop_index.setdefault((prop.service.iid, prop.iid), prop)
+        self._event_index = {}
+        for event in self.entity_data.events:
+            arg_map: dict[int, MIoTSpecProperty] = {}
+            for prop in event.argument:
+                arg_map.setdefault(prop.iid, prop)
+            self._event_index.setdefault(
+                (event.service.iid, event.iid), (event, arg_map))
         _LOGGER.info(
             'new miot service entity, %s, %s, %s, %s',
             self.miot_device.name, self._attr_name, self.entity_data.spec.name,
@@ -999,6 +1051,16 @@ class MIoTServiceEntity(Entity):
             self._value_sub_ids[key] = self.miot_device.sub_property(
                 handler=self.__on_properties_changed,
                 siid=prop.service.iid, piid=prop.iid)
+            # Start from the last known value, unchanged reports are not
+            # delivered again
+            shadow = self.miot_device.miot_client.get_prop_shadow(
+                did=self.miot_device.did, siid=prop.service.iid,
+                piid=prop.iid)
+            if shadow:
+                self.__update_prop_value(prop=prop, value=shadow.value)
+                if shadow.source == 'snapshot':
+                    self._restored_ts[prop] = shadow.ts
+        self.__update_restored_attr()
         # Sub event
         for event in self.entity_data.events:
             key = f'e.{event.service.iid}.{event.iid}'
@@ -1090,7 +1152,8 @@ class MIoTServiceEntity(Entity):
                 f'set property failed, not writable, '
                 f'{self.entity_id}, {self.name}, {prop.name}')
         try:
-            await self.miot_device.miot_client.set_prop_async(
+            # Rapid writes are coalesced, keep the value actually sent
+            value = await self.miot_device.miot_client.request_set_prop(
                 did=self.miot_device.did, siid=prop.service.iid,
                 piid=prop.iid, value=value)
         except MIoTClientError as e:
@@ -1161,11 +1224,9 @@ class MIoTServiceEntity(Entity):
                 'get property failed, not readable, %s, %s, %s',
                 self.entity_id, self.name, prop.name)
             return None
-        value: Any = prop.value_format(
+        result: Any = prop.value_convert(
             await self.miot_device.miot_client.get_prop_async(
                 did=self.miot_device.did, siid=prop.service.iid, piid=prop.iid))
-        value = prop.eval_expr(value)
-        result = prop.value_precision(value)
         if result != self._prop_value_map[prop]:
             self._prop_value_map[prop] = result
             self.async_write_ha_state()
@@ -1188,40 +1249,53 @@ class MIoTServiceEntity(Entity):
 
     def __on_properties_changed(self, params: dict, ctx: Any) -> None:
         _LOGGER.debug('properties changed, %s', params)
-        for prop in self.entity_data.props:
-            if (
-                prop.iid != params['piid']
-                or prop.service.iid != params['siid']
-            ):
-                continue
-            value: Any = prop.value_format(params['value'])
-            value = prop.eval_expr(value)
-            value = prop.value_precision(value)
-            self._prop_value_map[prop] = value
-            if prop in self._prop_changed_subs:
-                self._prop_changed_subs[prop](prop, value)
-            break
+        start_ts = time.perf_counter()
+        prop = self._prop_index.get((params['siid'], params['piid']), None)
+        if prop:
+            self.__update_prop_value(prop=prop, value=params['value'])
         if not self._pending_write_ha_state_timer:
             self.async_write_ha_state()
+        self.miot_device.record_handler_cost(
+            handler='service.properties_changed',
+            cost=time.perf_counter() - start_ts, matched=prop is not None)
+
+    def __update_prop_value(self, prop: MIoTSpecProperty, value: Any) -> None:
+        value = prop.value_convert(value)
+        self._prop_value_map[prop] = value
+        if prop in self._prop_changed_subs:
+            self._prop_changed_subs[prop](prop, value)
+        if self._restored_ts.pop(prop, None) is not None:
+            self.__update_restored_attr()
+
+    def __update_restored_attr(self) -> None:
+        """Mark the state as restored until every restored value is
+        reported again, with the time of the oldest one."""
+        if self._restored_ts:
+            self._attr_extra_state_attributes = {
+                'restored_value_time': dt_util.utc_from_timestamp(
+                    min(self._restored_ts.values()))}
+        else:
+            self._attr_extra_state_attributes = {}
 
     def __on_event_occurred(self, params: dict, ctx: Any) -> None:
         _LOGGER.debug('event occurred, %s', params)
         if self._event_occurred_handler is None:
             return
-        for event in self.entity_data.events:
-            if (
-                event.iid != params['eiid']
-                or event.service.iid != params['siid']
-            ):
-                continue
+        start_ts = time.perf_counter()
+        event_item = self._event_index.get(
+            (params['siid'], params['eiid']), None)
+        if event_item:
+            event, arg_map = event_item
             trans_arg = {}
             for item in params['arguments']:
-                for prop in event.argument:
-                    if prop.iid == item['piid']:
-                        trans_arg[prop.description_trans] = item['value']
-                        break
+                prop = arg_map.get(item['piid'], None)
+                if prop:
+                    trans_arg[prop.description_trans] = item['value']
             self._event_occurred_handler(event, trans_arg)
-            break
+        self.miot_device.record_handler_cost(
+            handler='service.event_occurred',
+            cost=time.perf_counter() - start_ts,
+            matched=event_item is not None)
 
     def __on_device_state_changed(
         self, key: str, state: MIoTDeviceState
@@ -1236,11 +1310,13 @@ class MIoTServiceEntity(Entity):
         self.__refresh_props_value()
 
     def __refresh_props_value(self) -> None:
+        priority = _get_refresh_priority(self)
         for prop in self.entity_data.props:
             if not prop.readable:
                 continue
             self.miot_device.miot_client.request_refresh_prop(
-                did=self.miot_device.did, siid=prop.service.iid, piid=prop.iid)
+                did=self.miot_device.did, siid=prop.service.iid, piid=prop.iid,
+                priority=priority)
         if self._pending_write_ha_state_timer:
             self._pending_write_ha_state_timer.cancel()
         self._pending_write_ha_state_timer = self._main_loop.call_later(
@@ -1266,6 +1342,8 @@ class MIoTPropertyEntity(Entity):
     _value: Any
     _state_sub_id: int
     _value_sub_id: int
+    # Report ts of a value restored from the property snapshot
+    _restored_ts: Optional[float]
 
     _pending_write_ha_state_timer: Optional[asyncio.TimerHandle]
 
@@ -1281,6 +1359,7 @@ class MIoTPropertyEntity(Entity):
         self._value = None
         self._state_sub_id = 0
         self._value_sub_id = 0
+        self._restored_ts = None
         self._pending_write_ha_state_timer = None
         # Gen entity_id
         self.entity_id = self.miot_device.gen_prop_entity_id(
@@ -1313,6 +1392,17 @@ class MIoTPropertyEntity(Entity):
         self._value_sub_id = self.miot_device.sub_property(
             handler=self.__on_value_changed,
             siid=self.service.iid, piid=self.spec.iid)
+        shadow = self.miot_device.miot_client.get_prop_shadow(
+            did=self.miot_device.did, siid=self.service.iid,
+            piid=self.spec.iid)
+        if shadow:
+            self._value = self.spec.value_convert(shadow.value)
+            if shadow.source == 'snapshot':
+                # Marked as restored until the value is reported again
+                self._restored_ts = shadow.ts
+                self._attr_extra_state_attributes = {
+                    'restored_value_time': dt_util.utc_from_timestamp(
+                        shadow.ts)}
         # Refresh value
         if self._attr_available:
             self.__request_refresh_prop()
@@ -1346,7 +1436,8 @@ class MIoTPropertyEntity(Entity):
         value = self.spec.value_format(value)
         value = self.spec.value_precision(value)
         try:
-            await self.miot_device.miot_client.set_prop_async(
+            # Rapid writes are coalesced, keep the value actually sent
+            value = await self.miot_device.miot_client.request_set_prop(
                 did=self.miot_device.did, siid=self.spec.service.iid,
                 piid=self.spec.iid, value=value)
         except MIoTClientError as e:
@@ -1362,21 +1453,23 @@ class MIoTPropertyEntity(Entity):
                 'get property failed, not readable, %s, %s',
                 self.entity_id, self.name)
             return None
-        value: Any = self.spec.value_format(
+        return self.spec.value_convert(
             await self.miot_device.miot_client.get_prop_async(
                 did=self.miot_device.did, siid=self.spec.service.iid,
                 piid=self.spec.iid))
-        value = self.spec.eval_expr(value)
-        result = self.spec.value_precision(value)
-        return result
 
     def __on_value_changed(self, params: dict, ctx: Any) -> None:
         _LOGGER.debug('property changed, %s', params)
-        value: Any = self.spec.value_format(params['value'])
-        value = self.spec.eval_expr(value)
-        self._value = self.spec.value_precision(value)
+        start_ts = time.perf_counter()
+        self._value = self.spec.value_convert(params['value'])
+        if self._restored_ts is not None:
+            self._restored_ts = None
+            self._attr_extra_state_attributes = {}
         if not self._pending_write_ha_state_timer:
             self.async_write_ha_state()
+        self.miot_device.record_handler_cost(
+            handler='property.value_changed',
+            cost=time.perf_counter() - start_ts)
 
     def __on_device_state_changed(
         self, key: str, state: MIoTDeviceState
@@ -1392,7 +1485,7 @@ class MIoTPropertyEntity(Entity):
         if self.spec.readable:
             self.miot_device.miot_client.request_refresh_prop(
                 did=self.miot_device.did, siid=self.service.iid,
-                piid=self.spec.iid)
+                piid=self.spec.iid, priority=_get_refresh_priority(self))
         if self._pending_write_ha_state_timer:
             self._pending_write_ha_state_timer.cancel()
         self._pending_write_ha_state_timer = self._main_loop.call_later(
@@ -1478,6 +1571,7 @@ class MIoTEventEntity(Entity):
 
     def __on_event_occurred(self, params: dict, ctx: Any) -> None:
         _LOGGER.debug('event occurred, %s',  params)
+        start_ts = time.perf_counter()
         trans_arg = {}
         for item in params['arguments']:
             try:
@@ -1503,6 +1597,9 @@ class MIoTEventEntity(Entity):
         self.on_event_occurred(
             name=self.spec.description_trans, arguments=trans_arg)
         self.async_write_ha_state()
+        self.miot_device.record_handler_cost(
+            handler='event.event_occurred',
+            cost=time.perf_counter() - start_ts)
 
     def __on_device_state_changed(
         self, key: str, state: MIoTDeviceState
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (C) 2024 Xiaomi Corporation.
+
+The ownership and intellectual property rights of Xiaomi Home Assistant
+Integration and related Xiaomi cloud service API interface provided under this
+license, including source code and object code (collectively, "Licensed Work"),
+are owned by Xiaomi. Subject to the terms and conditions of this License, Xiaomi
+hereby grants you a personal, limited, non-exclusive, non-transferable,
+non-sublicensable, and royalty-free license to reproduce, use, modify, and
+distribute the Licensed Work only for your use of Home Assistant for
+non-commercial purposes. For the avoidance of doubt, Xiaomi does not authorize
+you to use the Licensed Work for any other purpose, including but not limited
+to use Licensed Work to develop applications (APP), Web services, and other
+forms of software.
+
+You may reproduce and distribute copies of the Licensed Work, with or without
+modifications, whether in source or object form, provided that you must give
+any other recipients of the Licensed Work a copy of this License and retain all
+copyright and disclaimers.
+
+Xiaomi provides the Licensed Work on an "AS IS" BASIS, WITHOUT WARRANTIES OR
+CONDITIONS OF ANY KIND, either express or implied, including, without
+limitation, any warranties, undertakes, or conditions of TITLE, NO ERROR OR
+OMISSION, CONTINUITY, RELIABILITY, NON-INFRINGEMENT, MERCHANTABILITY, or
+FITNESS FOR A PARTICULAR PURPOSE. In any event, you are solely responsible
+for any direct, indirect, special, incidental, or consequential damages or
+losses arising from the use or inability to use the Licensed Work.
+
+Xiaomi reserves all rights not expressly granted to you in this License.
+Except for the rights expressly granted by Xiaomi under this License, Xiaomi
+does not authorize you in any form to use the trademarks, copyrights, or other
+forms of intellectual property rights of Xiaomi and its affiliates, including,
+without limitation, without obtaining other written permission from Xiaomi, you
+shall not use "Xiaomi", "Mijia" and other words related to Xiaomi or words that
+may make the public associate with Xiaomi in any form to publicize or promote
+the software or hardware devices that use the Licensed Work.
+
+Xiaomi has the right to immediately terminate all your authorization under this
+License in the event:
+1. You assert patent invalidation, litigation, or other claims against patents
+or other intellectual property rights of Xiaomi or its affiliates; or,
+2. You make, have made, manufacture, sell, or offer to sell products that knock
+off Xiaomi or its affiliates' products.
+
+MIoT entity data and spec transform plans.
+"""
+from typing import Any, Optional
+
+# pylint: disable=relative-beyond-top-level
+from .miot_spec import (
+    MIoTSpecAction,
+    MIoTSpecEvent,
+    MIoTSpecInstance,
+    MIoTSpecProperty,
+    MIoTSpecService
+)
+
+
+class MIoTEntityData:
+    """MIoT Entity Data."""
+    platform: str
+    device_class: Any
+    spec: MIoTSpecInstance | MIoTSpecService
+
+    props: set[MIoTSpecProperty]
+    events: set[MIoTSpecEvent]
+    actions: set[MIoTSpecAction]
+
+    def __init__(
+        self, platform: str, spec: MIoTSpecInstance | MIoTSpecService
+    ) -> None:
+        self.platform = platform
+        self.spec = spec
+        self.device_class = None
+        self.props = set()
+        self.events = set()
+        self.actions = set()
+
+
+class MIoTEntityPlan:
+    """Result of MIoTDevice.spec_transform() for a spec instance.
+    Devices with the same urn get the same result, the plan is recorded
+    from the first device and applied to the others.
+    Spec objects are identified by (kind, siid, iid), kind is one of
+    's', 'p', 'e', 'a', the spec instance itself is None.
+    device is a MIoTDevice, or any object with spec_instance, entity_list,
+    prop_list, event_list, action_list and append_entity()."""
+    spec_keys: frozenset
+    # (siid, platform, entity_category)
+    service_attrs: list[tuple]
+    # (siid, piid, platform, external_unit, icon, device_class, state_class)
+    prop_attrs: list[tuple]
+    # (siid, eiid, platform, device_class)
+    event_attrs: list[tuple]
+    # (siid, aiid, platform)
+    action_attrs: list[tuple]
+    # (platform, spec key, device_class, prop keys, event keys, action keys)
+    entities: list[tuple]
+    prop_list: dict[str, list[tuple]]
+    event_list: dict[str, list[tuple]]
+    action_list: dict[str, list[tuple]]
+
+    def __init__(self, device: Any) -> None:
+        """Record the plan from a transformed device."""
+        spec_index = self.index_spec(spec_instance=device.spec_instance)
+        self.spec_keys = frozenset(spec_index.keys())
+        self.service_attrs = []
+        self.prop_attrs = []
+        self.event_attrs = []
+        self.action_attrs = []
+        for service in device.spec_instance.services:
+            self.service_attrs.append((
+                service.iid, service.platform, service.entity_category))
+            for prop in service.properties:
+                self.prop_attrs.append((
+                    service.iid, prop.iid, prop.platform, prop.external_unit,
+                    prop.icon, prop.device_class, prop.state_class))
+            for event in service.events:
+                self.event_attrs.append((
+                    service.iid, event.iid, event.platform,
+                    event.device_class))
+            for action in service.actions:
+                self.action_attrs.append((
+                    service.iid, action.iid, action.platform))
+        self.entities = [
+            (
+                platform, self.spec_key(entity_data.spec),
+                entity_data.device_class,
+                [self.spec_key(prop) for prop in entity_data.props],
+                [self.spec_key(event) for event in entity_data.events],
+                [self.spec_key(action) for action in entity_data.actions])
+            for platform, entity_list in device.entity_list.items()
+            for entity_data in entity_list]
+        self.prop_list = {
+            platform: [self.spec_key(prop) for prop in prop_list]
+            for platform, prop_list in device.prop_list.items()}
+        self.event_list = {
+            platform: [self.spec_key(event) for event in event_list]
+            for platform, event_list in device.event_list.items()}
+        self.action_list = {
+            platform: [self.spec_key(action) for action in action_list]
+            for platform, action_list in device.action_list.items()}
+
+    def apply(self, device: Any) -> bool:
+        """Apply the plan to a device which is not transformed yet, return
+        False if the spec instance does not match the plan."""
+        spec_index = self.index_spec(spec_instance=device.spec_instance)
+        if spec_index.keys() != self.spec_keys:
+            return False
+        for siid, platform, entity_category in self.service_attrs:
+            service = spec_index[('s', siid)]
+            service.platform = platform
+            service.entity_category = entity_category
+        for (
+            siid, piid, platform, external_unit, icon, device_class,
+            state_class
+        ) in self.prop_attrs:
+            prop = spec_index[('p', siid, piid)]
+            prop.platform = platform
+            prop.external_unit = external_unit
+            prop.icon = icon
+            prop.device_class = device_class
+            prop.state_class = state_class
+        for siid, eiid, platform, device_class in self.event_attrs:
+            event = spec_index[('e', siid, eiid)]
+            event.platform = platform
+            event.device_class = device_class
+        for siid, aiid, platform in self.action_attrs:
+            spec_index[('a', siid, aiid)].platform = platform
+        for (
+            platform, spec_key, device_class, prop_keys, event_keys,
+            action_keys
+        ) in self.entities:
+            entity_data = MIoTEntityData(
+                platform=platform, spec=spec_index[spec_key])
+            entity_data.device_class = device_class
+            entity_data.props = {spec_index[key] for key in prop_keys}
+            entity_data.events = {spec_index[key] for key in event_keys}
+            entity_data.actions = {spec_index[key] for key in action_keys}
+            device.append_entity(entity_data=entity_data)
+        for platform, keys in self.prop_list.items():
+            device.prop_list[platform] = [spec_index[key] for key in keys]
+        for platform, keys in self.event_list.items():
+            device.event_list[platform] = [spec_index[key] for key in keys]
+        for platform, keys in self.action_list.items():
+            device.action_list[platform] = [spec_index[key] for key in keys]
+        return True
+
+    @staticmethod
+    def spec_key(spec: Any) -> Optional[tuple]:
+        if isinstance(spec, MIoTSpecService):
+            return ('s', spec.iid)
+        if isinstance(spec, MIoTSpecProperty):
+            return ('p', spec.service.iid, spec.iid)
+        if isinstance(spec, MIoTSpecEvent):
+            return ('e', spec.service.iid, spec.iid)
+        if isinstance(spec, MIoTSpecAction):
+            return ('a', spec.service.iid, spec.iid)
+        return None
+
+    @staticmethod
+    def index_spec(spec_instance: MIoTSpecInstance) -> dict[Any, Any]:
+        spec_index: dict[Any, Any] = {None: spec_instance}
+        for service in spec_instance.services:
+            spec_index[('s', service.iid)] = service
+            for prop in service.properties:
+                spec_index[('p', service.iid, prop.iid)] = prop
+            for event in service.events:
+                spec_index[('e', service.iid, event.iid)] = event
+            for action in service.actions:
+                spec_index[('a', service.iid, action.iid)] = action
+        return spec_index
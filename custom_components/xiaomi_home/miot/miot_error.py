@@ -48,6 +48,10 @@ MIoT error code and exception.
 from enum import Enum
 from typing import Any
 
+# Device rpc error codes rejecting the request itself, JSON-RPC method not
+# found and invalid params
+MIOT_RPC_REJECT_CODES: tuple[int, ...] = (-32601, -32602)
+
 
 class MIoTErrorCode(Enum):
     """MIoT error code."""
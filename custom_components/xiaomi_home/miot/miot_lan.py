@@ -50,6 +50,7 @@ MIoT lan device control, only support MIoT SPEC-v2 WiFi devices.
 import json
 import time
 import asyncio
+import itertools
 from dataclasses import dataclass
 from enum import Enum, auto
 import logging
@@ -65,11 +66,16 @@ from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes
 
 # pylint: disable=relative-beyond-top-level
-from .miot_error import MIoTError, MIoTLanError, MIoTErrorCode
+from .miot_error import (
+    MIOT_RPC_REJECT_CODES,
+    MIoTError,
+    MIoTLanError,
+    MIoTErrorCode)
 from .miot_network import InterfaceStatus, MIoTNetwork, NetworkInfo
 from .miot_mdns import MipsService, MipsServiceState
 from .common import (
-    randomize_float, load_yaml_file, gen_absolute_path, MIoTMatcher)
+    randomize_float, load_yaml_file, gen_absolute_path, MIoTDispatchIndex,
+    MIoTDispatcher, MIoTTimerWheel)
 
 
 _LOGGER = logging.getLogger(__name__)
@@ -84,12 +90,14 @@ class _MIoTLanGetDevListData:
 
 @dataclass
 class _MIoTLanUnregisterBroadcastData:
-    key: str
+    # (did, kind, siid, iid)
+    key: tuple
 
 
 @dataclass
 class _MIoTLanRegisterBroadcastData:
-    key: str
+    # (did, kind, siid, iid)
+    key: tuple
     handler: Callable[[dict, Any], None]
     handler_ctx: Any
 
@@ -117,7 +125,6 @@ class _MIoTLanRequestData:
     msg_id: int
     handler: Optional[Callable[[dict, Any], None]]
     handler_ctx: Any
-    timeout: Optional[asyncio.TimerHandle]
 
 
 class _MIoTLanDeviceState(Enum):
@@ -159,7 +166,6 @@ class _MIoTLanDevice:
     _online_offline_history: list[dict[str, Any]]
     _online_offline_timer: Optional[asyncio.TimerHandle]
 
-    _ka_timer: Optional[asyncio.TimerHandle]
     _ka_internal: float
 
 # All functions SHOULD be called from the internal loop
@@ -193,9 +199,9 @@ class _MIoTLanDevice:
         def ka_init_handler() -> None:
             self._ka_internal = self.KA_INTERVAL_MIN
             self.__update_keep_alive(state=_MIoTLanDeviceState.DEAD)
-        self._ka_timer = self._manager.internal_loop.call_later(
-            randomize_float(self.CONSTRUCT_STATE_PENDING, 0.5),
-            ka_init_handler,)
+        self._manager.schedule_keep_alive(
+            self.did, randomize_float(self.CONSTRUCT_STATE_PENDING, 0.5),
+            ka_init_handler)
         _LOGGER.debug('miot lan device add, %s', self.did)
 
     def keep_alive(self, ip: str, if_name: str) -> None:
@@ -242,9 +248,10 @@ class _MIoTLanDevice:
         out_buffer[16:32] = msg_md5
         return data_len
 
-    def decrypt_packet(self, encrypted_data: bytearray) -> dict:
-        data_len: int = struct.unpack('>H', encrypted_data[2:4])[0]
-        md5_orig: bytes = encrypted_data[16:32]
+    def decrypt_packet(self, encrypted_data: bytearray | memoryview) -> dict:
+        data_len: int = struct.unpack_from('>H', encrypted_data, 2)[0]
+        # Copy the md5 out, the token is written in place below
+        md5_orig: bytes = bytes(encrypted_data[16:32])
         encrypted_data[16:32] = self.token
         md5_calc: bytes = self.__md5(encrypted_data[0:data_len])
         if md5_orig != md5_calc:
@@ -306,9 +313,7 @@ class _MIoTLanDevice:
                 'online': self._online, 'push_available': self.subscribed})
 
     def on_delete(self) -> None:
-        if self._ka_timer:
-            self._ka_timer.cancel()
-            self._ka_timer = None
+        self._manager.cancel_keep_alive(self.did)
         if self._online_offline_timer:
             self._online_offline_timer.cancel()
             self._online_offline_timer = None
@@ -359,35 +364,40 @@ class _MIoTLanDevice:
         self._state = state
         if self._state != _MIoTLanDeviceState.FRESH:
             _LOGGER.debug('device status, %s, %s', self.did, self._state)
-        if self._ka_timer:
-            self._ka_timer.cancel()
-            self._ka_timer = None
+        self._manager.cancel_keep_alive(self.did)
         match state:
             case _MIoTLanDeviceState.FRESH:
+                spread: bool = False
                 if last_state == _MIoTLanDeviceState.DEAD:
                     self._ka_internal = self.KA_INTERVAL_MIN
                     self.__change_online(True)
-                self._ka_timer = self._manager.internal_loop.call_later(
-                    self.__get_next_ka_timeout(), self.__update_keep_alive,
-                    _MIoTLanDeviceState.PING1)
+                    # Devices found by the same scan come back together,
+                    # spread their first keep alive across the interval
+                    spread = True
+                self._manager.schedule_keep_alive(
+                    self.did, self.__get_next_ka_timeout(spread=spread),
+                    self.__update_keep_alive, _MIoTLanDeviceState.PING1)
             case (
                     _MIoTLanDeviceState.PING1
                     | _MIoTLanDeviceState.PING2
                     | _MIoTLanDeviceState.PING3
             ):
-                # Set the timer first to avoid Any early returns
-                self._ka_timer = self._manager.internal_loop.call_later(
-                    self.FAST_PING_INTERVAL, self.__update_keep_alive,
-                    _MIoTLanDeviceState(state.value+1))
+                next_state = _MIoTLanDeviceState(state.value+1)
                 # Fast ping
-                if self._if_name is None:
+                if self._if_name is None or self.ip is None:
                     _LOGGER.error(
-                        'if_name is Not set for device, %s', self.did)
-                    return
-                if self.ip is None:
-                    _LOGGER.error('ip is Not set for device, %s', self.did)
+                        'if_name or ip is Not set for device, %s, %s, %s',
+                        self.did, self._if_name, self.ip)
+                    # Keep the state machine going without a probe
+                    self._manager.schedule_keep_alive(
+                        self.did, self.FAST_PING_INTERVAL,
+                        self.__update_keep_alive, next_state)
                     return
-                self._manager.ping(if_name=self._if_name, target_ip=self.ip)
+                # The ping timeout is armed when the probe is sent
+                self._manager.queue_ping(
+                    did=self.did, if_name=self._if_name, target_ip=self.ip,
+                    timeout=self.FAST_PING_INTERVAL,
+                    handler=self.__update_keep_alive, state=next_state)
             case _MIoTLanDeviceState.DEAD:
                 if last_state == _MIoTLanDeviceState.PING3:
                     self._ka_internal = self.KA_INTERVAL_MIN
@@ -395,9 +405,9 @@ class _MIoTLanDevice:
             case _:
                 _LOGGER.error('invalid state, %s', state)
 
-    def __get_next_ka_timeout(self) -> float:
+    def __get_next_ka_timeout(self, spread: bool = False) -> float:
         self._ka_internal = min(self._ka_internal*2, self.KA_INTERVAL_MAX)
-        return randomize_float(self._ka_internal, 0.1)
+        return randomize_float(self._ka_internal, 0.5 if spread else 0.1)
 
     def __change_online(self, online: bool) -> None:
         _LOGGER.info('change online, %s, %s', self.did, online)
@@ -444,9 +454,15 @@ class MIoTLan:
     OT_PROBE_LEN: int = 32
     OT_MSG_LEN: int = 1400
     OT_SUPPORT_WILDCARD_SUB: int = 0xFE
+    # Max datagrams drained from a socket per readiness callback
+    OT_READ_BATCH_MAX: int = 32
 
     OT_PROBE_INTERVAL_MIN: float = 5
     OT_PROBE_INTERVAL_MAX: float = 45
+    OT_DUP_FILTER_WINDOW: float = 5
+    # Keep alive probes, paced per interface
+    OT_KA_PROBE_TICK: float = 0.1
+    OT_KA_PROBE_RATE: int = 50
 
     PROFILE_MODELS_FILE: str = 'lan/profile_models.yaml'
 
@@ -459,7 +475,10 @@ class MIoTLan:
     _virtual_did: str
     _probe_msg: bytes
     _write_buffer: bytearray
-    _read_buffer: bytearray
+    _read_buffers: list[bytearray]
+    _read_views: list[memoryview]
+    _read_stats: dict[str, int]
+    _dispatcher: MIoTDispatcher
 
     _internal_loop: asyncio.AbstractEventLoop
     _thread: threading.Thread
@@ -471,9 +490,15 @@ class MIoTLan:
     _last_scan_interval: Optional[float]
     _msg_id_counter: int
     _pending_requests: dict[int, _MIoTLanRequestData]
-    _device_msg_matcher: MIoTMatcher
+    _device_msg_index: MIoTDispatchIndex
     _device_state_sub_map: dict[str, _MIoTLanSubDeviceData]
-    _reply_msg_buffer: dict[str, asyncio.TimerHandle]
+    # Dedupe window and request timeout expiry
+    _timer_wheel: MIoTTimerWheel
+    # {if_name: {did: (ip, timeout, handler, state)}}, pending keep alive
+    # probes
+    _ka_probe_queues: dict[
+        str, dict[str, tuple[str, float, Callable[..., None], Any]]]
+    _ka_probe_timer: Optional[asyncio.TimerHandle]
 
     _lan_state_sub_map: dict[str, Callable[[bool], Coroutine]]
     _lan_ctrl_vote_map: dict[str, bool]
@@ -519,7 +544,14 @@ class MIoTLan:
         probe_bytes[20:28] = struct.pack('>Q', int(self._virtual_did))
         probe_bytes[28:32] = b'\x00\x00\x00\x00'
         self._probe_msg = bytes(probe_bytes)
-        self._read_buffer = bytearray(self.OT_MSG_LEN)
+        self._read_buffers = [
+            bytearray(self.OT_MSG_LEN) for _ in range(self.OT_READ_BATCH_MAX)]
+        self._read_views = [memoryview(buf) for buf in self._read_buffers]
+        self._read_stats = {
+            'wakeups': 0, 'datagrams': 0, 'bytes': 0,
+            'last_datagrams': 0, 'last_bytes': 0, 'max_datagrams': 0}
+        self._dispatcher = MIoTDispatcher(
+            loop=self._main_loop, name='lan dispatch')
         self._write_buffer = bytearray(self.OT_MSG_LEN)
 
         self._lan_devices = {}
@@ -530,9 +562,10 @@ class MIoTLan:
         self._last_scan_interval = None
         self._msg_id_counter = int(random.random()*0x7FFFFFFF)
         self._pending_requests = {}
-        self._device_msg_matcher = MIoTMatcher()
+        self._device_msg_index = MIoTDispatchIndex()
         self._device_state_sub_map = {}
-        self._reply_msg_buffer = {}
+        self._ka_probe_queues = {}
+        self._ka_probe_timer = None
 
         self._lan_state_sub_map = {}
         self._lan_ctrl_vote_map = {}
@@ -559,6 +592,16 @@ class MIoTLan:
     def virtual_did(self) -> str:
         return self._virtual_did
 
+    @property
+    def read_stats(self) -> dict[str, int]:
+        """Socket ingest counters, datagrams and bytes per wakeup."""
+        return dict(self._read_stats)
+
+    @property
+    def dispatch_stats(self) -> dict[str, int]:
+        """Main loop dispatch counters, batch size and queue depth."""
+        return self._dispatcher.stats
+
     @property
     def internal_loop(self) -> asyncio.AbstractEventLoop:
         return self._internal_loop
@@ -598,6 +641,7 @@ class MIoTLan:
                 _LOGGER.error('load profile models error, %s', err)
                 self._profile_models = {}
             self._internal_loop = asyncio.new_event_loop()
+            self._timer_wheel = MIoTTimerWheel(loop=self._internal_loop)
             # All tasks meant for the internal loop should happen in this thread
             self._thread = threading.Thread(target=self.__internal_loop_thread)
             self._thread.name = 'miot_lan'
@@ -634,9 +678,10 @@ class MIoTLan:
         self._last_scan_interval = None
         self._msg_id_counter = int(random.random()*0x7FFFFFFF)
         self._pending_requests = {}
-        self._device_msg_matcher = MIoTMatcher()
+        self._device_msg_index = MIoTDispatchIndex()
         self._device_state_sub_map = {}
-        self._reply_msg_buffer = {}
+        self._ka_probe_queues = {}
+        self._ka_probe_timer = None
         for handler in list(self._lan_state_sub_map.values()):
             self._main_loop.create_task(handler(False))
         _LOGGER.info('miot lan deinit')
@@ -743,9 +788,7 @@ class MIoTLan:
             return False
         if not self._enable_subscribe:
             return False
-        key = (
-            f'{did}/p/'
-            f'{"#" if siid is None or piid is None else f"{siid}/{piid}"}')
+        key = (did, 'p', siid, piid)
         self._internal_loop.call_soon_threadsafe(
             self.__sub_broadcast,
             _MIoTLanRegisterBroadcastData(
@@ -763,9 +806,7 @@ class MIoTLan:
             return False
         if not self._enable_subscribe:
             return False
-        key = (
-            f'{did}/p/'
-            f'{"#" if siid is None or piid is None else f"{siid}/{piid}"}')
+        key = (did, 'p', siid, piid)
         self._internal_loop.call_soon_threadsafe(
             self.__unsub_broadcast,
             _MIoTLanUnregisterBroadcastData(key=key))
@@ -784,9 +825,7 @@ class MIoTLan:
             return False
         if not self._enable_subscribe:
             return False
-        key = (
-            f'{did}/e/'
-            f'{"#" if siid is None or eiid is None else f"{siid}/{eiid}"}')
+        key = (did, 'e', siid, eiid)
         self._internal_loop.call_soon_threadsafe(
             self.__sub_broadcast,
             _MIoTLanRegisterBroadcastData(
@@ -804,9 +843,7 @@ class MIoTLan:
             return False
         if not self._enable_subscribe:
             return False
-        key = (
-            f'{did}/e/'
-            f'{"#" if siid is None or eiid is None else f"{siid}/{eiid}"}')
+        key = (did, 'e', siid, eiid)
         self._internal_loop.call_soon_threadsafe(
             self.__unsub_broadcast,
             _MIoTLanUnregisterBroadcastData(key=key))
@@ -832,6 +869,44 @@ class MIoTLan:
             return result_obj['result'][0].get('value', None)
         return None
 
+    @final
+    async def get_props_async(
+        self, did: str, props_list: List[Dict[str, Any]],
+        timeout_ms: int = 10000
+    ) -> List[Dict[str, Any]]:
+        # props_list = [{'siid': siid, 'piid': piid}......]
+        self.__assert_service_ready()
+        result_obj = await self.__call_api_async(
+            did=did, msg={
+                'method': 'get_properties',
+                'params': [{
+                    'did': did, 'siid': prop['siid'], 'piid': prop['piid']}
+                    for prop in props_list]
+            }, timeout_ms=timeout_ms)
+        if (
+            result_obj
+            and isinstance(result_obj.get('result', None), list)
+            and len(result_obj['result']) == len(props_list)
+        ):
+            return result_obj['result']
+        if (
+            result_obj
+            and result_obj.get('code', None)
+            == MIoTErrorCode.CODE_TIMEOUT.value
+        ):
+            raise MIoTLanError('timeout', MIoTErrorCode.CODE_TIMEOUT)
+        error = result_obj.get('error', None) if result_obj else None
+        if (
+            isinstance(error, dict)
+            and error.get('code', None) in MIOT_RPC_REJECT_CODES
+        ):
+            raise MIoTLanError(
+                f'request rejected, {result_obj}',
+                MIoTErrorCode.CODE_INVALID_PARAMS)
+        raise MIoTLanError(
+            f'invalid result, {result_obj}',
+            MIoTErrorCode.CODE_INTERNAL_ERROR)
+
     @final
     async def set_prop_async(
         self, did: str, siid: int, piid: int, value: Any,
@@ -979,6 +1054,33 @@ class MIoTLan:
             if_name=if_name, data=self._probe_msg, address=target_ip,
             port=self.OT_PORT)
 
+    def schedule_keep_alive(
+        self, did: str, delay: float, handler: Callable[..., None], *args
+    ) -> None:
+        """Replace the keep alive timer of a device."""
+        self._timer_wheel.add(('ka', did), delay, handler, *args)
+
+    def cancel_keep_alive(self, did: str) -> None:
+        """Cancel the keep alive timer and the queued probe of a device."""
+        self._timer_wheel.cancel(('ka', did))
+        for queue in self._ka_probe_queues.values():
+            queue.pop(did, None)
+
+    def queue_ping(
+        self, did: str, if_name: str, target_ip: str, timeout: float,
+        handler: Callable[..., None], state: Any
+    ) -> None:
+        """Queue a keep alive probe, sent at most OT_KA_PROBE_RATE per second
+        on each interface. The keep alive timer of the device, handler(state)
+        after timeout, is armed when the probe is actually sent."""
+        if not target_ip:
+            return
+        self._ka_probe_queues.setdefault(if_name, {})[did] = (
+            target_ip, timeout, handler, state)
+        if not self._ka_probe_timer:
+            self._ka_probe_timer = self._internal_loop.call_soon(
+                self.__send_ka_probes)
+
     def send2device(
         self, did: str,
         msg: dict,
@@ -1031,22 +1133,20 @@ class MIoTLan:
                     'error': 'timeout'},
                     req_data.handler_ctx)
 
-        timer: Optional[asyncio.TimerHandle] = None
         request_data = _MIoTLanRequestData(
             msg_id=msg_id,
             handler=handler,
-            handler_ctx=handler_ctx,
-            timeout=timer)
+            handler_ctx=handler_ctx)
         if timeout_ms:
-            timer = self._internal_loop.call_later(
-                timeout_ms/1000, request_timeout_handler, request_data)
-            request_data.timeout = timer
+            self._timer_wheel.add(
+                ('req', msg_id), timeout_ms/1000,
+                request_timeout_handler, request_data)
         self._pending_requests[msg_id] = request_data
         self.__sendto(if_name=if_name, data=msg, address=ip, port=self.OT_PORT)
 
     def broadcast_device_state(self, did: str, state: dict) -> None:
         for handler in self._device_state_sub_map.values():
-            self._main_loop.call_soon_threadsafe(
+            self._dispatcher.dispatch(
                 self._main_loop.create_task,
                 handler.handler(did, state, handler.handler_ctx))
 
@@ -1087,12 +1187,11 @@ class MIoTLan:
         self._device_state_sub_map.pop(data.key, None)
 
     def __sub_broadcast(self, data: _MIoTLanRegisterBroadcastData) -> None:
-        self._device_msg_matcher[data.key] = data
+        self._device_msg_index[data.key] = data
         _LOGGER.debug('lan register broadcast, %s', data.key)
 
     def __unsub_broadcast(self, data: _MIoTLanUnregisterBroadcastData) -> None:
-        if self._device_msg_matcher.get(topic=data.key):
-            del self._device_msg_matcher[data.key]
+        self._device_msg_index.pop(data.key)
         _LOGGER.debug('lan unregister broadcast, %s', data.key)
 
     def __get_dev_list(self, data: _MIoTLanGetDevListData) -> None:
@@ -1178,15 +1277,13 @@ class MIoTLan:
         for device in self._lan_devices.values():
             device.on_delete()
         self._lan_devices.clear()
-        for req_data in self._pending_requests.values():
-            if req_data.timeout:
-                req_data.timeout.cancel()
-                req_data.timeout = None
         self._pending_requests.clear()
-        for timer in self._reply_msg_buffer.values():
-            timer.cancel()
-        self._reply_msg_buffer.clear()
-        self._device_msg_matcher = MIoTMatcher()
+        self._timer_wheel.clear()
+        if self._ka_probe_timer:
+            self._ka_probe_timer.cancel()
+            self._ka_probe_timer = None
+        self._ka_probe_queues.clear()
+        self._device_msg_index = MIoTDispatchIndex()
         self.__deinit_socket()
         self._internal_loop.stop()
 
@@ -1234,32 +1331,60 @@ class MIoTLan:
         _LOGGER.info('destroyed socket, %s', if_name)
 
     def __socket_read_handler(self, ctx: tuple[str, socket.socket]) -> None:
-        try:
-            data_len, addr = ctx[1].recvfrom_into(
-                self._read_buffer, self.OT_MSG_LEN, socket.MSG_DONTWAIT)
+        # Drain all pending datagrams into the buffer pool first, then
+        # handle them through memoryviews to avoid per-message copies.
+        batch: list[tuple[int, int, str]] = []
+        recv_count: int = 0
+        recv_bytes: int = 0
+        for index in range(self.OT_READ_BATCH_MAX):
+            try:
+                data_len, addr = ctx[1].recvfrom_into(
+                    self._read_buffers[index], self.OT_MSG_LEN,
+                    socket.MSG_DONTWAIT)
+            except (BlockingIOError, InterruptedError):
+                break
+            except Exception as err:  # pylint: disable=broad-exception-caught
+                _LOGGER.error('socket read handler error, %s', err)
+                break
             if data_len < 0:
                 # Socket error
                 _LOGGER.error('socket read error, %s, %s', ctx[0], data_len)
-                return
+                break
+            recv_count += 1
+            recv_bytes += data_len
             if addr[1] != self.OT_PORT:
                 # Not ot msg
-                return
-            self.__raw_message_handler(
-                self._read_buffer[:data_len], data_len, addr[0], ctx[0])
-        except Exception as err:  # pylint: disable=broad-exception-caught
-            _LOGGER.error('socket read handler error, %s', err)
+                continue
+            batch.append((index, data_len, addr[0]))
+        self.__update_read_stats(datagrams=recv_count, recv_bytes=recv_bytes)
+        for index, data_len, ip in batch:
+            try:
+                self.__raw_message_handler(
+                    self._read_views[index][:data_len], data_len, ip, ctx[0])
+            except Exception as err:  # pylint: disable=broad-exception-caught
+                _LOGGER.error('socket read handler error, %s', err)
+
+    def __update_read_stats(self, datagrams: int, recv_bytes: int) -> None:
+        stats = self._read_stats
+        stats['wakeups'] += 1
+        stats['datagrams'] += datagrams
+        stats['bytes'] += recv_bytes
+        stats['last_datagrams'] = datagrams
+        stats['last_bytes'] = recv_bytes
+        if datagrams > stats['max_datagrams']:
+            stats['max_datagrams'] = datagrams
 
     def __raw_message_handler(
-        self, data: bytearray, data_len: int, ip: str, if_name: str
+        self, data: memoryview, data_len: int, ip: str, if_name: str
     ) -> None:
         if data[:2] != self.OT_HEADER:
             return
         # Keep alive message
-        did: str = str(struct.unpack('>Q', data[4:12])[0])
+        did: str = str(struct.unpack_from('>Q', data, 4)[0])
         device: Optional[_MIoTLanDevice] = self._lan_devices.get(did)
         if not device:
             return
-        timestamp: int = struct.unpack('>I', data[12:16])[0]
+        timestamp: int = struct.unpack_from('>I', data, 12)[0]
         device.offset = int(time.time()) - timestamp
         # Keep alive if this is a probe
         if data_len == self.OT_PROBE_LEN or device.subscribed:
@@ -1273,7 +1398,7 @@ class MIoTLan:
         ):
             device.supported_wildcard_sub = (
                 int(data[28]) == self.OT_SUPPORT_WILDCARD_SUB)
-            sub_ts = struct.unpack('>I', data[20:24])[0]
+            sub_ts = struct.unpack_from('>I', data, 20)[0]
             sub_type = int(data[27])
             if (
                 device.supported_wildcard_sub
@@ -1299,12 +1424,9 @@ class MIoTLan:
         req: Optional[_MIoTLanRequestData] = (
             self._pending_requests.pop(msg['id'], None))
         if req:
-            if req.timeout:
-                req.timeout.cancel()
-                req.timeout = None
+            self._timer_wheel.cancel(('req', req.msg_id))
             if req.handler is not None:
-                self._main_loop.call_soon_threadsafe(
-                    req.handler, msg, req.handler_ctx)
+                self._dispatcher.dispatch(req.handler, msg, req.handler_ctx)
             return
         # Handle up link message
         if 'method' not in msg or 'params' not in msg:
@@ -1323,22 +1445,18 @@ class MIoTLan:
                     _LOGGER.debug(
                         'invalid message, no siid or piid, %s, %s', did, msg)
                     continue
-                key = f'{did}/p/{param["siid"]}/{param["piid"]}'
-                subs: list[_MIoTLanRegisterBroadcastData] = list(
-                    self._device_msg_matcher.iter_match(key))
-                for sub in subs:
-                    self._main_loop.call_soon_threadsafe(
+                for sub in self._device_msg_index.match(
+                        did, 'p', param['siid'], param['piid']):
+                    self._dispatcher.dispatch(
                         sub.handler, param, sub.handler_ctx)
         elif (
                 msg['method'] == 'event_occured'
                 and 'siid' in msg['params']
                 and 'eiid' in msg['params']
         ):
-            key = f'{did}/e/{msg["params"]["siid"]}/{msg["params"]["eiid"]}'
-            subs: list[_MIoTLanRegisterBroadcastData] = list(
-                self._device_msg_matcher.iter_match(key))
-            for sub in subs:
-                self._main_loop.call_soon_threadsafe(
+            for sub in self._device_msg_index.match(
+                    did, 'e', msg['params']['siid'], msg['params']['eiid']):
+                self._dispatcher.dispatch(
                     sub.handler, msg['params'], sub.handler_ctx)
         else:
             _LOGGER.debug(
@@ -1348,13 +1466,10 @@ class MIoTLan:
             did=did, msg={'id': msg['id'], 'result': {'code': 0}})
 
     def __filter_dup_message(self, did: str, msg_id: int) -> bool:
-        filter_id = f'{did}.{msg_id}'
-        if filter_id in self._reply_msg_buffer:
+        filter_id = ('dup', did, msg_id)
+        if filter_id in self._timer_wheel:
             return True
-        self._reply_msg_buffer[filter_id] = self._internal_loop.call_later(
-            5,
-            lambda filter_id: self._reply_msg_buffer.pop(filter_id, None),
-            filter_id)
+        self._timer_wheel.add(filter_id, self.OT_DUP_FILTER_WINDOW)
         return False
 
     def __sendto(
@@ -1373,6 +1488,26 @@ class MIoTLan:
                 return
             sock.sendto(data, socket.MSG_DONTWAIT, (address, port))
 
+    def __send_ka_probes(self) -> None:
+        self._ka_probe_timer = None
+        quota: int = max(int(self.OT_KA_PROBE_RATE*self.OT_KA_PROBE_TICK), 1)
+        probes: list[tuple[str, str, tuple]] = []
+        for if_name in list(self._ka_probe_queues.keys()):
+            queue = self._ka_probe_queues[if_name]
+            for did in list(itertools.islice(queue, quota)):
+                probes.append((if_name, did, queue.pop(did)))
+            if not queue:
+                self._ka_probe_queues.pop(if_name)
+        for if_name, did, (target_ip, timeout, handler, state) in probes:
+            self.schedule_keep_alive(did, timeout, handler, state)
+            try:
+                self.ping(if_name=if_name, target_ip=target_ip)
+            except Exception as err:  # pylint: disable=broad-exception-caught
+                _LOGGER.error('ping device error, %s, %s', target_ip, err)
+        if self._ka_probe_queues:
+            self._ka_probe_timer = self._internal_loop.call_later(
+                self.OT_KA_PROBE_TICK, self.__send_ka_probes)
+
     def __scan_devices(self) -> None:
         if self._scan_timer:
             self._scan_timer.cancel()
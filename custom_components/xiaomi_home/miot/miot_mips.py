@@ -53,7 +53,9 @@ import re
 import ssl
 import struct
 import threading
+import time
 from abc import ABC, abstractmethod
+from collections import deque
 from dataclasses import dataclass
 from enum import Enum, auto
 from typing import Any, Callable, Optional, final, Coroutine, Dict, List
@@ -67,13 +69,21 @@ from paho.mqtt.client import (
     MQTTMessage)
 
 # pylint: disable=relative-beyond-top-level
-from .common import MIoTMatcher
+from .common import MIoTDispatchIndex, MIoTDispatcher, MIoTMatcher
 from .const import (
     UNSUPPORTED_MODELS,
     MIHOME_MQTT_KEEPALIVE,
     DEFAULT_CLOUD_BROKER_HOST
 )
-from .miot_error import MIoTErrorCode, MIoTMipsError
+from .miot_error import (
+    MIOT_RPC_REJECT_CODES,
+    MIoTErrorCode,
+    MIoTMipsError)
+
+try:  # orjson parses several times faster, it is installed with HA core
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -89,6 +99,12 @@ class _MipsMsgTypeOptions(Enum):
 
 class _MipsMessage:
     """MIoT Pub/Sub message."""
+    _HEADER: struct.Struct = struct.Struct('<IB')
+    _ID: struct.Struct = struct.Struct('<IBI')
+    _TYPE_ID: int = _MipsMsgTypeOptions.ID.value
+    _TYPE_RET_TOPIC: int = _MipsMsgTypeOptions.RET_TOPIC.value
+    _TYPE_PAYLOAD: int = _MipsMsgTypeOptions.PAYLOAD.value
+    _TYPE_FROM: int = _MipsMsgTypeOptions.FROM.value
     mid: int = 0
     msg_from: Optional[str] = None
     ret_topic: Optional[str] = None
@@ -97,30 +113,31 @@ class _MipsMessage:
     @staticmethod
     def unpack(data: bytes) -> '_MipsMessage':
         mips_msg = _MipsMessage()
-        data_len = len(data)
+        view = memoryview(data)
+        header_unpack_from = _MipsMessage._HEADER.unpack_from
+        data_len = len(view)
         data_start = 0
-        data_end = 0
         while data_start < data_len:
-            data_end = data_start+5
-            unpack_len, unpack_type = struct.unpack(
-                '<IB', data[data_start:data_end])
-            unpack_data = data[data_end:data_end+unpack_len]
+            unpack_len, unpack_type = header_unpack_from(view, data_start)
+            value_start = data_start+5
+            data_start = value_start+unpack_len
+            if unpack_type == _MipsMessage._TYPE_ID:
+                mips_msg.mid = int.from_bytes(
+                    view[value_start:data_start], byteorder='little')
+                continue
             #  string end with \x00
             match unpack_type:
-                case _MipsMsgTypeOptions.ID.value:
-                    mips_msg.mid = int.from_bytes(
-                        unpack_data, byteorder='little')
-                case _MipsMsgTypeOptions.RET_TOPIC.value:
+                case _MipsMessage._TYPE_PAYLOAD:
+                    mips_msg.payload = str(
+                        view[value_start:data_start], 'utf-8').strip('\x00')
+                case _MipsMessage._TYPE_RET_TOPIC:
                     mips_msg.ret_topic = str(
-                        unpack_data.strip(b'\x00'), 'utf-8')
-                case _MipsMsgTypeOptions.PAYLOAD.value:
-                    mips_msg.payload = str(unpack_data.strip(b'\x00'), 'utf-8')
-                case _MipsMsgTypeOptions.FROM.value:
+                        view[value_start:data_start], 'utf-8').strip('\x00')
+                case _MipsMessage._TYPE_FROM:
                     mips_msg.msg_from = str(
-                        unpack_data.strip(b'\x00'), 'utf-8')
+                        view[value_start:data_start], 'utf-8').strip('\x00')
                 case _:
                     pass
-            data_start = data_end+unpack_len
         return mips_msg
 
     @staticmethod
@@ -132,27 +149,28 @@ class _MipsMessage:
     ) -> bytes:
         if mid is None or payload is None:
             raise MIoTMipsError('invalid mid or payload')
-        pack_msg: bytes = b''
-        # mid
-        pack_msg += struct.pack('<IBI', 4, _MipsMsgTypeOptions.ID.value, mid)
+        header_pack = _MipsMessage._HEADER.pack
+        # b''.join() sizes the message once and copies each part once
+        parts: list[bytes] = [
+            _MipsMessage._ID.pack(4, _MipsMessage._TYPE_ID, mid)]
         # msg_from
         if msg_from:
-            pack_len = len(msg_from)
-            pack_msg += struct.pack(
-                f'<IB{pack_len}sx', pack_len+1,
-                _MipsMsgTypeOptions.FROM.value, msg_from.encode('utf-8'))
+            value = msg_from.encode('utf-8')
+            parts += (
+                header_pack(len(value)+1, _MipsMessage._TYPE_FROM),
+                value, b'\x00')
         # ret_topic
         if ret_topic:
-            pack_len = len(ret_topic)
-            pack_msg += struct.pack(
-                f'<IB{pack_len}sx', pack_len+1,
-                _MipsMsgTypeOptions.RET_TOPIC.value, ret_topic.encode('utf-8'))
+            value = ret_topic.encode('utf-8')
+            parts += (
+                header_pack(len(value)+1, _MipsMessage._TYPE_RET_TOPIC),
+                value, b'\x00')
         # payload
-        pack_len = len(payload)
-        pack_msg += struct.pack(
-            f'<IB{pack_len}sx', pack_len+1,
-            _MipsMsgTypeOptions.PAYLOAD.value, payload.encode('utf-8'))
-        return pack_msg
+        value = payload.encode('utf-8')
+        parts += (
+            header_pack(len(value)+1, _MipsMessage._TYPE_PAYLOAD),
+            value, b'\x00')
+        return b''.join(parts)
 
     def __str__(self) -> str:
         return f'{self.mid}, {self.msg_from}, {self.ret_topic}, {self.payload}'
@@ -167,6 +185,14 @@ class _MipsRequest:
     timer: Optional[asyncio.TimerHandle]
 
 
+@dataclass
+class _MipsGetPropItem:
+    """MIoT Pub/Sub queued get prop request."""
+    param: str
+    fut: asyncio.Future
+    timeout_ms: int
+
+
 @dataclass
 class _MipsBroadcast:
     """MIoT Pub/Sub broadcast."""
@@ -214,9 +240,54 @@ class MipsDeviceState:
     handler_ctx: Any = None
 
 
+class _MipsIoThread:
+    """MIoT Pub/Sub shared I/O thread.
+    One event loop, and its selector, drives the sockets of all clients
+    that use it. The thread stops when the last client releases it."""
+    _instance: Optional['_MipsIoThread'] = None
+    _instance_lock: threading.Lock = threading.Lock()
+    loop: asyncio.AbstractEventLoop
+    thread: threading.Thread
+    _refs: int
+
+    def __init__(self) -> None:
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever)
+        self.thread.daemon = True
+        self.thread.name = 'mips_io'
+        self._refs = 0
+
+    @staticmethod
+    def acquire() -> '_MipsIoThread':
+        with _MipsIoThread._instance_lock:
+            io_thread = _MipsIoThread._instance
+            if io_thread is None:
+                io_thread = _MipsIoThread()
+                io_thread.thread.start()
+                _MipsIoThread._instance = io_thread
+            io_thread._refs += 1
+            return io_thread
+
+    def release(self) -> None:
+        with _MipsIoThread._instance_lock:
+            self._refs -= 1
+            if self._refs > 0:
+                return
+            if _MipsIoThread._instance is self:
+                _MipsIoThread._instance = None
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    @property
+    def refs(self) -> int:
+        return self._refs
+
+
 class _MipsClient(ABC):
     """MIoT Pub/Sub client."""
     # pylint: disable=unused-argument
+    # Keepalive poll interval, if the paho keepalive state is not available
     MQTT_INTERVAL_S = 1
     MIPS_QOS: int = 2
     UINT32_MAX: int = 0xFFFFFFFF
@@ -245,6 +316,9 @@ class _MipsClient(ABC):
     _event_disconnect: asyncio.Event
     _internal_loop: asyncio.AbstractEventLoop
     _mips_thread: Optional[threading.Thread]
+    # Shared I/O thread, None if the client runs its own thread
+    _shared_io: bool
+    _mips_io: Optional[_MipsIoThread]
     _mips_reconnect_tag: bool
     _mips_reconnect_interval: float
     _mips_reconnect_timer: Optional[asyncio.TimerHandle]
@@ -252,6 +326,8 @@ class _MipsClient(ABC):
     _mips_state_sub_map_lock: threading.Lock
     _mips_sub_pending_map: dict[str, int]
     _mips_sub_pending_timer: Optional[asyncio.TimerHandle]
+    # Handler calls queued for the main loop, delivered in batches
+    _dispatcher: MIoTDispatcher
 
     def __init__(
             self,
@@ -263,7 +339,8 @@ class _MipsClient(ABC):
             ca_file: Optional[str] = None,
             cert_file: Optional[str] = None,
             key_file: Optional[str] = None,
-            loop: Optional[asyncio.AbstractEventLoop] = None
+            loop: Optional[asyncio.AbstractEventLoop] = None,
+            shared_io: bool = False
     ) -> None:
         # MUST run with running loop
         self.main_loop = loop or asyncio.get_running_loop()
@@ -287,6 +364,8 @@ class _MipsClient(ABC):
         self._event_connect = asyncio.Event()
         self._event_disconnect = asyncio.Event()
         self._mips_thread = None
+        self._shared_io = shared_io
+        self._mips_io = None
         self._mips_reconnect_tag = False
         self._mips_reconnect_interval = 0
         self._mips_reconnect_timer = None
@@ -294,6 +373,8 @@ class _MipsClient(ABC):
         self._mips_state_sub_map_lock = threading.Lock()
         self._mips_sub_pending_map = {}
         self._mips_sub_pending_timer = None
+        self._dispatcher = MIoTDispatcher(
+            loop=self.main_loop, name='mips dispatch')
         # DO NOT start the thread yet. Do that on connect
 
     @property
@@ -308,6 +389,11 @@ class _MipsClient(ABC):
     def port(self) -> int:
         return self._port
 
+    @property
+    def dispatch_stats(self) -> dict[str, int]:
+        """Main loop dispatch counters, batch size and queue depth."""
+        return self._dispatcher.stats
+
     @final
     @property
     def mips_state(self) -> bool:
@@ -325,6 +411,12 @@ class _MipsClient(ABC):
         # Start mips thread
         if self._mips_thread:
             return
+        if self._shared_io:
+            self._mips_io = _MipsIoThread.acquire()
+            self._internal_loop = self._mips_io.loop
+            self._mips_thread = self._mips_io.thread
+            self._internal_loop.call_soon_threadsafe(self.__mips_loop_init)
+            return
         self._internal_loop = asyncio.new_event_loop()
         self._mips_thread = threading.Thread(target=self.__mips_loop_thread)
         self._mips_thread.daemon = True
@@ -341,6 +433,16 @@ class _MipsClient(ABC):
         """mips disconnect."""
         if not self._mips_thread:
             return
+        if self._mips_io:
+            # The shared I/O thread keeps running for the other clients
+            disconnected = threading.Event()
+            self._internal_loop.call_soon_threadsafe(
+                self.__mips_disconnect, disconnected)
+            disconnected.wait()
+            self._mips_thread = None
+            self._mips_io.release()
+            self._mips_io = None
+            return
         self._internal_loop.call_soon_threadsafe(self.__mips_disconnect)
         self._mips_thread.join()
         self._mips_thread = None
@@ -510,6 +612,14 @@ class _MipsClient(ABC):
     @abstractmethod
     def _on_mips_disconnect(self, rc: int, props: dict) -> None: ...
 
+    @final
+    def _mips_dispatch(self, handler: Callable[..., Any], *args) -> None:
+        """Queue a handler call for the main loop, only the first call of a
+        batch wakes up the main loop, the others ride along.
+        NOTICE: Internal function, only mips threads are allowed to call
+        """
+        self._dispatcher.dispatch(handler, *args)
+
     @final
     def _mips_sub_internal(self, topic: str) -> None:
         """mips subscribe.
@@ -537,6 +647,7 @@ class _MipsClient(ABC):
             return
         try:
             result, mid = self._mqtt.unsubscribe(topic=topic)
+            self.__mqtt_register_write()
             if (result == MQTT_ERR_SUCCESS) or (result == MQTT_ERR_NO_CONN):
                 self.log_debug(
                     f'mips unsub internal success, {result}, {mid}, {topic}')
@@ -562,6 +673,7 @@ class _MipsClient(ABC):
         try:
             handle = self._mqtt.publish(
                 topic=topic, payload=payload, qos=self.MIPS_QOS)
+            self.__mqtt_register_write()
             # self.log_debug(f'_mips_publish_internal, {topic}, {payload}')
             if wait_for_publish is True:
                 handle.wait_for_publish(timeout_ms/1000.0)
@@ -583,10 +695,45 @@ class _MipsClient(ABC):
         self.__mqtt_loop_handler()
 
     def __mqtt_timer_handler(self) -> None:
-        self.__mqtt_loop_handler()
-        if self._mqtt:
+        """Keepalive timer. Socket I/O is driven by readiness, so the timer
+        only wakes up when loop_misc() has a ping to send or a ping
+        response to check."""
+        self._mqtt_timer = None
+        delay = self.__mqtt_keepalive_delay()
+        if delay <= 0:
+            self.__mqtt_loop_handler()
+            delay = self.__mqtt_keepalive_delay()
+        # The socket is gone if loop_misc() disconnected
+        if self._mqtt and self._mqtt_fd != -1:
             self._mqtt_timer = self._internal_loop.call_later(
-                self.MQTT_INTERVAL_S, self.__mqtt_timer_handler)
+                max(delay, 0), self.__mqtt_timer_handler)
+
+    def __mqtt_keepalive_delay(self) -> float:
+        """Seconds until the next keepalive deadline of paho."""
+        # pylint: disable=protected-access
+        try:
+            keepalive: int = self._mqtt._keepalive  # type: ignore
+            last_msg: float = min(
+                self._mqtt._last_msg_in,  # type: ignore
+                self._mqtt._last_msg_out)  # type: ignore
+            ping_t: float = self._mqtt._ping_t  # type: ignore
+        except AttributeError:
+            return self.MQTT_INTERVAL_S
+        if not keepalive:
+            return MIHOME_MQTT_KEEPALIVE
+        deadline = last_msg+keepalive
+        if ping_t > 0:
+            deadline = min(deadline, ping_t+keepalive)
+        # paho uses time.monotonic() for the keepalive timestamps
+        return deadline-time.monotonic()
+
+    def __mqtt_register_write(self) -> None:
+        """Flush the output of paho once the socket is writable. Called
+        after every call that queues a packet, the keepalive timer does not
+        poll the socket."""
+        if self._mqtt and self._mqtt_fd != -1 and self._mqtt.want_write():
+            self._internal_loop.add_writer(
+                self._mqtt_fd, self.__mqtt_write_handler)
 
     def __mqtt_loop_handler(self) -> None:
         try:
@@ -594,7 +741,10 @@ class _MipsClient(ABC):
             if self.main_loop.is_closed():
                 self.log_debug(
                     'The main loop is closed, stop the internal loop.')
-                if not self._internal_loop.is_closed():
+                if (
+                    self._mips_io is None
+                    and not self._internal_loop.is_closed()
+                ):
                     self._internal_loop.stop()
                 return
             if self._mqtt:
@@ -603,9 +753,7 @@ class _MipsClient(ABC):
                 self._mqtt.loop_write()
             if self._mqtt:
                 self._mqtt.loop_misc()
-            if self._mqtt and self._mqtt.want_write():
-                self._internal_loop.add_writer(
-                    self._mqtt_fd, self.__mqtt_write_handler)
+            self.__mqtt_register_write()
         except Exception as err:  # pylint: disable=broad-exception-caught
             # Catch all exception
             self.log_error(f'__mqtt_loop_handler, {err}')
@@ -613,6 +761,12 @@ class _MipsClient(ABC):
 
     def __mips_loop_thread(self) -> None:
         self.log_info('mips_loop_thread start')
+        self.__mips_loop_init()
+        # Run event loop
+        self._internal_loop.run_forever()
+        self.log_info('mips_loop_thread exit!')
+
+    def __mips_loop_init(self) -> None:
         # mqtt init for API_VERSION2,
         # callback_api_version=CallbackAPIVersion.VERSION2,
         self._mqtt = Client(client_id=self._client_id, protocol=MQTTv5)
@@ -640,9 +794,6 @@ class _MipsClient(ABC):
         self._mqtt.on_message = self.__on_message
         # Connect to mips
         self.__mips_start_connect_tries()
-        # Run event loop
-        self._internal_loop.run_forever()
-        self.log_info('mips_loop_thread exit!')
 
     def __on_connect(self, client, user_data, flags, rc, props) -> None:
         if not self._mqtt:
@@ -746,6 +897,7 @@ class _MipsClient(ABC):
             self._mips_sub_pending_map[topic] = count+1
             self.log_error(
                 f'retry mips sub internal, {count}, {topic}, {result}, {mid}')
+        self.__mqtt_register_write()
 
         if len(self._mips_sub_pending_map):
             self._mips_sub_pending_timer = self._internal_loop.call_later(
@@ -789,11 +941,10 @@ class _MipsClient(ABC):
             self.log_debug(f'__mips_connect, _mqtt_fd, {self._mqtt_fd}')
             self._internal_loop.add_reader(
                 self._mqtt_fd, self.__mqtt_read_handler)
-            if self._mqtt.want_write():
-                self._internal_loop.add_writer(
-                    self._mqtt_fd, self.__mqtt_write_handler)
+            self.__mqtt_register_write()
             self._mqtt_timer = self._internal_loop.call_later(
-                self.MQTT_INTERVAL_S, self.__mqtt_timer_handler)
+                max(self.__mqtt_keepalive_delay(), 0),
+                self.__mqtt_timer_handler)
         else:
             self.log_error(f'__mips_connect error result, {result}')
             self.__mips_try_reconnect()
@@ -816,7 +967,9 @@ class _MipsClient(ABC):
         self._mips_reconnect_tag = True
         self.__mips_try_reconnect(immediately=True)
 
-    def __mips_disconnect(self) -> None:
+    def __mips_disconnect(
+        self, disconnected: Optional[threading.Event] = None
+    ) -> None:
         self._mips_reconnect_tag = False
         if self._mips_reconnect_timer:
             self._mips_reconnect_timer.cancel()
@@ -836,6 +989,9 @@ class _MipsClient(ABC):
         if self._mqtt:
             self._mqtt.disconnect()
             self._mqtt = None
+        if disconnected:
+            disconnected.set()
+            return
         self._internal_loop.stop()
 
     def __get_next_reconnect_time(self) -> float:
@@ -856,22 +1012,28 @@ class MipsCloudClient(_MipsClient):
     # pylint: disable=unused-argument
     # pylint: disable=inconsistent-quotes
     _msg_matcher: MIoTMatcher
+    # Property and event broadcasts, {(did, kind, siid, iid): broadcast}
+    _msg_index: MIoTDispatchIndex
 
     def __init__(
             self, uuid: str, cloud_server: str, app_id: str,
             token: str, port: int = 8883,
-            loop: Optional[asyncio.AbstractEventLoop] = None
+            loop: Optional[asyncio.AbstractEventLoop] = None,
+            shared_io: bool = False
     ) -> None:
         self._msg_matcher = MIoTMatcher()
+        self._msg_index = MIoTDispatchIndex()
         super().__init__(
             client_id=f'ha.{uuid}',
             host=f'{cloud_server}-{DEFAULT_CLOUD_BROKER_HOST}',
-            port=port, username=app_id, password=token, loop=loop)
+            port=port, username=app_id, password=token, loop=loop,
+            shared_io=shared_io)
 
     @final
     def disconnect(self) -> None:
         super().disconnect()
         self._msg_matcher = MIoTMatcher()
+        self._msg_index = MIoTDispatchIndex()
 
     def update_access_token(self, access_token: str) -> bool:
         if not isinstance(access_token, str):
@@ -895,25 +1057,20 @@ class MipsCloudClient(_MipsClient):
             f'device/{did}/up/properties_changed/'
             f'{"#" if siid is None or piid is None else f"{siid}/{piid}"}')
 
-        def on_prop_msg(topic: str, payload: str, ctx: Any) -> None:
-            try:
-                msg: dict = json.loads(payload)
-            except json.JSONDecodeError:
-                self.log_error(
-                    f'on_prop_msg, invalid msg, {topic}, {payload}')
-                return
+        def on_prop_msg(topic: str, msg: Any, ctx: Any) -> None:
+            # Runs in the mips thread, msg is parsed
+            params = msg.get('params', None) if isinstance(msg, dict) else None
             if (
-                not isinstance(msg.get('params', None), dict)
-                or 'siid' not in msg['params']
-                or 'piid' not in msg['params']
-                or 'value' not in msg['params']
+                not isinstance(params, dict)
+                or 'siid' not in params
+                or 'piid' not in params
+                or 'value' not in params
             ):
-                self.log_error(
-                    f'on_prop_msg, invalid msg, {topic}, {payload}')
+                self.log_error(f'on_prop_msg, invalid msg, {topic}, {msg}')
                 return
             if handler:
-                self.log_debug('on properties_changed, %s', payload)
-                handler(msg['params'], ctx)
+                self.log_debug('on properties_changed, %s', msg)
+                self._mips_dispatch(handler, params, ctx)
         return self.__reg_broadcast_external(
             topic=topic, handler=on_prop_msg, handler_ctx=handler_ctx)
 
@@ -947,26 +1104,21 @@ class MipsCloudClient(_MipsClient):
             f'device/{did}/up/event_occured/'
             f'{"#" if siid is None or eiid is None else f"{siid}/{eiid}"}')
 
-        def on_event_msg(topic: str, payload: str, ctx: Any) -> None:
-            try:
-                msg: dict = json.loads(payload)
-            except json.JSONDecodeError:
-                self.log_error(
-                    f'on_event_msg, invalid msg, {topic}, {payload}')
-                return
+        def on_event_msg(topic: str, msg: Any, ctx: Any) -> None:
+            # Runs in the mips thread, msg is parsed
+            params = msg.get('params', None) if isinstance(msg, dict) else None
             if (
-                not isinstance(msg.get('params', None), dict)
-                or 'siid' not in msg['params']
-                or 'eiid' not in msg['params']
-                or 'arguments' not in msg['params']
+                not isinstance(params, dict)
+                or 'siid' not in params
+                or 'eiid' not in params
+                or 'arguments' not in params
             ):
-                self.log_error(
-                    f'on_event_msg, invalid msg, {topic}, {payload}')
+                self.log_error(f'on_event_msg, invalid msg, {topic}, {msg}')
                 return
             if handler:
-                self.log_debug('on on_event_msg, %s', payload)
-                msg['params']['from'] = 'cloud'
-                handler(msg['params'], ctx)
+                self.log_debug('on on_event_msg, %s', msg)
+                params['from'] = 'cloud'
+                self._mips_dispatch(handler, params, ctx)
         return self.__reg_broadcast_external(
             topic=topic, handler=on_event_msg, handler_ctx=handler_ctx)
 
@@ -1067,7 +1219,15 @@ class MipsCloudClient(_MipsClient):
         self, topic: str, handler: Callable[[str, str, Any], None],
         handler_ctx: Any = None
     ) -> None:
-        if not self._msg_matcher.get(topic=topic):
+        key = self.__topic_key(topic=topic)
+        if key:
+            if not self._msg_index.get(key):
+                self._msg_index[key] = _MipsBroadcast(
+                    topic=topic, handler=handler, handler_ctx=handler_ctx)
+                self._mips_sub_internal(topic=topic)
+            else:
+                self.log_debug(f'mips cloud re-reg broadcast, {topic}')
+        elif not self._msg_matcher.get(topic=topic):
             sub_bc: _MipsBroadcast = _MipsBroadcast(
                 topic=topic, handler=handler,
                 handler_ctx=handler_ctx)
@@ -1077,15 +1237,44 @@ class MipsCloudClient(_MipsClient):
             self.log_debug(f'mips cloud re-reg broadcast, {topic}')
 
     def __unreg_broadcast(self, topic: str) -> None:
-        if self._msg_matcher.get(topic=topic):
+        key = self.__topic_key(topic=topic)
+        if key:
+            if self._msg_index.pop(key):
+                self._mips_unsub_internal(topic=topic)
+        elif self._msg_matcher.get(topic=topic):
             del self._msg_matcher[topic]
             self._mips_unsub_internal(topic=topic)
 
+    @staticmethod
+    def __topic_key(topic: str) -> Optional[tuple]:
+        """Dispatch key of the property and event topics,
+        device/{did}/up/properties_changed/{siid}/{piid} and
+        device/{did}/up/event_occured/{siid}/{eiid}, topic strings are kept
+        in the key. Topics without the two ids, like
+        device/{did}/up/properties_changed, only match the wildcard
+        subscription of the device, as the MQTT '#' does."""
+        strs = topic.split('/')
+        if (
+            len(strs) not in (4, 5, 6) or strs[0] != 'device'
+            or strs[2] != 'up'
+        ):
+            return None
+        kind = (
+            'p' if strs[3] == 'properties_changed'
+            else 'e' if strs[3] == 'event_occured' else None)
+        if kind is None:
+            return None
+        if len(strs) == 6:
+            return (strs[1], kind, strs[4], strs[5])
+        return (strs[1], kind, None, None)
+
     def _on_mips_connect(self, rc: int, props: dict) -> None:
         """sub topic."""
         for topic, _ in list(
                 self._msg_matcher.iter_all_nodes()):
             self._mips_sub_internal(topic=topic)
+        for _, sub_bc in self._msg_index.items():
+            self._mips_sub_internal(topic=sub_bc.topic)
 
     def _on_mips_disconnect(self, rc: int, props: dict) -> None:
         """unsub topic."""
@@ -1096,18 +1285,32 @@ class MipsCloudClient(_MipsClient):
         NOTICE thread safe, this function will be called at the **mips** thread
         """
         # broadcast
-        bc_list: list[_MipsBroadcast] = list(
-            self._msg_matcher.iter_match(topic))
+        key = self.__topic_key(topic=topic)
+        bc_list: list[_MipsBroadcast] = (
+            self._msg_index.match(*key) if key
+            else list(self._msg_matcher.iter_match(topic)))
         if not bc_list:
             return
         # The message from the cloud is not packed.
+        if key:
+            # Property and event payloads are parsed and validated here,
+            # the handlers queue the results for the main loop
+            try:
+                msg: Any = json_loads(payload)
+            except ValueError:
+                self.log_error(f'mips cloud, invalid msg, {topic}, {payload}')
+                return
+            for item in bc_list:
+                if item.handler is None:
+                    continue
+                item.handler(topic, msg, item.handler_ctx)
+            return
         payload_str: str = payload.decode('utf-8')
         # self.log_debug(f"on broadcast, {topic}, {payload}")
         for item in bc_list or []:
             if item.handler is None:
                 continue
-            # NOTICE: call threadsafe
-            self.main_loop.call_soon_threadsafe(
+            self._mips_dispatch(
                 item.handler, topic, payload_str, item.handler_ctx)
 
 
@@ -1119,6 +1322,8 @@ class MipsLocalClient(_MipsClient):
     MIPS_RECONNECT_INTERVAL_MAX: float = 60
     MIPS_SUB_PATCH: int = 1000
     MIPS_SUB_INTERVAL: float = 0.1
+    # Gateway get prop requests in flight, one per device at most
+    MIPS_GET_PROP_INFLIGHT_MAX: int = 8
     _did: str
     _group_id: str
     _home_name: str
@@ -1127,15 +1332,25 @@ class MipsLocalClient(_MipsClient):
     _dev_list_change_topic: str
     _request_map: dict[str, _MipsRequest]
     _msg_matcher: MIoTMatcher
-    _get_prop_queue: dict[str, list]
-    _get_prop_timer: Optional[asyncio.TimerHandle]
+    # Property and event broadcasts, {(did, kind, siid, iid): broadcast}
+    _msg_index: MIoTDispatchIndex
+    # Pending get prop requests per device, FIFO
+    _get_prop_queue: dict[str, deque[_MipsGetPropItem]]
+    # Devices with pending requests and nothing in flight, round robin
+    _get_prop_ready: deque[str]
+    _get_prop_inflight: set[str]
+    _get_prop_depth: int
+    # Smoothed round trip time of the gateway
+    _get_prop_srtt: Optional[float]
+    _get_prop_stats: dict[str, int]
     _on_dev_list_changed: Optional[Callable[[Any, list[str]], Coroutine]]
 
     def __init__(
         self, did: str, host: str, group_id: str,
         ca_file: str, cert_file: str, key_file: str,
         port: int = 8883, home_name: str = '',
-        loop: Optional[asyncio.AbstractEventLoop] = None
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+        shared_io: bool = False
     ) -> None:
         self._did = did
         self._group_id = group_id
@@ -1145,18 +1360,38 @@ class MipsLocalClient(_MipsClient):
         self._dev_list_change_topic = f'{did}/appMsg/devListChange'
         self._request_map = {}
         self._msg_matcher = MIoTMatcher()
+        self._msg_index = MIoTDispatchIndex()
         self._get_prop_queue = {}
-        self._get_prop_timer = None
+        self._get_prop_ready = deque()
+        self._get_prop_inflight = set()
+        self._get_prop_depth = 0
+        self._get_prop_srtt = None
+        self._get_prop_stats = {
+            'requests': 0, 'timeouts': 0, 'max_in_flight': 0,
+            'max_queue_depth': 0}
         self._on_dev_list_changed = None
 
         super().__init__(
             client_id=did, host=host, port=port,
-            ca_file=ca_file, cert_file=cert_file, key_file=key_file, loop=loop)
+            ca_file=ca_file, cert_file=cert_file, key_file=key_file, loop=loop,
+            shared_io=shared_io)
 
     @property
     def group_id(self) -> str:
         return self._group_id
 
+    @property
+    def get_prop_stats(self) -> dict[str, Any]:
+        """Queued get prop requests, in flight, queue depth and the
+        smoothed gateway round trip time."""
+        return {
+            **self._get_prop_stats,
+            'in_flight': len(self._get_prop_inflight),
+            'queue_depth': self._get_prop_depth,
+            'srtt_ms': (
+                None if self._get_prop_srtt is None
+                else round(self._get_prop_srtt*1000, 1))}
+
     def log_debug(self, msg, *args, **kwargs) -> None:
         if self._logger:
             self._logger.debug(f'{self._home_name}, '+msg, *args, **kwargs)
@@ -1179,6 +1414,7 @@ class MipsLocalClient(_MipsClient):
         super().disconnect()
         self._request_map = {}
         self._msg_matcher = MIoTMatcher()
+        self._msg_index = MIoTDispatchIndex()
 
     @final
     def sub_prop(
@@ -1193,20 +1429,20 @@ class MipsLocalClient(_MipsClient):
             f'appMsg/notify/iot/{did}/property/'
             f'{"#" if siid is None or piid is None else f"{siid}.{piid}"}')
 
-        def on_prop_msg(topic: str, payload: str, ctx: Any):
-            msg: dict = json.loads(payload)
+        def on_prop_msg(topic: str, msg: Any, ctx: Any):
+            # Runs in the mips thread, msg is parsed
             if (
-                msg is None
+                not isinstance(msg, dict)
                 or 'did' not in msg
                 or 'siid' not in msg
                 or 'piid' not in msg
                 or 'value' not in msg
             ):
-                self.log_info('unknown prop msg, %s', payload)
+                self.log_info('unknown prop msg, %s', msg)
                 return
             if handler:
-                self.log_debug('local, on properties_changed, %s', payload)
-                handler(msg, ctx)
+                self.log_debug('local, on properties_changed, %s', msg)
+                self._mips_dispatch(handler, msg, ctx)
         return self.__reg_broadcast_external(
             topic=topic, handler=on_prop_msg, handler_ctx=handler_ctx)
 
@@ -1235,23 +1471,23 @@ class MipsLocalClient(_MipsClient):
             f'appMsg/notify/iot/{did}/event/'
             f'{"#" if siid is None or eiid is None else f"{siid}.{eiid}"}')
 
-        def on_event_msg(topic: str, payload: str, ctx: Any):
-            msg: dict = json.loads(payload)
+        def on_event_msg(topic: str, msg: Any, ctx: Any):
+            # Runs in the mips thread, msg is parsed
             if (
-                msg is None
+                not isinstance(msg, dict)
                 or 'did' not in msg
                 or 'siid' not in msg
                 or 'eiid' not in msg
                 # or 'arguments' not in msg
             ):
-                self.log_info('unknown event msg, %s', payload)
+                self.log_info('unknown event msg, %s', msg)
                 return
             if 'arguments' not in msg:
-                self.log_info('wrong event msg, %s', payload)
+                self.log_info('wrong event msg, %s', msg)
                 msg['arguments'] = []
             if handler:
-                self.log_debug('local, on event_occurred, %s', payload)
-                handler(msg, ctx)
+                self.log_debug('local, on event_occurred, %s', msg)
+                self._mips_dispatch(handler, msg, ctx)
         return self.__reg_broadcast_external(
             topic=topic, handler=on_event_msg, handler_ctx=handler_ctx)
 
@@ -1271,22 +1507,27 @@ class MipsLocalClient(_MipsClient):
     async def get_prop_safe_async(
         self, did: str, siid: int, piid: int, timeout_ms: int = 10000
     ) -> Any:
-        self._get_prop_queue.setdefault(did, [])
+        """Get prop through the gateway request queue. Requests of different
+        devices are pipelined, a device has one request in flight at most."""
         fut: asyncio.Future = self.main_loop.create_future()
-        self._get_prop_queue[did].append({
-            'param': json.dumps({
+        queue = self._get_prop_queue.get(did, None)
+        if queue is None:
+            queue = deque()
+            self._get_prop_queue[did] = queue
+            if did not in self._get_prop_inflight:
+                self._get_prop_ready.append(did)
+        queue.append(_MipsGetPropItem(
+            param=json.dumps({
                 'did': did,
                 'siid': siid,
                 'piid': piid
             }),
-            'fut': fut,
-            'timeout_ms': timeout_ms
-        })
-        if self._get_prop_timer is None:
-            self._get_prop_timer = self.main_loop.call_later(
-                0.1,
-                self.main_loop.create_task,
-                self.__get_prop_timer_handle())
+            fut=fut,
+            timeout_ms=timeout_ms))
+        self._get_prop_depth += 1
+        if self._get_prop_depth > self._get_prop_stats['max_queue_depth']:
+            self._get_prop_stats['max_queue_depth'] = self._get_prop_depth
+        self.__get_prop_schedule()
         return await fut
 
     @final
@@ -1305,6 +1546,52 @@ class MipsLocalClient(_MipsClient):
             return None
         return result_obj['value']
 
+    @final
+    async def get_props_async(
+        self, did: str, props_list: List[Dict[str, Any]],
+        timeout_ms: int = 10000
+    ) -> List[Dict[str, Any]]:
+        # props_list = [{'siid': siid, 'piid': piid}......]
+        payload_obj: dict = {
+            'did': did,
+            'rpc': {
+                'id': self.__gen_mips_id,
+                'method': 'get_properties',
+                'params': [{
+                    'did': did, 'siid': prop['siid'], 'piid': prop['piid']}
+                    for prop in props_list]
+            }
+        }
+        result_obj = await self.__request_async(
+            topic='proxy/rpcReq',
+            payload=json.dumps(payload_obj),
+            timeout_ms=timeout_ms)
+        if (
+            isinstance(result_obj, dict)
+            and isinstance(result_obj.get('result', None), list)
+            and len(result_obj['result']) == len(props_list)
+        ):
+            return result_obj['result']
+        if (
+            isinstance(result_obj, dict)
+            and isinstance(result_obj.get('error', None), dict)
+            and result_obj['error'].get('code', None)
+            == MIoTErrorCode.CODE_TIMEOUT.value
+        ):
+            raise MIoTMipsError('timeout', MIoTErrorCode.CODE_TIMEOUT)
+        if (
+            isinstance(result_obj, dict)
+            and isinstance(result_obj.get('error', None), dict)
+            and result_obj['error'].get('code', None)
+            in MIOT_RPC_REJECT_CODES
+        ):
+            raise MIoTMipsError(
+                f'request rejected, {result_obj}',
+                MIoTErrorCode.CODE_INVALID_PARAMS)
+        raise MIoTMipsError(
+            f'invalid result, {result_obj}',
+            MIoTErrorCode.CODE_MIPS_INVALID_RESULT)
+
     @final
     async def set_prop_async(
         self, did: str, siid: int, piid: int, value: Any,
@@ -1514,7 +1801,16 @@ class MipsLocalClient(_MipsClient):
         handler_ctx: Any
     ) -> None:
         sub_topic: str = f'{self._did}/{topic}'
-        if not self._msg_matcher.get(sub_topic):
+        key = self.__topic_key(topic=sub_topic)
+        if key:
+            if not self._msg_index.get(key):
+                self._msg_index[key] = _MipsBroadcast(
+                    topic=sub_topic, handler=handler,
+                    handler_ctx=handler_ctx)
+                self._mips_sub_internal(topic=f'master/{topic}')
+            else:
+                self.log_debug(f'mips re-reg broadcast, {sub_topic}')
+        elif not self._msg_matcher.get(sub_topic):
             sub_bc: _MipsBroadcast = _MipsBroadcast(
                 topic=sub_topic, handler=handler,
                 handler_ctx=handler_ctx)
@@ -1526,11 +1822,38 @@ class MipsLocalClient(_MipsClient):
     def __unreg_broadcast(self, topic) -> None:
         # Central hub gateway needs to add prefix
         unsub_topic: str = f'{self._did}/{topic}'
-        if self._msg_matcher.get(unsub_topic):
+        key = self.__topic_key(topic=unsub_topic)
+        if key:
+            if self._msg_index.pop(key):
+                self._mips_unsub_internal(topic=f'master/{topic}')
+        elif self._msg_matcher.get(unsub_topic):
             del self._msg_matcher[unsub_topic]
             self._mips_unsub_internal(
                 topic=re.sub(f'^{self._did}', 'master', unsub_topic))
 
+    def __topic_key(self, topic: str) -> Optional[tuple]:
+        """Dispatch key of the property and event topics,
+        {gw did}/appMsg/notify/iot/{did}/property/{siid}.{piid} and
+        {gw did}/appMsg/notify/iot/{did}/event/{siid}.{eiid}, topic strings
+        are kept in the key."""
+        strs = topic.split('/')
+        if (
+            len(strs) != 7 or strs[0] != self._did or strs[1] != 'appMsg'
+            or strs[2] != 'notify' or strs[3] != 'iot'
+        ):
+            return None
+        kind = (
+            'p' if strs[5] == 'property'
+            else 'e' if strs[5] == 'event' else None)
+        if kind is None:
+            return None
+        if strs[6] == '#':
+            return (strs[4], kind, None, None)
+        siid, _, iid = strs[6].partition('.')
+        if not iid:
+            return None
+        return (strs[4], kind, siid, iid)
+
     @final
     def _on_mips_connect(self, rc: int, props: dict) -> None:
         self.log_debug('__on_mips_connect_handler')
@@ -1544,6 +1867,9 @@ class MipsLocalClient(_MipsClient):
         for topic, _ in list(self._msg_matcher.iter_all_nodes()):
             self._mips_sub_internal(
                 topic=re.sub(f'^{self._did}', 'master', topic))
+        for _, sub_bc in self._msg_index.items():
+            self._mips_sub_internal(
+                topic=re.sub(f'^{self._did}', 'master', sub_bc.topic))
 
     @final
     def _on_mips_disconnect(self, rc: int, props: dict) -> None:
@@ -1569,14 +1895,31 @@ class MipsLocalClient(_MipsClient):
                         req.on_reply_ctx)
             return
         # Broadcast
-        bc_list: list[_MipsBroadcast] = list(self._msg_matcher.iter_match(
-            topic=topic))
+        key = self.__topic_key(topic=topic)
+        bc_list: list[_MipsBroadcast] = (
+            self._msg_index.match(*key) if key
+            else list(self._msg_matcher.iter_match(topic=topic)))
         if bc_list:
             self.log_debug(f'on broadcast, {topic}, {mips_msg}')
+            if key:
+                # Property and event payloads are parsed and validated here,
+                # the handlers queue the results for the main loop
+                try:
+                    msg: Any = json_loads(mips_msg.payload or '{}')
+                except ValueError:
+                    self.log_error(
+                        f'mips local, invalid msg, {topic}, {mips_msg}')
+                    return
+                for item in bc_list:
+                    if item.handler is None:
+                        continue
+                    item.handler(
+                        topic[topic.find('/')+1:], msg, item.handler_ctx)
+                return
             for item in bc_list or []:
                 if item.handler is None:
                     continue
-                self.main_loop.call_soon_threadsafe(
+                self._mips_dispatch(
                     item.handler, topic[topic.find('/')+1:],
                     mips_msg.payload or '{}', item.handler_ctx)
             return
@@ -1674,25 +2017,66 @@ class MipsLocalClient(_MipsClient):
                 'code': MIoTErrorCode.CODE_MIPS_INVALID_RESULT.value,
                 'message': f'Error: {result}'}
 
-    async def __get_prop_timer_handle(self) -> None:
-        for did in list(self._get_prop_queue.keys()):
-            item = self._get_prop_queue[did].pop()
-            _LOGGER.debug('get prop, %s, %s', did, item)
+    def __get_prop_schedule(self) -> None:
+        while (
+            self._get_prop_ready
+            and len(self._get_prop_inflight) < self.MIPS_GET_PROP_INFLIGHT_MAX
+        ):
+            did = self._get_prop_ready.popleft()
+            queue = self._get_prop_queue[did]
+            item = queue.popleft()
+            self._get_prop_depth -= 1
+            if not queue:
+                self._get_prop_queue.pop(did, None)
+            if item.fut.done():
+                # Cancelled by the caller
+                if did in self._get_prop_queue:
+                    self._get_prop_ready.append(did)
+                continue
+            self._get_prop_inflight.add(did)
+            self.main_loop.create_task(self.__get_prop_async(did, item))
+        in_flight = len(self._get_prop_inflight)
+        if in_flight > self._get_prop_stats['max_in_flight']:
+            self._get_prop_stats['max_in_flight'] = in_flight
+
+    async def __get_prop_async(
+        self, did: str, item: _MipsGetPropItem
+    ) -> None:
+        _LOGGER.debug('get prop, %s, %s', did, item.param)
+        start_ts = self.main_loop.time()
+        try:
+            # Slow devices answer in seconds, the timeout of the caller is
+            # the deadline, the rtt estimate is only reported
             result_obj = await self.__request_async(
                 topic='proxy/get',
-                payload=item['param'],
-                timeout_ms=item['timeout_ms'])
-            if result_obj is None or 'value' not in result_obj:
-                item['fut'].set_result(None)
-            else:
-                item['fut'].set_result(result_obj['value'])
-
-            if not self._get_prop_queue[did]:
-                self._get_prop_queue.pop(did, None)
-
-        if self._get_prop_queue:
-            self._get_prop_timer = self.main_loop.call_later(
-                0.1, lambda: self.main_loop.create_task(
-                    self.__get_prop_timer_handle()))
+                payload=item.param,
+                timeout_ms=item.timeout_ms)
+            if not isinstance(result_obj, dict):
+                result_obj = {}
+            error = result_obj.get('error', None)
+            self.__get_prop_record(
+                rtt=self.main_loop.time()-start_ts,
+                timeout=(
+                    isinstance(error, dict)
+                    and error.get('code', None)
+                    == MIoTErrorCode.CODE_TIMEOUT.value))
+            if not item.fut.done():
+                item.fut.set_result(result_obj.get('value', None))
+        except Exception as err:  # pylint: disable=broad-exception-caught
+            if not item.fut.done():
+                item.fut.set_exception(err)
+        finally:
+            self._get_prop_inflight.discard(did)
+            if did in self._get_prop_queue:
+                self._get_prop_ready.append(did)
+            self.__get_prop_schedule()
+
+    def __get_prop_record(self, rtt: float, timeout: bool) -> None:
+        self._get_prop_stats['requests'] += 1
+        if timeout:
+            self._get_prop_stats['timeouts'] += 1
+            return
+        if self._get_prop_srtt is None:
+            self._get_prop_srtt = rtt
         else:
-            self._get_prop_timer = None
+            self._get_prop_srtt += 0.125*(rtt-self._get_prop_srtt)
@@ -0,0 +1,798 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (C) 2024 Xiaomi Corporation.
+
+The ownership and intellectual property rights of Xiaomi Home Assistant
+Integration and related Xiaomi cloud service API interface provided under this
+license, including source code and object code (collectively, "Licensed Work"),
+are owned by Xiaomi. Subject to the terms and conditions of this License, Xiaomi
+hereby grants you a personal, limited, non-exclusive, non-transferable,
+non-sublicensable, and royalty-free license to reproduce, use, modify, and
+distribute the Licensed Work only for your use of Home Assistant for
+non-commercial purposes. For the avoidance of doubt, Xiaomi does not authorize
+you to use the Licensed Work for any other purpose, including but not limited
+to use Licensed Work to develop applications (APP), Web services, and other
+forms of software.
+
+You may reproduce and distribute copies of the Licensed Work, with or without
+modifications, whether in source or object form, provided that you must give
+any other recipients of the Licensed Work a copy of this License and retain all
+copyright and disclaimers.
+
+Xiaomi provides the Licensed Work on an "AS IS" BASIS, WITHOUT WARRANTIES OR
+CONDITIONS OF ANY KIND, either express or implied, including, without
+limitation, any warranties, undertakes, or conditions of TITLE, NO ERROR OR
+OMISSION, CONTINUITY, RELIABILITY, NON-INFRINGEMENT, MERCHANTABILITY, or
+FITNESS FOR A PARTICULAR PURPOSE. In any event, you are solely responsible
+for any direct, indirect, special, incidental, or consequential damages or
+losses arising from the use or inability to use the Licensed Work.
+
+Xiaomi reserves all rights not expressly granted to you in this License.
+Except for the rights expressly granted by Xiaomi under this License, Xiaomi
+does not authorize you in any form to use the trademarks, copyrights, or other
+forms of intellectual property rights of Xiaomi and its affiliates, including,
+without limitation, without obtaining other written permission from Xiaomi, you
+shall not use "Xiaomi", "Mijia" and other words related to Xiaomi or words that
+may make the public associate with Xiaomi in any form to publicize or promote
+the software or hardware devices that use the Licensed Work.
+
+Xiaomi has the right to immediately terminate all your authorization under this
+License in the event:
+1. You assert patent invalidation, litigation, or other claims against patents
+or other intellectual property rights of Xiaomi or its affiliates; or,
+2. You make, have made, manufacture, sell, or offer to sell products that knock
+off Xiaomi or its affiliates' products.
+
+MIoT device property shadow, writes and refresh.
+"""
+import asyncio
+import json
+import logging
+import time
+import traceback
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import Any, Callable, Coroutine, Optional
+
+# pylint: disable=relative-beyond-top-level
+from .miot_error import MIoTClientError, MIoTError, MIoTErrorCode
+from .miot_lan import MIoTLan
+from .miot_storage import MIoTStorage
+
+_LOGGER = logging.getLogger(__name__)
+
+
+REFRESH_PROPS_DELAY = 0.2
+REFRESH_PROPS_RETRY_DELAY = 3
+REFRESH_PROPS_RETRY_MAX = 3
+# A lower priority level waits this long before it beats a higher one
+REFRESH_PROPS_AGING_S = 5
+# {route: (concurrency, requests per second)}, gw is per gateway
+REFRESH_PROPS_ROUTE_LIMITS: dict[str, tuple[int, float]] = {
+    'cloud': (2, 5),
+    'gw': (8, 20),
+    'lan': (8, 20)
+}
+# Max properties of a cloud get_properties request
+REFRESH_PROPS_CLOUD_BATCH = 150
+# LAN header, AES padding and the get_properties envelope
+REFRESH_PROPS_BATCH_OVERHEAD = 160
+# A model rejecting batched reads is read one by one for this long
+REFRESH_PROPS_SINGLE_MODEL_TTL = 3600*6
+# Max age of a value restored from the property snapshot
+PROP_SNAPSHOT_MAX_AGE = 3600*24
+
+
+@dataclass
+class MIoTPropShadow:
+    """Last known value of a device property."""
+    value: Any
+    # Unix timestamp of the last report
+    ts: float
+    # Report source, cloud, lan, a gateway group_id, snapshot or None
+    source: Optional[str]
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.ts
+
+
+class MIoTPropShadowTable:
+    """Last known property values of the devices.
+
+    Unchanged reports only renew the age of a value. The table is saved as
+    a snapshot, values restored from it have the source 'snapshot' until
+    they are reported again.
+    """
+    _storage: MIoTStorage
+    # Snapshot name, {uid}_{cloud_server}
+    _name: str
+    # {(did, siid, piid): shadow}
+    _shadow: dict[tuple[str, int, int], MIoTPropShadow]
+    _delivered: int
+    _suppressed: int
+    # Restored values younger than this are not refreshed
+    _snapshot_ttl: int
+    _dirty: bool
+
+    def __init__(
+        self, storage: MIoTStorage, name: str, snapshot_ttl: int
+    ) -> None:
+        self._storage = storage
+        self._name = name
+        self._shadow = {}
+        self._delivered = 0
+        self._suppressed = 0
+        self._snapshot_ttl = snapshot_ttl
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self._shadow)
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {
+            'length': len(self._shadow),
+            'delivered': self._delivered,
+            'suppressed': self._suppressed}
+
+    def get(self, did: str, siid: int, piid: int) -> Optional[MIoTPropShadow]:
+        return self._shadow.get((did, siid, piid), None)
+
+    def update(
+        self, did: str, siid: int, piid: int, value: Any, source: str
+    ) -> bool:
+        """Record a reported value, return False if it is unchanged."""
+        key = (did, siid, piid)
+        shadow = self._shadow.get(key, None)
+        self._dirty = True
+        if (
+            shadow
+            and type(shadow.value) is type(value)
+            and shadow.value == value
+        ):
+            # Duplicate report or unchanged refresh, only renew the age
+            shadow.ts = time.time()
+            shadow.source = source
+            self._suppressed += 1
+            return False
+        self._shadow[key] = MIoTPropShadow(
+            value=value, ts=time.time(), source=source)
+        self._delivered += 1
+        return True
+
+    def set(self, did: str, siid: int, piid: int, value: Any) -> None:
+        """Record a written value."""
+        # Keep the written value, a later report of the previous value
+        # must not be dropped as unchanged
+        self._shadow[(did, siid, piid)] = MIoTPropShadow(
+            value=value, ts=time.time(), source=None)
+        self._dirty = True
+
+    def fresh_restored(self, did: str, siid: int, piid: int) -> bool:
+        """Whether the value was restored from the snapshot and is younger
+        than the snapshot ttl, there is no need to refresh it."""
+        shadow = self._shadow.get((did, siid, piid), None)
+        return bool(
+            shadow and shadow.source == 'snapshot'
+            and shadow.age < self._snapshot_ttl)
+
+    def remove_device(self, did: str) -> None:
+        for key in [key for key in self._shadow if key[0] == did]:
+            self._shadow.pop(key, None)
+            self._dirty = True
+
+    async def load_async(self, dids: Any) -> int:
+        """Restore the values of the devices in dids saved less than
+        PROP_SNAPSHOT_MAX_AGE ago, return the number of values restored."""
+        snapshot: Optional[dict] = await self._storage.load_async(
+            domain='miot_props', name=self._name,
+            type_=dict)  # type: ignore
+        if not snapshot or not isinstance(snapshot.get('props', None), dict):
+            return 0
+        expire_ts = time.time() - PROP_SNAPSHOT_MAX_AGE
+        count: int = 0
+        for did, props in snapshot['props'].items():
+            if did not in dids or not isinstance(props, list):
+                continue
+            for item in props:
+                # [siid, piid, value, ts], skip malformed records
+                if (
+                    not isinstance(item, list) or len(item) != 4
+                    or not isinstance(item[0], int)
+                    or not isinstance(item[1], int)
+                    or not isinstance(item[3], (int, float))
+                ):
+                    continue
+                siid, piid, value, ts = item
+                if ts < expire_ts:
+                    continue
+                self._shadow[(did, siid, piid)] = MIoTPropShadow(
+                    value=value, ts=ts, source='snapshot')
+                count += 1
+        _LOGGER.info(
+            'load prop snapshot, %d props, saved at %s',
+            count, snapshot.get('ts', None))
+        return count
+
+    async def save_async(self) -> bool:
+        """Save the snapshot if a value changed since the last save."""
+        if not self._dirty:
+            return True
+        self._dirty = False
+        props: dict[str, list] = {}
+        for (did, siid, piid), shadow in self._shadow.items():
+            props.setdefault(did, []).append(
+                [siid, piid, shadow.value, round(shadow.ts, 1)])
+        if not await self._storage.save_async(
+            domain='miot_props', name=self._name,
+            data={'ts': int(time.time()), 'props': props}
+        ):
+            _LOGGER.error('save prop snapshot failed')
+            return False
+        return True
+
+
+class MIoTPropWriter:
+    """Property writes with last-write-wins coalescing.
+
+    One write per property is in flight. A value requested meanwhile
+    replaces the pending one, the callers it supersedes share the future of
+    the newest value and get the value that was actually sent.
+    """
+    _main_loop: asyncio.AbstractEventLoop
+    _write: Callable[[str, int, int, Any], Coroutine[Any, Any, Any]]
+    # {(did, siid, piid): pending (value, fut) or None}
+    _writes: dict[tuple[str, int, int], Optional[tuple[Any, asyncio.Future]]]
+    _tasks: set[asyncio.Task]
+
+    def __init__(
+        self, loop: asyncio.AbstractEventLoop,
+        write: Callable[[str, int, int, Any], Coroutine[Any, Any, Any]]
+    ) -> None:
+        self._main_loop = loop
+        self._write = write
+        self._writes = {}
+        self._tasks = set()
+
+    def __len__(self) -> int:
+        return len(self._writes)
+
+    def deinit(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        self._tasks.clear()
+        for pending in self._writes.values():
+            if pending:
+                pending[1].cancel()
+        self._writes.clear()
+
+    def request(
+        self, did: str, siid: int, piid: int, value: Any
+    ) -> asyncio.Future:
+        """Write a property. The future resolves to the value that was
+        sent, or raises the error of the write."""
+        key = (did, siid, piid)
+        if key not in self._writes:
+            fut = self._main_loop.create_future()
+            self._writes[key] = None
+            task = self._main_loop.create_task(
+                self.__writer_async(key=key, value=value, fut=fut))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            return fut
+        pending = self._writes[key]
+        fut = pending[1] if pending else self._main_loop.create_future()
+        self._writes[key] = (value, fut)
+        return fut
+
+    async def __writer_async(
+        self, key: tuple[str, int, int], value: Any, fut: asyncio.Future
+    ) -> None:
+        did, siid, piid = key
+        while True:
+            try:
+                await self._write(did, siid, piid, value)
+                if not fut.done():
+                    fut.set_result(value)
+            except asyncio.CancelledError:
+                if not fut.done():
+                    fut.cancel()
+                raise
+            except Exception as err:  # pylint: disable=broad-exception-caught
+                _LOGGER.debug(
+                    'set prop error, %s.%d.%d, %s', did, siid, piid, err)
+                if not fut.done():
+                    fut.set_exception(err)
+            pending = self._writes.get(key, None)
+            if not pending:
+                self._writes.pop(key, None)
+                return
+            # Send the latest value written while in flight
+            value, fut = pending
+            self._writes[key] = None
+
+
+class MIoTRefreshPriority(IntEnum):
+    """Property refresh priority, a lower value is served first."""
+    # Entities shown to the user
+    HIGH = 0
+    NORMAL = 1
+    # Hidden entities and background refresh
+    LOW = 2
+
+
+@dataclass
+class MIoTRefreshPropItem:
+    """Pending property refresh."""
+    did: str
+    siid: int
+    piid: int
+    priority: MIoTRefreshPriority
+    enqueue_ts: float
+    retry_count: int = 0
+    served: bool = False
+
+    @property
+    def key(self) -> tuple[str, int, int]:
+        return (self.did, self.siid, self.piid)
+
+    def to_params(self) -> dict:
+        return {'did': self.did, 'siid': self.siid, 'piid': self.piid}
+
+
+class MIoTRefreshPropQueue:
+    """Deduplicated property refresh queue, grouped by device.
+
+    Items are served by priority, every priority level delays an item by
+    REFRESH_PROPS_AGING_S so that low priority items are never starved.
+    """
+    _main_loop: asyncio.AbstractEventLoop
+    # {did: {(siid, piid): item}}
+    _devices: dict[str, dict[tuple[int, int], MIoTRefreshPropItem]]
+    _size: int
+    _served: int
+    _wait_total: float
+    _wait_max: float
+
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._main_loop = loop
+        self._devices = {}
+        self._size = 0
+        self._served = 0
+        self._wait_total = 0
+        self._wait_max = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def push(
+        self, did: str, siid: int, piid: int,
+        priority: MIoTRefreshPriority = MIoTRefreshPriority.NORMAL
+    ) -> bool:
+        """Add a request, return False if it is already queued."""
+        device = self._devices.setdefault(did, {})
+        item = device.get((siid, piid), None)
+        if item:
+            item.priority = min(item.priority, priority)
+            return False
+        device[(siid, piid)] = MIoTRefreshPropItem(
+            did=did, siid=siid, piid=piid, priority=priority,
+            enqueue_ts=self._main_loop.time())
+        self._size += 1
+        return True
+
+    def requeue(self, item: MIoTRefreshPropItem, failed: bool) -> None:
+        """Put back a popped request, keeping its age."""
+        if failed:
+            item.retry_count += 1
+        device = self._devices.setdefault(item.did, {})
+        queued = device.get((item.siid, item.piid), None)
+        if queued:
+            # Requested again in the meantime
+            queued.priority = min(queued.priority, item.priority)
+            queued.enqueue_ts = min(queued.enqueue_ts, item.enqueue_ts)
+            return
+        device[(item.siid, item.piid)] = item
+        self._size += 1
+
+    def pop(self, item: MIoTRefreshPropItem) -> None:
+        device = self._devices.get(item.did, None)
+        if not device or device.pop((item.siid, item.piid), None) is None:
+            return
+        if not device:
+            self._devices.pop(item.did, None)
+        self._size -= 1
+        if not item.served:
+            item.served = True
+            wait = self._main_loop.time() - item.enqueue_ts
+            self._served += 1
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+
+    def ordered(self) -> list[MIoTRefreshPropItem]:
+        """Return the queued items by aged priority, grouped by device."""
+        items = [
+            item for device in self._devices.values()
+            for item in device.values()]
+        items.sort(key=lambda item: (
+            item.enqueue_ts + item.priority*REFRESH_PROPS_AGING_S))
+        return items
+
+    def has_fresh(self) -> bool:
+        """Whether any request has never been tried."""
+        return any(
+            item.retry_count == 0 for device in self._devices.values()
+            for item in device.values())
+
+    def clear(self) -> None:
+        self._devices.clear()
+        self._size = 0
+
+    @property
+    def stats(self) -> dict[str, Any]:
+        now = self._main_loop.time()
+        priorities = {priority.name.lower(): 0 for priority in (
+            MIoTRefreshPriority)}
+        oldest_wait: float = 0
+        for device in self._devices.values():
+            for item in device.values():
+                priorities[item.priority.name.lower()] += 1
+                oldest_wait = max(oldest_wait, now - item.enqueue_ts)
+        return {
+            'length': self._size,
+            'devices': len(self._devices),
+            **priorities,
+            'oldest_wait': round(oldest_wait, 3),
+            'served': self._served,
+            'avg_wait': round(
+                self._wait_total/self._served if self._served else 0, 3),
+            'max_wait': round(self._wait_max, 3)}
+
+
+class MIoTRefreshLimiter:
+    """Concurrency and rate limit of a property refresh route."""
+    _main_loop: asyncio.AbstractEventLoop
+    _semaphore: asyncio.Semaphore
+    _interval: float
+    _next_ts: float
+
+    def __init__(
+        self, concurrency: int, rate: float,
+        loop: asyncio.AbstractEventLoop
+    ) -> None:
+        self._main_loop = loop
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._interval = 1/rate
+        self._next_ts = 0
+
+    async def __aenter__(self) -> None:
+        await self._semaphore.acquire()
+        now = self._main_loop.time()
+        delay = self._next_ts - now
+        self._next_ts = max(now, self._next_ts) + self._interval
+        if delay > 0:
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                self._semaphore.release()
+                raise
+
+    async def __aexit__(self, *args) -> None:
+        self._semaphore.release()
+
+
+class MIoTPropRefresher:
+    """Property refresh pipeline.
+
+    Pending requests are drained in priority order, split by the current
+    route of each device. A route is a gateway group_id, 'lan' or 'cloud',
+    the routes are read concurrently within their limits. Local routes
+    read the properties of a device in batched get_properties requests,
+    models rejecting them are read one property per cycle for a while.
+    Failed requests are retried, with retry set for the route.
+    """
+    _main_loop: asyncio.AbstractEventLoop
+    # (did, retry) -> route or None
+    _get_route: Callable[[str, bool], Optional[str]]
+    # route -> gateway mips or lan client
+    _get_local: Callable[[str], Any]
+    # get_properties params -> cloud results
+    _get_cloud_props: Callable[[list[dict]], Coroutine[Any, Any, Any]]
+    # (params, route)
+    _on_prop: Callable[[dict, str], None]
+    # did -> model
+    _get_model: Callable[[str], str]
+
+    _queue: MIoTRefreshPropQueue
+    _timer: Optional[asyncio.TimerHandle]
+    _limiters: dict[str, MIoTRefreshLimiter]
+    # Models rejecting multi-property get_properties requests,
+    # {model: expiry ts}
+    _single_models: dict[str, float]
+
+    def __init__(
+        self, loop: asyncio.AbstractEventLoop,
+        get_route: Callable[[str, bool], Optional[str]],
+        get_local: Callable[[str], Any],
+        get_cloud_props: Callable[[list[dict]], Coroutine[Any, Any, Any]],
+        on_prop: Callable[[dict, str], None],
+        get_model: Callable[[str], str]
+    ) -> None:
+        self._main_loop = loop
+        self._get_route = get_route
+        self._get_local = get_local
+        self._get_cloud_props = get_cloud_props
+        self._on_prop = on_prop
+        self._get_model = get_model
+        self._queue = MIoTRefreshPropQueue(loop=loop)
+        self._timer = None
+        self._limiters = {}
+        self._single_models = {}
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def deinit(self) -> None:
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        self._queue.clear()
+
+    @property
+    def stats(self) -> dict[str, Any]:
+        return self._queue.stats
+
+    def request(
+        self, did: str, siid: int, piid: int,
+        priority: MIoTRefreshPriority = MIoTRefreshPriority.NORMAL
+    ) -> None:
+        if not self._queue.push(
+                did=did, siid=siid, piid=piid, priority=priority):
+            return
+        if self._timer:
+            return
+        self._timer = self._main_loop.call_later(
+            REFRESH_PROPS_DELAY, lambda: self._main_loop.create_task(
+                self.__refresh_props_handler()))
+
+    def disable_batch_read(self, did: str) -> None:
+        """Read the properties of the model one by one for a while."""
+        self._single_models[self._get_model(did)] = (
+            time.time() + REFRESH_PROPS_SINGLE_MODEL_TTL)
+
+    def batch_read_enabled(self, did: str) -> bool:
+        model = self._get_model(did)
+        expiry = self._single_models.get(model, None)
+        if expiry is None:
+            return True
+        if expiry < time.time():
+            self._single_models.pop(model, None)
+            return True
+        return False
+
+    @staticmethod
+    def split_props_request(
+        items: list[MIoTRefreshPropItem]
+    ) -> list[list[dict]]:
+        """Split a get_properties request to fit in one LAN message."""
+        budget: int = (
+            MIoTLan.OT_MSG_LEN - REFRESH_PROPS_BATCH_OVERHEAD)
+        chunks: list[list[dict]] = []
+        chunk: list[dict] = []
+        chunk_len: int = 0
+        for item in items:
+            param_len = len(json.dumps(item.to_params())) + 2
+            if chunk and chunk_len + param_len > budget:
+                chunks.append(chunk)
+                chunk, chunk_len = [], 0
+            chunk.append({'siid': item.siid, 'piid': item.piid})
+            chunk_len += param_len
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    async def __refresh_props_handler(self) -> None:
+        if not self._queue:
+            self._timer = None
+            return
+        # Split the pending requests by the current route of each device,
+        # central hub gateway, lan control or cloud, and drain the routes
+        # concurrently, in priority order.
+        cloud_list: list[MIoTRefreshPropItem] = []
+        local_list: dict[str, dict[str, list[MIoTRefreshPropItem]]] = {}
+        failed_list: list[list[MIoTRefreshPropItem]] = [[]]
+        for item in self._queue.ordered():
+            route = self._get_route(item.did, item.retry_count > 0)
+            if route is None:
+                self._queue.pop(item)
+                failed_list[0].append(item)
+                continue
+            if route == 'cloud':
+                self._queue.pop(item)
+                cloud_list.append(item)
+                continue
+            request_list = local_list.setdefault(route, {})
+            if (
+                item.did in request_list
+                and not self.batch_read_enabled(item.did)
+            ):
+                # NOTICE: A device only requests once a cycle, continuous
+                # acquisition of properties can cause device exceptions.
+                continue
+            self._queue.pop(item)
+            request_list.setdefault(item.did, []).append(item)
+        tasks: list[Coroutine] = []
+        if cloud_list:
+            tasks.append(self.__refresh_props_from_cloud(
+                request_list=cloud_list))
+        for route, request_list in local_list.items():
+            tasks.append(self.__refresh_props_from_local(
+                route=route, request_list=request_list,
+                getter=self._get_local(route)))
+        failed_list.extend(await asyncio.gather(*tasks))
+
+        # Only retry the failed requests, drop them after three attempts
+        for failed in failed_list:
+            for item in failed:
+                if item.retry_count >= REFRESH_PROPS_RETRY_MAX:
+                    _LOGGER.info(
+                        'refresh props failed, retry count exceed, %s',
+                        item.key)
+                    continue
+                self._queue.requeue(item=item, failed=True)
+        if not self._queue:
+            self._timer = None
+            return
+        delay = REFRESH_PROPS_RETRY_DELAY
+        if self._queue.has_fresh():
+            delay = REFRESH_PROPS_DELAY
+        self._timer = self._main_loop.call_later(
+            delay, lambda: self._main_loop.create_task(
+                self.__refresh_props_handler()))
+
+    async def __refresh_props_from_cloud(
+        self, request_list: list[MIoTRefreshPropItem]
+    ) -> list[MIoTRefreshPropItem]:
+        """Refresh props from cloud, return the failed requests."""
+        limiter = self.__get_limiter('cloud')
+        failed_list = await asyncio.gather(*[
+            self.__refresh_props_patch_from_cloud(
+                request_list=request_list[
+                    index:index+REFRESH_PROPS_CLOUD_BATCH],
+                limiter=limiter)
+            for index in range(
+                0, len(request_list), REFRESH_PROPS_CLOUD_BATCH)])
+        return [item for failed in failed_list for item in failed]
+
+    async def __refresh_props_patch_from_cloud(
+        self, request_list: list[MIoTRefreshPropItem],
+        limiter: MIoTRefreshLimiter
+    ) -> list[MIoTRefreshPropItem]:
+        pending: dict[tuple[str, int, int], MIoTRefreshPropItem] = {
+            item.key: item for item in request_list}
+        try:
+            async with limiter:
+                results = await self._get_cloud_props(
+                    [item.to_params() for item in request_list])
+            if not results:
+                raise MIoTClientError('get_props_async failed')
+            for result in results:
+                if (
+                    'did' not in result
+                    or 'siid' not in result
+                    or 'piid' not in result
+                    or 'value' not in result
+                ):
+                    continue
+                pending.pop(
+                    (result['did'], result['siid'], result['piid']), None)
+                self._on_prop(result, 'cloud')
+            if pending:
+                _LOGGER.info(
+                    'refresh props failed, cloud, %s', list(pending.keys()))
+        except Exception as err:  # pylint:disable=broad-exception-caught
+            _LOGGER.error(
+                'refresh props error, cloud, %s, %s',
+                err, traceback.format_exc())
+        return list(pending.values())
+
+    async def __refresh_props_from_local(
+        self, route: str,
+        request_list: dict[str, list[MIoTRefreshPropItem]], getter: Any
+    ) -> list[MIoTRefreshPropItem]:
+        """Refresh props from a gateway or lan, return the failed requests.
+        Devices are read concurrently within the route limits."""
+        limiter = self.__get_limiter(route)
+
+        async def refresh_device_props(
+            did: str, items: list[MIoTRefreshPropItem]
+        ) -> list[MIoTRefreshPropItem]:
+            async with limiter:
+                return await self.__refresh_device_props_async(
+                    route=route, did=did, items=items, getter=getter)
+        failed_list = await asyncio.gather(*[
+            refresh_device_props(did=did, items=items)
+            for did, items in request_list.items()])
+        failed = [item for items in failed_list for item in items]
+        if failed:
+            _LOGGER.info(
+                'refresh props failed, %s, %s',
+                route, [item.key for item in failed])
+        return failed
+
+    async def __refresh_device_props_async(
+        self, route: str, did: str, items: list[MIoTRefreshPropItem],
+        getter: Any
+    ) -> list[MIoTRefreshPropItem]:
+        """Read the properties of one device, batched when supported.
+        Return the requests that were not refreshed."""
+        results: list[dict] = []
+        single: Optional[MIoTRefreshPropItem] = (
+            items[0] if len(items) == 1 else None)
+        if single is None:
+            for props_list in self.split_props_request(items=items):
+                try:
+                    results.extend(await getter.get_props_async(
+                        did=did, props_list=props_list, timeout_ms=6000))
+                except MIoTError as err:
+                    if err.code == MIoTErrorCode.CODE_INVALID_PARAMS:
+                        # Rejected, fall back to single reads for this model
+                        self.disable_batch_read(did=did)
+                        _LOGGER.info(
+                            'batch read props unsupported, %s, %s, %s',
+                            did, self._get_model(did), err)
+                        # Keep the results of the earlier chunks, single
+                        # read one property now and the rest on next cycles
+                        done = {
+                            (result.get('siid', None),
+                             result.get('piid', None))
+                            for result in results}
+                        rest = [
+                            item for item in items
+                            if (item.siid, item.piid) not in done]
+                        if not results and rest:
+                            single = rest.pop(0)
+                        for item in rest:
+                            self._queue.requeue(item=item, failed=False)
+                        items = [item for item in items if item not in rest]
+                    else:
+                        # Offline, timeout or a transient error, the rest
+                        # are retried
+                        _LOGGER.info(
+                            'batch read props error, %s, %s', did, err)
+                    break
+        if single is not None:
+            value = await getter.get_prop_async(
+                did=did, siid=single.siid, piid=single.piid, timeout_ms=6000)
+            # Don't use "not value", it will be skipped when value
+            # is 0, false
+            if value is not None:
+                results.append({
+                    'siid': single.siid, 'piid': single.piid, 'code': 0,
+                    'value': value})
+        failed: dict[tuple[int, int], MIoTRefreshPropItem] = {
+            (item.siid, item.piid): item for item in items}
+        for result in results:
+            if (
+                result.get('code', 0) != 0
+                or 'siid' not in result
+                or 'piid' not in result
+                or 'value' not in result
+            ):
+                continue
+            failed.pop((result['siid'], result['piid']), None)
+            self._on_prop({
+                'did': did,
+                'siid': result['siid'],
+                'piid': result['piid'],
+                'value': result['value']}, route)
+        return list(failed.values())
+
+    def __get_limiter(self, route: str) -> MIoTRefreshLimiter:
+        if route not in self._limiters:
+            concurrency, rate = REFRESH_PROPS_ROUTE_LIMITS[
+                route if route in ('cloud', 'lan') else 'gw']
+            self._limiters[route] = MIoTRefreshLimiter(
+                concurrency=concurrency, rate=rate, loop=self._main_loop)
+        return self._limiters[route]
@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (C) 2024 Xiaomi Corporation.
+
+The ownership and intellectual property rights of Xiaomi Home Assistant
+Integration and related Xiaomi cloud service API interface provided under this
+license, including source code and object code (collectively, "Licensed Work"),
+are owned by Xiaomi. Subject to the terms and conditions of this License, Xiaomi
+hereby grants you a personal, limited, non-exclusive, non-transferable,
+non-sublicensable, and royalty-free license to reproduce, use, modify, and
+distribute the Licensed Work only for your use of Home Assistant for
+non-commercial purposes. For the avoidance of doubt, Xiaomi does not authorize
+you to use the Licensed Work for any other purpose, including but not limited
+to use Licensed Work to develop applications (APP), Web services, and other
+forms of software.
+
+You may reproduce and distribute copies of the Licensed Work, with or without
+modifications, whether in source or object form, provided that you must give
+any other recipients of the Licensed Work a copy of this License and retain all
+copyright and disclaimers.
+
+Xiaomi provides the Licensed Work on an "AS IS" BASIS, WITHOUT WARRANTIES OR
+CONDITIONS OF ANY KIND, either express or implied, including, without
+limitation, any warranties, undertakes, or conditions of TITLE, NO ERROR OR
+OMISSION, CONTINUITY, RELIABILITY, NON-INFRINGEMENT, MERCHANTABILITY, or
+FITNESS FOR A PARTICULAR PURPOSE. In any event, you are solely responsible
+for any direct, indirect, special, incidental, or consequential damages or
+losses arising from the use or inability to use the Licensed Work.
+
+Xiaomi reserves all rights not expressly granted to you in this License.
+Except for the rights expressly granted by Xiaomi under this License, Xiaomi
+does not authorize you in any form to use the trademarks, copyrights, or other
+forms of intellectual property rights of Xiaomi and its affiliates, including,
+without limitation, without obtaining other written permission from Xiaomi, you
+shall not use "Xiaomi", "Mijia" and other words related to Xiaomi or words that
+may make the public associate with Xiaomi in any form to publicize or promote
+the software or hardware devices that use the Licensed Work.
+
+Xiaomi has the right to immediately terminate all your authorization under this
+License in the event:
+1. You assert patent invalidation, litigation, or other claims against patents
+or other intellectual property rights of Xiaomi or its affiliates; or,
+2. You make, have made, manufacture, sell, or offer to sell products that knock
+off Xiaomi or its affiliates' products.
+
+MIoT device route selection.
+"""
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Callable, Coroutine, Optional
+
+# pylint: disable=relative-beyond-top-level
+from .miot_error import MIoTError, MIoTErrorCode
+
+_LOGGER = logging.getLogger(__name__)
+
+
+# Route latency, EWMA weight and p95 sample window
+ROUTE_LATENCY_ALPHA = 0.2
+ROUTE_LATENCY_WINDOW = 32
+# A route failing this many times in a row is skipped for a while
+ROUTE_FAIL_MAX = 2
+ROUTE_FAIL_BACKOFF_S = 60
+# Hedged read delay, the p95 of the first route within these bounds
+GET_PROP_HEDGE_DELAY = 1
+GET_PROP_HEDGE_DELAY_MIN = 0.2
+GET_PROP_HEDGE_DELAY_MAX = 3
+# Error codes of a route that certainly did not send the request, a write
+# only falls back to the next route on these. A timeout or an invalid
+# result may come after the device applied the write.
+ROUTE_UNREACHABLE_CODES: tuple[int, ...] = (
+    MIoTErrorCode.CODE_INTERNAL_ERROR.value,
+    MIoTErrorCode.CODE_LAN_UNAVAILABLE.value)
+
+
+class MIoTRouteLatency:
+    """Round-trip time of a device route, EWMA and p95 of recent samples."""
+    _samples: deque[float]
+    ewma: Optional[float]
+    total: int
+    failures: int
+    fail_streak: int
+    fail_ts: float
+
+    def __init__(self) -> None:
+        self._samples = deque(maxlen=ROUTE_LATENCY_WINDOW)
+        self.ewma = None
+        self.total = 0
+        self.failures = 0
+        self.fail_streak = 0
+        self.fail_ts = 0
+
+    def record(self, rtt: float) -> None:
+        self._samples.append(rtt)
+        if self.ewma is None:
+            self.ewma = rtt
+        else:
+            self.ewma += ROUTE_LATENCY_ALPHA*(rtt - self.ewma)
+        self.total += 1
+        self.fail_streak = 0
+
+    def record_failure(self, now: float) -> None:
+        self.total += 1
+        self.failures += 1
+        self.fail_streak += 1
+        self.fail_ts = now
+
+    def healthy(self, now: float) -> bool:
+        return (
+            self.fail_streak < ROUTE_FAIL_MAX
+            or now - self.fail_ts > ROUTE_FAIL_BACKOFF_S)
+
+    @property
+    def p95(self) -> Optional[float]:
+        if not self._samples:
+            return None
+        samples = sorted(self._samples)
+        return samples[min(len(samples) - 1, int(len(samples)*0.95))]
+
+    def stats(self, now: float) -> dict[str, Any]:
+        p95 = self.p95
+        return {
+            'ewma_ms': (
+                None if self.ewma is None else round(self.ewma*1000, 1)),
+            'p95_ms': None if p95 is None else round(p95*1000, 1),
+            'total': self.total,
+            'failures': self.failures,
+            'healthy': self.healthy(now)}
+
+
+class MIoTRouter:
+    """Route latency of the devices, route order, hedged reads and write
+    fallback.
+
+    Routes are names such as 'gw', 'lan' and 'cloud', given in the default
+    order of the caller. A route only moves ahead of another one once both
+    are measured and it is faster, unhealthy routes are tried last.
+    """
+    _main_loop: asyncio.AbstractEventLoop
+    # {did: {route: latency}}
+    _latency: dict[str, dict[str, MIoTRouteLatency]]
+    # Send a second read on the next route if the first one is slow
+    _hedged_reads: bool
+    # Hedged reads still running after the first result was returned
+    _hedged_tasks: set[asyncio.Task]
+
+    def __init__(
+        self, loop: asyncio.AbstractEventLoop, hedged_reads: bool = False
+    ) -> None:
+        self._main_loop = loop
+        self._latency = {}
+        self._hedged_reads = hedged_reads
+        self._hedged_tasks = set()
+
+    def deinit(self) -> None:
+        for task in self._hedged_tasks:
+            task.cancel()
+        self._hedged_tasks.clear()
+        self._latency.clear()
+
+    @property
+    def hedged_reads(self) -> bool:
+        return self._hedged_reads
+
+    @hedged_reads.setter
+    def hedged_reads(self, value: bool) -> None:
+        self._hedged_reads = value
+
+    @property
+    def stats(self) -> dict[str, dict[str, dict]]:
+        """Round-trip time of each device route, {did: {route: stats}}."""
+        now = self._main_loop.time()
+        return {
+            did: {
+                route: latency.stats(now)
+                for route, latency in routes.items()}
+            for did, routes in self._latency.items()}
+
+    def remove_device(self, did: str) -> None:
+        self._latency.pop(did, None)
+
+    def record(self, did: str, route: str, rtt: Optional[float]) -> None:
+        """Record a round trip of a device route, None for a failure."""
+        latency = self._latency.setdefault(did, {}).get(route, None)
+        if latency is None:
+            latency = MIoTRouteLatency()
+            self._latency[did][route] = latency
+        if rtt is None:
+            latency.record_failure(now=self._main_loop.time())
+        else:
+            latency.record(rtt=rtt)
+
+    def sort(
+        self, did: str, routes: list[str], by_latency: bool = True
+    ) -> list[str]:
+        """Order routes, unhealthy ones last. If by_latency, a measured
+        route moves ahead of the measured routes with a higher EWMA, it
+        never passes an unmeasured one."""
+        latency = self._latency.get(did, {})
+        now = self._main_loop.time()
+        healthy: list[str] = []
+        unhealthy: list[str] = []
+        for route in routes:
+            item = latency.get(route, None)
+            if item and not item.healthy(now):
+                unhealthy.append(route)
+                continue
+            index = len(healthy)
+            if by_latency and item and item.ewma is not None:
+                while index > 0:
+                    prev = latency.get(healthy[index-1], None)
+                    if (
+                        prev is None or prev.ewma is None
+                        or prev.ewma <= item.ewma
+                    ):
+                        break
+                    index -= 1
+            healthy.insert(index, route)
+        return healthy + unhealthy
+
+    def hedge_delay(self, did: str, route: str) -> float:
+        latency = self._latency.get(did, {}).get(route, None)
+        p95 = latency.p95 if latency else None
+        if p95 is None:
+            return GET_PROP_HEDGE_DELAY
+        return min(
+            max(p95, GET_PROP_HEDGE_DELAY_MIN), GET_PROP_HEDGE_DELAY_MAX)
+
+    async def read_async(
+        self, did: str, routes: list[str],
+        read: Callable[[str], Coroutine[Any, Any, Any]]
+    ) -> Any:
+        """Read through the routes in order, return the first value that is
+        not None, or None if no route answers. With hedged reads the next
+        route is also started when a route is slower than its p95."""
+        routes = self.sort(did=did, routes=routes)
+        pending: set[asyncio.Task] = set()
+        hedge_delay: Optional[float] = None
+        try:
+            while routes or pending:
+                if routes:
+                    route = routes.pop(0)
+                    pending.add(self._main_loop.create_task(
+                        self.__read_on_route_async(
+                            did=did, route=route, read=read)))
+                    hedge_delay = self.hedge_delay(did=did, route=route)
+                done, pending = await asyncio.wait(
+                    pending,
+                    timeout=(
+                        hedge_delay if self._hedged_reads and routes
+                        else None),
+                    return_when=asyncio.FIRST_COMPLETED)
+                # Try the next route on a failure, or on a slow read if
+                # hedged reads are enabled
+                for task in done:
+                    value = task.result()
+                    # Don't use "not value", it will be skipped when value
+                    # is 0, false
+                    if value is not None:
+                        # Let the slower reads finish to measure the route
+                        for hedged in pending:
+                            self._hedged_tasks.add(hedged)
+                            hedged.add_done_callback(
+                                self._hedged_tasks.discard)
+                        return value
+        except asyncio.CancelledError:
+            for task in pending:
+                task.cancel()
+            raise
+        return None
+
+    async def write_async(
+        self, did: str, routes: list[str],
+        write: Callable[[str], Coroutine[Any, Any, Optional[int]]]
+    ) -> tuple[Optional[str], Optional[int]]:
+        """Write through the routes in the default order, unhealthy ones
+        last. write returns the result code of the route, or None if the
+        route is not available and nothing was sent.
+
+        Fall back to the next route only if the request was certainly not
+        sent. Return the route that sent the request and its result code,
+        or (None, last code) if no route sent it. An error of a route that
+        may have sent the request is raised.
+        """
+        last_rc: Optional[int] = None
+        last_err: Optional[Exception] = None
+        for route in self.sort(did=did, routes=routes, by_latency=False):
+            start_ts = self._main_loop.time()
+            try:
+                rc = await write(route)
+            except Exception as err:
+                _LOGGER.error('route write error, %s, %s, %s', route, did, err)
+                self.record(did=did, route=route, rtt=None)
+                if not (
+                    isinstance(err, MIoTError)
+                    and err.code.value in ROUTE_UNREACHABLE_CODES
+                ):
+                    raise
+                last_rc, last_err = None, err
+                continue
+            if rc is None or rc in ROUTE_UNREACHABLE_CODES:
+                self.record(did=did, route=route, rtt=None)
+                if rc is not None:
+                    last_rc, last_err = rc, None
+                continue
+            self.record(
+                did=did, route=route,
+                rtt=(
+                    None if rc == MIoTErrorCode.CODE_TIMEOUT.value
+                    else self._main_loop.time() - start_ts))
+            return route, rc
+        if last_err:
+            raise last_err
+        return None, last_rc
+
+    async def __read_on_route_async(
+        self, did: str, route: str,
+        read: Callable[[str], Coroutine[Any, Any, Any]]
+    ) -> Any:
+        start_ts = self._main_loop.time()
+        value: Any = None
+        try:
+            value = await read(route)
+        except Exception as err:  # pylint: disable=broad-exception-caught
+            # Catch all exceptions
+            _LOGGER.error('route read error, %s, %s, %s', route, did, err)
+        self.record(
+            did=did, route=route,
+            rtt=None if value is None else self._main_loop.time() - start_ts)
+        return value
@@ -45,16 +45,23 @@ off Xiaomi or its affiliates' products.
 
 MIoT-Spec-V2 parser.
 """
+import ast
 import asyncio
+from collections import OrderedDict
 import os
-import platform
+import sys
+import threading
 import time
-from typing import Any, Optional, Type, Union
+from typing import Any, Callable, Optional, Type, Union
 import logging
+import weakref
 from slugify import slugify
 
 # pylint: disable=relative-beyond-top-level
-from .const import DEFAULT_INTEGRATION_LANGUAGE, SPEC_STD_LIB_EFFECTIVE_TIME
+from .const import (
+    DEFAULT_INTEGRATION_LANGUAGE,
+    SPEC_MULTI_LANG_EFFECTIVE_TIME,
+    SPEC_STD_LIB_EFFECTIVE_TIME)
 from .common import MIoTHttp, load_yaml_file, load_json_file
 from .miot_error import MIoTSpecError
 from .miot_storage import MIoTStorage
@@ -62,8 +69,26 @@ from .miot_storage import MIoTStorage
 _LOGGER = logging.getLogger(__name__)
 
 
+def _intern(value: Any) -> Any:
+    """Intern the strings repeated by every device of the same model."""
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def _shared_key(values: list) -> Optional[tuple]:
+    # bool is a subclass of int, keep the type in the key
+    try:
+        key = tuple((type(value), value) for value in values)
+        hash(key)
+        return key
+    except TypeError:
+        return None
+
+
 class MIoTSpecValueRange:
     """MIoT SPEC value range class."""
+    __slots__ = ('min_', 'max_', 'step', '__weakref__')
+    # Immutable once loaded, shared by the properties with the same range
+    _shared: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
     min_: int
     max_: int
     step: int | float
@@ -97,9 +122,24 @@ class MIoTSpecValueRange:
     def __str__(self) -> str:
         return f'[{self.min_}, {self.max_}, {self.step}'
 
+    @staticmethod
+    def shared(value_range: Union[dict, list]) -> 'MIoTSpecValueRange':
+        """Get the shared value range, do not modify the result."""
+        key = _shared_key(
+            [value_range.get(k, None) for k in ('min', 'max', 'step')]
+            if isinstance(value_range, dict) else value_range)
+        if key is None:
+            return MIoTSpecValueRange(value_range=value_range)
+        result = MIoTSpecValueRange._shared.get(key, None)
+        if result is None:
+            result = MIoTSpecValueRange(value_range=value_range)
+            MIoTSpecValueRange._shared[key] = result
+        return result
+
 
 class MIoTSpecValueListItem:
     """MIoT SPEC value list item class."""
+    __slots__ = ('name', 'value', 'description')
     # NOTICE: bool type without name
     name: str
     # Value
@@ -114,9 +154,9 @@ class MIoTSpecValueListItem:
         if 'value' not in item or 'description' not in item:
             raise MIoTSpecError('invalid value list item, %s')
 
-        self.name = item.get('name', None)
-        self.value = item['value']
-        self.description = item['description']
+        self.name = _intern(item.get('name', None))
+        self.value = _intern(item['value'])
+        self.description = _intern(item['description'])
 
     @staticmethod
     def from_spec(item: dict) -> 'MIoTSpecValueListItem':
@@ -145,6 +185,9 @@ class MIoTSpecValueListItem:
 class MIoTSpecValueList:
     """MIoT SPEC value list class."""
     # pylint: disable=inconsistent-quotes
+    __slots__ = ('items', '__weakref__')
+    # Immutable once loaded, shared by the properties with the same list
+    _shared: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
     items: list[MIoTSpecValueListItem]
 
     def __init__(self, value_list: list[dict]) -> None:
@@ -205,6 +248,22 @@ class MIoTSpecValueList:
     def dump(self) -> list:
         return [item.dump() for item in self.items]
 
+    @staticmethod
+    def shared(value_list: list[dict]) -> 'MIoTSpecValueList':
+        """Get the shared value list, do not modify the result."""
+        key = _shared_key([
+            field for item in value_list if isinstance(item, dict)
+            for field in (
+                item.get('name', None), item.get('value', None),
+                item.get('description', None))])
+        if key is None:
+            return MIoTSpecValueList(value_list=value_list)
+        result = MIoTSpecValueList._shared.get(key, None)
+        if result is None:
+            result = MIoTSpecValueList(value_list=value_list)
+            MIoTSpecValueList._shared[key] = result
+        return result
+
 
 class _SpecStdLib:
     """MIoT-Spec-V2 standard library."""
@@ -433,8 +492,74 @@ class _SpecStdLib:
         return result
 
 
+class MIoTSpecExpr:
+    """MIoT SPEC value expression class.
+    The expression is validated and compiled once, only arithmetic,
+    comparison and a few builtin calls on src_value are allowed."""
+    __slots__ = ('expr', '_code', '_globals')
+    _FUNCTIONS: dict[str, Any] = {
+        'round': round, 'abs': abs, 'int': int, 'float': float,
+        'min': min, 'max': max, 'bool': bool}
+    _NODES: tuple = (
+        ast.Expression, ast.BinOp, ast.UnaryOp, ast.BoolOp, ast.Compare,
+        ast.IfExp, ast.Constant, ast.Name, ast.Load, ast.Call,
+        ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow,
+        ast.UAdd, ast.USub, ast.Not, ast.And, ast.Or,
+        ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE)
+    # {expr: code}, shared by all properties
+    _compiled: dict[str, Any] = {}
+
+    expr: str
+    _code: Any
+    _globals: dict[str, Any]
+
+    def __init__(self, expr: str) -> None:
+        self.expr = expr
+        self._code = self.compile(expr=expr)
+        self._globals = {'__builtins__': {}, **self._FUNCTIONS}
+
+    def __call__(self, src_value: Any) -> Any:
+        self._globals['src_value'] = src_value
+        # pylint: disable=eval-used
+        return eval(self._code, self._globals)
+
+    @staticmethod
+    def compile(expr: str) -> Any:
+        """Validate and compile the expression, raise MIoTSpecError if the
+        expression is invalid."""
+        code = MIoTSpecExpr._compiled.get(expr, None)
+        if code is not None:
+            return code
+        try:
+            tree = ast.parse(expr.strip(), mode='eval')
+        except SyntaxError as err:
+            raise MIoTSpecError(f'invalid expression, {expr}, {err}') from err
+        for node in ast.walk(tree):
+            if not isinstance(node, MIoTSpecExpr._NODES):
+                raise MIoTSpecError(
+                    f'unsupported expression, {expr}, {type(node).__name__}')
+            if isinstance(node, ast.Name) and node.id != 'src_value' and (
+                    node.id not in MIoTSpecExpr._FUNCTIONS):
+                raise MIoTSpecError(f'unknown name, {expr}, {node.id}')
+            if isinstance(node, ast.Call) and (
+                    not isinstance(node.func, ast.Name)
+                    or node.func.id not in MIoTSpecExpr._FUNCTIONS
+                    or node.keywords):
+                raise MIoTSpecError(f'unsupported call, {expr}')
+            if isinstance(node, ast.Constant) and not isinstance(
+                    node.value, (int, float)):
+                raise MIoTSpecError(f'unsupported constant, {expr}')
+        code = compile(tree, '<expr>', 'eval')
+        MIoTSpecExpr._compiled[expr] = code
+        return code
+
+
 class _MIoTSpecBase:
     """MIoT SPEC base class."""
+    __slots__ = (
+        'iid', 'type_', 'description', 'description_trans', 'proprietary',
+        'need_filter', 'name', 'icon', 'platform', 'device_class',
+        'state_class', 'external_unit', 'entity_category', 'spec_id')
     iid: int
     type_: str
     description: str
@@ -455,14 +580,14 @@ class _MIoTSpecBase:
 
     def __init__(self, spec: dict) -> None:
         self.iid = spec['iid']
-        self.type_ = spec['type']
-        self.description = spec['description']
+        self.type_ = _intern(spec['type'])
+        self.description = _intern(spec['description'])
 
-        self.description_trans = spec.get('description_trans', None)
+        self.description_trans = _intern(spec.get('description_trans', None))
         self.proprietary = spec.get('proprietary', False)
         self.need_filter = spec.get('need_filter', False)
-        self.name = spec.get('name', 'xiaomi')
-        self.icon = spec.get('icon', None)
+        self.name = _intern(spec.get('name', 'xiaomi'))
+        self.icon = _intern(spec.get('icon', None))
 
         self.platform = None
         self.device_class = None
@@ -481,11 +606,14 @@ class _MIoTSpecBase:
 
 class MIoTSpecProperty(_MIoTSpecBase):
     """MIoT SPEC property class."""
+    __slots__ = (
+        'unit', '_format_', '_precision', '_value_range', '_value_list',
+        '_access', '_writable', '_readable', '_notifiable', '_expr',
+        'service', 'value_convert')
     unit: Optional[str]
-    precision: int
-    expr: Optional[str]
 
     _format_: Type
+    _precision: int
     _value_range: Optional[MIoTSpecValueRange]
     _value_list: Optional[MIoTSpecValueList]
 
@@ -493,8 +621,13 @@ class MIoTSpecProperty(_MIoTSpecBase):
     _writable: bool
     _readable: bool
     _notifiable: bool
+    _expr: Optional[MIoTSpecExpr]
 
     service: 'MIoTSpecService'
+    # Convert the reported value, the same as value_format -> eval_expr ->
+    # value_precision. Built on the first call, reset when the spec is
+    # modified
+    value_convert: Callable[[Any], Any]
 
     def __init__(self,
                  spec: dict,
@@ -510,7 +643,7 @@ class MIoTSpecProperty(_MIoTSpecBase):
         self.service = service
         self.format_ = format_
         self.access = access
-        self.unit = unit
+        self.unit = _intern(unit)
         self.value_range = value_range
         self.value_list = value_list
         self.precision = precision if precision is not None else 1
@@ -530,6 +663,16 @@ class MIoTSpecProperty(_MIoTSpecBase):
             'bool': bool,
             'float': float
         }.get(value, int)
+        self.__reset_value_convert()
+
+    @property
+    def precision(self) -> int:
+        return self._precision
+
+    @precision.setter
+    def precision(self, value: int) -> None:
+        self._precision = value
+        self.__reset_value_convert()
 
     @property
     def access(self) -> list:
@@ -562,10 +705,11 @@ class MIoTSpecProperty(_MIoTSpecBase):
     @value_range.setter
     def value_range(self, value: Union[dict, list, None]) -> None:
         """Set value-range, precision."""
+        self.__reset_value_convert()
         if not value:
             self._value_range = None
             return
-        self._value_range = MIoTSpecValueRange(value_range=value)
+        self._value_range = MIoTSpecValueRange.shared(value_range=value)
         if isinstance(value, list):
             step_: str = format(value[2], '.10f').rstrip('0').rstrip('.')
             self.precision = len(step_.split('.')[1]) if '.' in step_ else 0
@@ -581,19 +725,35 @@ class MIoTSpecProperty(_MIoTSpecBase):
             self._value_list = None
             return
         if isinstance(value, list):
-            self._value_list = MIoTSpecValueList(value_list=value)
+            self._value_list = MIoTSpecValueList.shared(value_list=value)
         elif isinstance(value, MIoTSpecValueList):
             self._value_list = value
 
+    @property
+    def expr(self) -> Optional[str]:
+        return self._expr.expr if self._expr else None
+
+    @expr.setter
+    def expr(self, value: Optional[str]) -> None:
+        """Compile the expression, the invalid expression is ignored."""
+        self.__reset_value_convert()
+        if not value:
+            self._expr = None
+            return
+        try:
+            self._expr = MIoTSpecExpr(expr=value)
+        except MIoTSpecError as err:
+            self._expr = None
+            _LOGGER.error('invalid expression, %s, %s', self.iid, err)
+
     def eval_expr(self, src_value: Any) -> Any:
-        if not self.expr:
+        if not self._expr:
             return src_value
         try:
-            # pylint: disable=eval-used
-            return eval(self.expr, {'src_value': src_value})
+            return self._expr(src_value)
         except Exception as err:  # pylint: disable=broad-exception-caught
             _LOGGER.error('eval expression error, %s, %s, %s, %s', self.iid,
-                          src_value, self.expr, err)
+                          src_value, self._expr.expr, err)
             return src_value
 
     def value_format(self, value: Any) -> Any:
@@ -620,6 +780,65 @@ class MIoTSpecProperty(_MIoTSpecBase):
                 round(value / self.value_range.step) * self.value_range.step)
         return value
 
+    def __lazy_value_convert(self, value: Any) -> Any:
+        self.value_convert = self.__build_value_convert()
+        return self.value_convert(value)
+
+    def __reset_value_convert(self) -> None:
+        self.value_convert = self.__lazy_value_convert
+
+    def __build_value_convert(self) -> Callable[[Any], Any]:
+        format_ = self._format_
+        expr = self._expr
+        precision = self._precision
+        step = self._value_range.step if self._value_range else None
+        true_values = frozenset([True, 'True', 'true', '1'])
+
+        convert_format: Optional[Callable[[Any], Any]] = None
+        convert_precision: Optional[Callable[[Any], Any]] = None
+        if format_ == bool:
+            def convert_format(value: Any) -> Any:
+                try:
+                    return value in true_values
+                except TypeError:
+                    return False
+        elif format_ == int:
+            def convert_format(value: Any) -> Any:
+                return int(float(value)) if isinstance(value, str) else value
+
+            if step is None:
+                def convert_precision(value: Any) -> Any:
+                    return int(round(value))
+            else:
+                def convert_precision(value: Any) -> Any:
+                    return int(round(value / step) * step)
+        elif format_ == float:
+            def convert_format(value: Any) -> Any:
+                return float(value) if isinstance(value, str) else value
+
+            def convert_precision(value: Any) -> Any:
+                return round(value, precision)
+
+        def convert(value: Any) -> Any:
+            if value is None:
+                return None
+            if convert_format:
+                value = convert_format(value)
+            if expr:
+                # pylint: disable=broad-exception-caught
+                try:
+                    value = expr(value)
+                except Exception as err:
+                    _LOGGER.error(
+                        'eval expression error, %s, %s, %s, %s', self.iid,
+                        value, expr.expr, err)
+                if value is None:
+                    return None
+            if convert_precision:
+                return convert_precision(value)
+            return value
+        return convert
+
     def dump(self) -> dict:
         return {
             'type': self.type_,
@@ -643,6 +862,7 @@ class MIoTSpecProperty(_MIoTSpecBase):
 
 class MIoTSpecEvent(_MIoTSpecBase):
     """MIoT SPEC event class."""
+    __slots__ = ('argument', 'service')
     argument: list[MIoTSpecProperty]
     service: 'MIoTSpecService'
 
@@ -671,6 +891,7 @@ class MIoTSpecEvent(_MIoTSpecBase):
 
 class MIoTSpecAction(_MIoTSpecBase):
     """MIoT SPEC action class."""
+    __slots__ = ('in_', 'out', 'service')
     in_: list[MIoTSpecProperty]
     out: list[MIoTSpecProperty]
     service: 'MIoTSpecService'
@@ -703,6 +924,7 @@ class MIoTSpecAction(_MIoTSpecBase):
 
 class MIoTSpecService(_MIoTSpecBase):
     """MIoT SPEC service class."""
+    __slots__ = ('properties', 'events', 'actions')
     properties: list[MIoTSpecProperty]
     events: list[MIoTSpecEvent]
     actions: list[MIoTSpecAction]
@@ -817,13 +1039,22 @@ class _MIoTSpecMultiLang:
     """MIoT SPEC multi lang class."""
     # pylint: disable=broad-exception-caught
     _DOMAIN: str = 'miot_specs_multi_lang'
+    _CLOUD_DOMAIN: str = 'miot_specs_multi_lang_cloud'
     _MULTI_LANG_FILE = 'specs/multi_lang.json'
+    # multi_lang.json, {urn_key: {lang: {tag: value}}}, shared by the process
+    _bundled_data: Optional[dict[str, dict[str, dict[str, str]]]] = None
+    _bundled_lock: threading.Lock = threading.Lock()
     _lang: str
     _storage: MIoTStorage
     _main_loop: asyncio.AbstractEventLoop
 
     _custom_cache: dict[str, dict]
     _current_data: Optional[dict[str, str]]
+    # Local custom translation names
+    _local_names: Optional[set[str]]
+    # {urn: {'ts': int, 'data': dict, 'default': dict}}
+    _cloud_cache: Optional[dict[str, dict]]
+    _cloud_cache_dirty: bool
 
     def __init__(self,
                  lang: Optional[str],
@@ -835,63 +1066,106 @@ class _MIoTSpecMultiLang:
 
         self._custom_cache = {}
         self._current_data = None
+        self._local_names = None
+        self._cloud_cache = None
+        self._cloud_cache_dirty = False
 
-    async def set_spec_async(self, urn: str) -> None:
-        if urn in self._custom_cache:
+    async def init_async(self) -> None:
+        if self._cloud_cache is not None:
+            return
+        if _MIoTSpecMultiLang._bundled_data is None:
+            await self._main_loop.run_in_executor(
+                None, _MIoTSpecMultiLang.load_bundled_data)
+        try:
+            self._local_names = set(await self._main_loop.run_in_executor(
+                None, self._storage.get_names, self._DOMAIN, dict))
+        except Exception as err:
+            self._local_names = None
+            _LOGGER.info('get multi lang local names failed, %s', err)
+        cloud_cache = await self._storage.load_async(
+            domain=self._CLOUD_DOMAIN, name=self._lang, type_=dict)
+        self._cloud_cache = (
+            cloud_cache if isinstance(cloud_cache, dict) else {})
+
+    async def deinit_async(self) -> None:
+        if self._cloud_cache_dirty and self._cloud_cache is not None:
+            # Merge with the entries saved by other parsers
+            cloud_cache = await self._storage.load_async(
+                domain=self._CLOUD_DOMAIN, name=self._lang, type_=dict)
+            if isinstance(cloud_cache, dict):
+                for urn, item in self._cloud_cache.items():
+                    if (not isinstance(cloud_cache.get(urn, None), dict)
+                            or cloud_cache[urn].get('ts', 0) < item['ts']):
+                        cloud_cache[urn] = item
+            else:
+                cloud_cache = self._cloud_cache
+            if not await self._storage.save_async(
+                    domain=self._CLOUD_DOMAIN, name=self._lang,
+                    data=cloud_cache):
+                _LOGGER.error('save multi lang cloud cache failed')
+        self._cloud_cache_dirty = False
+        self._cloud_cache = None
+        self._local_names = None
+        self._custom_cache.clear()
+        self._current_data = None
+
+    @staticmethod
+    def load_bundled_data() -> dict[str, dict[str, dict[str, str]]]:
+        """Load multi_lang.json once per process, thread safe."""
+        with _MIoTSpecMultiLang._bundled_lock:
+            if _MIoTSpecMultiLang._bundled_data is None:
+                data: Any = None
+                try:
+                    data = load_json_file(os.path.join(
+                        os.path.dirname(os.path.abspath(__file__)),
+                        _MIoTSpecMultiLang._MULTI_LANG_FILE))
+                except Exception as err:
+                    _LOGGER.error('multi lang, load json file error, %s', err)
+                _MIoTSpecMultiLang._bundled_data = (
+                    data if isinstance(data, dict) else {})
+            return _MIoTSpecMultiLang._bundled_data
+
+    async def set_spec_async(self, urn: str, refresh: bool = False) -> None:
+        if not refresh and urn in self._custom_cache:
             self._current_data = self._custom_cache[urn]
             return
 
         trans_cache: dict[str, str] = {}
-        trans_cloud: dict = {}
+        trans_default: dict[str, str] = {}
         trans_local: dict = {}
-        # Get multi lang from cloud
-        try:
-            trans_cloud = await self.__get_multi_lang_async(urn)
-            if self._lang == 'zh-Hans':
-                # Simplified Chinese
-                trans_cache = trans_cloud.get('zh_cn', {})
-            elif self._lang == 'zh-Hant':
-                # Traditional Chinese, zh_hk or zh_tw
-                trans_cache = trans_cloud.get('zh_hk', {})
-                if not trans_cache:
-                    trans_cache = trans_cloud.get('zh_tw', {})
-            else:
-                trans_cache = trans_cloud.get(self._lang, {})
-        except Exception as err:
-            trans_cloud = {}
-            _LOGGER.info('get multi lang from cloud failed, %s, %s', urn, err)
+        # Get multi lang from cloud, use the cache if it is not expired
+        cloud_item = await self.__get_cloud_item_async(
+            urn=urn, refresh=refresh)
+        if cloud_item:
+            trans_cache.update(cloud_item['data'])
+            trans_default.update(cloud_item['default'])
         # Get multi lang from local
-        try:
-            trans_local = await self._storage.load_async(domain=self._DOMAIN,
-                                                         name=urn,
-                                                         type_=dict
-                                                        )  # type: ignore
-            if (isinstance(trans_local, dict) and self._lang in trans_local):
-                trans_cache.update(trans_local[self._lang])
-        except Exception as err:
-            trans_local = {}
-            _LOGGER.info('get multi lang from local failed, %s, %s', urn, err)
-        # Revert: load multi_lang.json
-        try:
-            trans_local_json = await self._main_loop.run_in_executor(
-                None, load_json_file,
-                os.path.join(os.path.dirname(os.path.abspath(__file__)),
-                             self._MULTI_LANG_FILE))
-            urn_strs: list[str] = urn.split(':')
-            urn_key: str = ':'.join(urn_strs[:6])
-            if (isinstance(trans_local_json, dict) and
-                    urn_key in trans_local_json and
-                    self._lang in trans_local_json[urn_key]):
-                trans_cache.update(trans_local_json[urn_key][self._lang])
-                trans_local = trans_local_json[urn_key]
-        except Exception as err:  # pylint: disable=broad-exception-caught
-            _LOGGER.error('multi lang, load json file error, %s', err)
+        if self._local_names is None or urn in self._local_names:
+            try:
+                trans_local = await self._storage.load_async(
+                    domain=self._DOMAIN, name=urn,
+                    type_=dict)  # type: ignore
+                if (isinstance(trans_local, dict)
+                        and self._lang in trans_local):
+                    trans_cache.update(trans_local[self._lang])
+            except Exception as err:
+                trans_local = {}
+                _LOGGER.info(
+                    'get multi lang from local failed, %s, %s', urn, err)
+        # Revert: multi_lang.json
+        bundled_data = (
+            _MIoTSpecMultiLang._bundled_data
+            or _MIoTSpecMultiLang.load_bundled_data())
+        urn_key: str = ':'.join(urn.split(':')[:6])
+        if urn_key in bundled_data and self._lang in bundled_data[urn_key]:
+            trans_cache.update(bundled_data[urn_key][self._lang])
+            trans_local = bundled_data[urn_key]
         # Revert end
         # Default language
         if not trans_cache:
-            if trans_cloud and DEFAULT_INTEGRATION_LANGUAGE in trans_cloud:
-                trans_cache = trans_cloud[DEFAULT_INTEGRATION_LANGUAGE]
-            if trans_local and DEFAULT_INTEGRATION_LANGUAGE in trans_local:
+            trans_cache = trans_default
+            if (isinstance(trans_local, dict)
+                    and DEFAULT_INTEGRATION_LANGUAGE in trans_local):
                 trans_cache.update(trans_local[DEFAULT_INTEGRATION_LANGUAGE])
         trans_data: dict[str, str] = {}
         for tag, value in trans_cache.items():
@@ -920,6 +1194,46 @@ class _MIoTSpecMultiLang:
             return None
         return self._current_data.get(key, None)
 
+    async def __get_cloud_item_async(
+        self, urn: str, refresh: bool
+    ) -> Optional[dict]:
+        if self._cloud_cache is None:
+            await self.init_async()
+        assert self._cloud_cache is not None
+        cloud_item = self._cloud_cache.get(urn, None)
+        if (
+            not refresh
+            and isinstance(cloud_item, dict)
+            and int(time.time()) - cloud_item.get('ts', 0)
+            < SPEC_MULTI_LANG_EFFECTIVE_TIME
+        ):
+            return cloud_item
+        try:
+            trans_cloud = await self.__get_multi_lang_async(urn)
+        except Exception as err:
+            _LOGGER.info('get multi lang from cloud failed, %s, %s', urn, err)
+            # Use the expired cache if the cloud is unavailable
+            return cloud_item if isinstance(cloud_item, dict) else None
+        if self._lang == 'zh-Hans':
+            # Simplified Chinese
+            trans_lang = trans_cloud.get('zh_cn', {})
+        elif self._lang == 'zh-Hant':
+            # Traditional Chinese, zh_hk or zh_tw
+            trans_lang = trans_cloud.get('zh_hk', {})
+            if not trans_lang:
+                trans_lang = trans_cloud.get('zh_tw', {})
+        else:
+            trans_lang = trans_cloud.get(self._lang, {})
+        # Only keep the current and the default language
+        cloud_item = {
+            'ts': int(time.time()),
+            'data': trans_lang or {},
+            'default': trans_cloud.get(DEFAULT_INTEGRATION_LANGUAGE, None)
+            or {}}
+        self._cloud_cache[urn] = cloud_item
+        self._cloud_cache_dirty = True
+        return cloud_item
+
     async def __get_multi_lang_async(self, urn: str) -> dict:
         res_trans = await MIoTHttp.get_json_async(
             url='https://miot-spec.org/instance/v2/multiLanguage',
@@ -1247,11 +1561,77 @@ class _SpecModify:
         return prop.get(key, None)
 
 
+class MIoTSpecCache:
+    """Process-wide cache of spec dicts, keyed by (urn, lang).
+
+    Saves the storage reads of specs already loaded or parsed. Every parse
+    still builds its own MIoTSpecInstance from the dict, since
+    spec_transform() marks the spec objects. Entries are evicted least
+    recently used first, and dropped when the spec is refreshed.
+    """
+    CAPACITY: int = 256
+    _entries: OrderedDict[tuple[str, str], dict]
+    _hits: int
+    _misses: int
+
+    def __init__(self) -> None:
+        self._entries = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: tuple[str, str]) -> bool:
+        return key in self._entries
+
+    def get(self, urn: str, lang: str) -> Optional[dict]:
+        specs = self._entries.get((urn, lang), None)
+        if specs is None:
+            self._misses += 1
+            return None
+        self._entries.move_to_end((urn, lang))
+        self._hits += 1
+        return specs
+
+    def put(self, urn: str, lang: str, specs: dict) -> None:
+        """Add or replace an entry, the dict MUST NOT be modified later."""
+        self._entries[(urn, lang)] = specs
+        self._entries.move_to_end((urn, lang))
+        self.__evict()
+
+    def invalidate(self, urn: str, lang: Optional[str] = None) -> None:
+        """Drop the entries of an urn, in one or all languages."""
+        for key in [
+            key for key in self._entries
+            if key[0] == urn and (lang is None or key[1] == lang)
+        ]:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {
+            'length': len(self._entries),
+            'hits': self._hits,
+            'misses': self._misses}
+
+    def __evict(self) -> None:
+        while len(self._entries) > self.CAPACITY:
+            self._entries.popitem(last=False)
+
+
 class MIoTSpecParser:
     """MIoT SPEC parser."""
     # pylint: disable=inconsistent-quotes
     VERSION: int = 1
+    # Concurrent parse tasks of parse_many_async
+    PARSE_CONCURRENCY: int = 8
     _DOMAIN: str = 'miot_specs'
+    # Shared by all parsers of the process
+    _SHARED_CACHE: MIoTSpecCache = MIoTSpecCache()
     _lang: str
     _storage: MIoTStorage
     _main_loop: asyncio.AbstractEventLoop
@@ -1264,6 +1644,8 @@ class MIoTSpecParser:
     _spec_modify: _SpecModify
 
     _init_done: bool
+    _cache_hits: int
+    _cache_misses: int
 
     def __init__(self,
                  lang: Optional[str],
@@ -1283,10 +1665,22 @@ class MIoTSpecParser:
         self._spec_modify = _SpecModify(loop=self._main_loop)
 
         self._init_done = False
+        self._cache_hits = 0
+        self._cache_misses = 0
+
+    @staticmethod
+    def shared_cache() -> MIoTSpecCache:
+        return MIoTSpecParser._SHARED_CACHE
+
+    @property
+    def cache_stats(self) -> dict[str, int]:
+        return {'hits': self._cache_hits, 'misses': self._cache_misses}
 
     async def init_async(self) -> None:
         if self._init_done is True:
             return
+        await self._storage.spec_store.init_async()
+        await self._multi_lang.init_async()
         await self._bool_trans.init_async()
         await self._spec_filter.init_async()
         await self._spec_add.init_async()
@@ -1326,6 +1720,7 @@ class MIoTSpecParser:
     async def deinit_async(self) -> None:
         self._init_done = False
         # self._std_lib.deinit()
+        await self._multi_lang.deinit_async()
         await self._bool_trans.deinit_async()
         await self._spec_filter.deinit_async()
         await self._spec_add.deinit_async()
@@ -1338,18 +1733,49 @@ class MIoTSpecParser:
     ) -> Optional[MIoTSpecInstance]:
         """MUST await init first !!!"""
         if not skip_cache:
-            cache_result = await self.__cache_get(urn=urn)
+            cache_result = self._SHARED_CACHE.get(urn=urn, lang=self._lang)
+            if cache_result is None:
+                cache_result = await self.__cache_get(urn=urn)
+                if isinstance(cache_result, dict):
+                    self._SHARED_CACHE.put(
+                        urn=urn, lang=self._lang, specs=cache_result)
             if isinstance(cache_result, dict):
                 _LOGGER.debug('get from cache, %s', urn)
+                self._cache_hits += 1
                 return MIoTSpecInstance.load(specs=cache_result)
+            self._cache_misses += 1
         # Retry three times
         for index in range(3):
             try:
-                return await self.__parse(urn=urn)
+                return await self.__parse(urn=urn, refresh=skip_cache)
             except Exception as err:  # pylint: disable=broad-exception-caught
                 _LOGGER.error('parse error, retry, %d, %s, %s', index, urn, err)
         return None
 
+    async def parse_many_async(
+        self, urn_list: list[str]
+    ) -> dict[str, Optional[MIoTSpecInstance]]:
+        """Parse the distinct urns concurrently, return {urn: instance}.
+        MUST await init first !!!"""
+        semaphore = asyncio.Semaphore(self.PARSE_CONCURRENCY)
+
+        async def parse_with_limit(urn: str) -> Optional[MIoTSpecInstance]:
+            async with semaphore:
+                return await self.parse(urn=urn)
+        urns = list(dict.fromkeys(urn_list))
+        # Load the cached specs in one batch
+        for (urn, _), specs in (
+            await self._storage.spec_store.get_many_async(
+                keys=[
+                    (urn, self._lang) for urn in urns
+                    if (urn, self._lang) not in self._SHARED_CACHE],
+                version=self.VERSION)
+        ).items():
+            self._SHARED_CACHE.put(urn=urn, lang=self._lang, specs=specs)
+        results = await asyncio.gather(*[
+            parse_with_limit(urn=urn) for urn in urns])
+        return dict(zip(urns, results))
+
     async def refresh_async(self, urn_list: list[str]) -> int:
         """MUST await init first !!!"""
         if not urn_list:
@@ -1365,6 +1791,10 @@ class MIoTSpecParser:
                 _LOGGER.error('save spec std lib failed')
         else:
             raise MIoTSpecError('get spec std lib failed')
+        # The std lib and translations changed, a failed refresh must not
+        # leave the old spec in the shared cache
+        for urn in urn_list:
+            self._SHARED_CACHE.invalidate(urn=urn)
         success_count = 0
         for index in range(0, len(urn_list), 5):
             batch = urn_list[index:index + 5]
@@ -1378,25 +1808,24 @@ class MIoTSpecParser:
         return success_count
 
     async def __cache_get(self, urn: str) -> Optional[dict]:
-        if platform.system() == 'Windows':
-            urn = urn.replace(':', '_')
-        return await self._storage.load_async(domain=self._DOMAIN,
-                                              name=f'{urn}_{self._lang}',
-                                              type_=dict)  # type: ignore
+        return await self._storage.spec_store.get_async(
+            urn=urn, lang=self._lang, version=self.VERSION)
 
     async def __cache_set(self, urn: str, data: dict) -> bool:
-        if platform.system() == 'Windows':
-            urn = urn.replace(':', '_')
-        return await self._storage.save_async(domain=self._DOMAIN,
-                                              name=f'{urn}_{self._lang}',
-                                              data=data)
+        # Replace the shared entry, instances loaded from the old one are
+        # not affected
+        self._SHARED_CACHE.put(urn=urn, lang=self._lang, specs=data)
+        return await self._storage.spec_store.set_async(
+            urn=urn, lang=self._lang, data=data, version=self.VERSION)
 
     async def __get_instance(self, urn: str) -> Optional[dict]:
         return await MIoTHttp.get_json_async(
             url='https://miot-spec.org/miot-spec-v2/instance',
             params={'type': urn})
 
-    async def __parse(self, urn: str) -> MIoTSpecInstance:
+    async def __parse(
+        self, urn: str, refresh: bool = False
+    ) -> MIoTSpecInstance:
         _LOGGER.debug('parse urn, %s', urn)
         # Load spec instance
         instance = await self.__get_instance(urn=urn)
@@ -1406,7 +1835,7 @@ class MIoTSpecParser:
         urn_strs: list[str] = urn.split(':')
         urn_key: str = ':'.join(urn_strs[:6])
         # Set translation cache
-        await self._multi_lang.set_spec_async(urn=urn)
+        await self._multi_lang.set_spec_async(urn=urn, refresh=refresh)
         # Set spec filter
         await self._spec_filter.set_spec_spec(urn_key=urn_key)
         # Set spec add
@@ -50,6 +50,8 @@ import asyncio
 import binascii
 import json
 import shutil
+import sqlite3
+import threading
 import time
 import traceback
 import hashlib
@@ -96,6 +98,7 @@ class MIoTStorage:
     _file_future: dict[str, tuple[MIoTStorageType, asyncio.Future]]
 
     _root_path: str
+    _spec_store: Optional['MIoTSpecStore']
 
     def __init__(
         self, root_path: str,
@@ -107,9 +110,22 @@ class MIoTStorage:
 
         self._root_path = os.path.abspath(root_path)
         os.makedirs(self._root_path, exist_ok=True)
+        self._spec_store = None
 
         _LOGGER.debug('root path, %s', self._root_path)
 
+    @property
+    def root_path(self) -> str:
+        return self._root_path
+
+    @property
+    def spec_store(self) -> 'MIoTSpecStore':
+        """Spec cache database, created on first use."""
+        if self._spec_store is None:
+            self._spec_store = MIoTSpecStore(
+                storage=self, loop=self._main_loop)
+        return self._spec_store
+
     def __get_full_path(self, domain: str, name: str, suffix: str) -> str:
         return os.path.join(
             self._root_path, domain, f'{name}.{suffix}')
@@ -537,6 +553,207 @@ class MIoTStorage:
         return result
 
 
+class MIoTSpecStore:
+    """Spec cache in one sqlite database, keyed by (urn, lang).
+
+    Records carry a SHA-256 checksum and the spec format version, records
+    failing either are ignored. All blocking work runs in the executor,
+    get_many_async reads a batch in one call. The first init imports and
+    removes the legacy per-urn cache files.
+    """
+    SCHEMA_VERSION: int = 1
+    DOMAIN: str = 'miot_specs'
+    DB_NAME: str = 'specs.db'
+    _main_loop: asyncio.AbstractEventLoop
+    _storage: MIoTStorage
+    _db_path: str
+    _db: Optional[sqlite3.Connection]
+    _lock: threading.Lock
+    _init_done: bool
+
+    def __init__(
+        self, storage: MIoTStorage,
+        loop: Optional[asyncio.AbstractEventLoop] = None
+    ) -> None:
+        self._main_loop = loop or asyncio.get_running_loop()
+        self._storage = storage
+        self._db_path = os.path.join(
+            storage.root_path, self.DOMAIN, self.DB_NAME)
+        self._db = None
+        self._lock = threading.Lock()
+        self._init_done = False
+
+    async def init_async(self) -> None:
+        if self._init_done:
+            return
+        await self._main_loop.run_in_executor(None, self.__init)
+        self._init_done = True
+
+    async def get_async(
+        self, urn: str, lang: str, version: int
+    ) -> Optional[dict]:
+        result = await self.get_many_async(
+            keys=[(urn, lang)], version=version)
+        return result.get((urn, lang), None)
+
+    async def get_many_async(
+        self, keys: list[tuple[str, str]], version: int
+    ) -> dict[tuple[str, str], dict]:
+        if not keys:
+            return {}
+        return await self._main_loop.run_in_executor(
+            None, self.__get_many, keys, version)
+
+    async def set_async(
+        self, urn: str, lang: str, data: dict, version: int
+    ) -> bool:
+        return await self._main_loop.run_in_executor(
+            None, self.__set_many, [(urn, lang, data)], version)
+
+    async def remove_async(self, urn: str, lang: Optional[str] = None) -> bool:
+        return await self._main_loop.run_in_executor(
+            None, self.__remove, urn, lang)
+
+    def __connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(os.path.dirname(self._db_path), exist_ok=True)
+            # Guarded by _lock, called from executor threads
+            self._db = sqlite3.connect(
+                self._db_path, check_same_thread=False)
+        return self._db
+
+    def __init(self) -> None:
+        with self._lock:
+            try:
+                db = self.__connect()
+                schema_version: int = db.execute(
+                    'PRAGMA user_version').fetchone()[0]
+                if schema_version != self.SCHEMA_VERSION:
+                    if schema_version:
+                        _LOGGER.info(
+                            'spec store schema changed, %s -> %s, rebuild',
+                            schema_version, self.SCHEMA_VERSION)
+                    with db:
+                        db.execute('DROP TABLE IF EXISTS specs')
+                        db.execute('DROP TABLE IF EXISTS meta')
+                        db.execute(
+                            'CREATE TABLE specs (urn TEXT NOT NULL, '
+                            'lang TEXT NOT NULL, version INTEGER NOT NULL, '
+                            'ts INTEGER NOT NULL, checksum BLOB NOT NULL, '
+                            'data BLOB NOT NULL, PRIMARY KEY (urn, lang))')
+                        db.execute(
+                            'CREATE TABLE meta (key TEXT PRIMARY KEY, '
+                            'value TEXT)')
+                        db.execute(
+                            f'PRAGMA user_version = {self.SCHEMA_VERSION}')
+                if db.execute(
+                    'SELECT value FROM meta WHERE key = ?', ('migrated',)
+                ).fetchone() is None:
+                    self.__migrate(db=db)
+            except sqlite3.Error as err:
+                _LOGGER.error(
+                    'spec store init error, %s, %s',
+                    err, traceback.format_exc())
+
+    def __migrate(self, db: sqlite3.Connection) -> None:
+        """Import the legacy <urn>_<lang>.dict cache files."""
+        records: list[tuple[str, str, dict]] = []
+        legacy_names: list[str] = []
+        for name in self._storage.get_names(domain=self.DOMAIN, type_=dict):
+            data = self._storage.load(
+                domain=self.DOMAIN, name=name, type_=dict)
+            if (
+                not isinstance(data, dict)
+                or 'urn' not in data
+                or 'services' not in data
+                or '_' not in name
+            ):
+                # spec_std_lib, manufacturer and other cache files
+                continue
+            records.append((data['urn'], name.rsplit('_', 1)[1], data))
+            legacy_names.append(name)
+        # The legacy files have no version, they match the first one
+        self.__write(db=db, records=records, version=1)
+        with db:
+            db.execute(
+                'INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                ('migrated', str(int(time.time()))))
+        for name in legacy_names:
+            self._storage.remove(domain=self.DOMAIN, name=name, type_=dict)
+        _LOGGER.info('spec store migrate, %d specs', len(records))
+
+    def __get_many(
+        self, keys: list[tuple[str, str]], version: int
+    ) -> dict[tuple[str, str], dict]:
+        result: dict[tuple[str, str], dict] = {}
+        with self._lock:
+            try:
+                db = self.__connect()
+                for index in range(0, len(keys), 200):
+                    batch = keys[index:index+200]
+                    rows = db.execute(
+                        'SELECT urn, lang, version, checksum, data FROM specs '
+                        'WHERE (urn, lang) IN (VALUES '
+                        + ', '.join(['(?, ?)']*len(batch)) + ')',
+                        [item for key in batch for item in key]).fetchall()
+                    for urn, lang, row_version, checksum, data in rows:
+                        if row_version != version:
+                            continue
+                        if hashlib.sha256(data).digest() != checksum:
+                            _LOGGER.error(
+                                'spec store checksum error, %s, %s',
+                                urn, lang)
+                            continue
+                        result[(urn, lang)] = json.loads(data)
+            except (sqlite3.Error, ValueError) as err:
+                _LOGGER.error('spec store get error, %s', err)
+        return result
+
+    def __set_many(
+        self, records: list[tuple[str, str, dict]], version: int
+    ) -> bool:
+        with self._lock:
+            try:
+                self.__write(
+                    db=self.__connect(), records=records, version=version)
+                return True
+            except (sqlite3.Error, TypeError, ValueError) as err:
+                _LOGGER.error('spec store set error, %s', err)
+                return False
+
+    def __write(
+        self, db: sqlite3.Connection,
+        records: list[tuple[str, str, dict]], version: int
+    ) -> None:
+        rows: list[tuple] = []
+        ts = int(time.time())
+        for urn, lang, data in records:
+            data_bytes = json.dumps(data).encode('utf-8')
+            rows.append((
+                urn, lang, version, ts, hashlib.sha256(data_bytes).digest(),
+                data_bytes))
+        with db:
+            db.executemany(
+                'INSERT OR REPLACE INTO specs VALUES (?, ?, ?, ?, ?, ?)',
+                rows)
+
+    def __remove(self, urn: str, lang: Optional[str]) -> bool:
+        with self._lock:
+            try:
+                db = self.__connect()
+                with db:
+                    if lang is None:
+                        db.execute('DELETE FROM specs WHERE urn = ?', (urn,))
+                    else:
+                        db.execute(
+                            'DELETE FROM specs WHERE urn = ? AND lang = ?',
+                            (urn, lang))
+                return True
+            except sqlite3.Error as err:
+                _LOGGER.error('spec store remove error, %s', err)
+                return False
+
+
 class MIoTCert:
     """MIoT certificate file management."""
     CERT_DOMAIN: str = 'cert'
@@ -40,12 +40,15 @@ def load_py_file():
         'common.py',
         'const.py',
         'miot_cloud.py',
+        'miot_entity.py',
         'miot_error.py',
         'miot_i18n.py',
         'miot_lan.py',
         'miot_mdns.py',
         'miot_mips.py',
         'miot_network.py',
+        'miot_prop.py',
+        'miot_route.py',
         'miot_spec.py',
         'miot_storage.py']
     makedirs(TEST_CACHE_PATH, exist_ok=True)
@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 """Unit test for miot_common.py."""
+import logging
 import pytest
 
+_LOGGER = logging.getLogger(__name__)
+
 # pylint: disable=import-outside-toplevel, unused-argument
 
 
@@ -30,3 +33,214 @@ def test_miot_matcher():
     match_result: list[str] = list(matcher.iter_match(topic='test/1/1'))
     assert len(match_result) == 2
     assert set(match_result) == set(['test/+/1', 'test/1/#'])
+
+
+@pytest.mark.github
+def test_miot_dispatch_index():
+    from miot.common import MIoTDispatchIndex
+
+    index: MIoTDispatchIndex = MIoTDispatchIndex()
+    for siid in range(1, 11):
+        for piid in range(1, 11):
+            index[('did1', 'p', siid, piid)] = f'did1/p/{siid}/{piid}'
+    index[('did1', 'p', None, None)] = 'did1/p/#'
+    index[('did1', 'e', 2, 1)] = 'did1/e/2/1'
+    assert len(index) == 102
+    assert ('did1', 'p', None, None) in index
+    assert index.match('did1', 'p', 1, 1) == ['did1/p/1/1', 'did1/p/#']
+    assert index.match('did1', 'p', 11, 1) == ['did1/p/#']
+    assert index.match('did1', 'e', 2, 1) == ['did1/e/2/1']
+    assert not index.match('did2', 'p', 1, 1)
+    # Delete
+    assert index.pop(('did1', 'p', 1, 1)) == 'did1/p/1/1'
+    assert index.pop(('did1', 'p', 1, 1)) is None
+    assert index.pop(('did1', 'p', None, None)) == 'did1/p/#'
+    assert not index.match('did1', 'p', 1, 1)
+    assert len(index.items()) == 100
+    assert (('did1', 'e', 2, 1), 'did1/e/2/1') in index.items()
+
+
+@pytest.mark.github
+def test_miot_dispatch_index_cloud_topic():
+    from miot.common import MIoTDispatchIndex
+    from miot.miot_mips import MipsCloudClient
+
+    # pylint: disable=protected-access
+    topic_key = MipsCloudClient._MipsCloudClient__topic_key
+    assert topic_key('device/did1/up/properties_changed/2/1') == (
+        'did1', 'p', '2', '1')
+    assert topic_key('device/did1/up/event_occured/#') == (
+        'did1', 'e', None, None)
+    # Topics without the two ids only match the wildcard, like the '#'
+    assert topic_key('device/did1/up/properties_changed') == (
+        'did1', 'p', None, None)
+    assert topic_key('device/did1/up/properties_changed/2') == (
+        'did1', 'p', None, None)
+    assert topic_key('device/did1/up/event_occured') == (
+        'did1', 'e', None, None)
+    assert topic_key('device/did1/up') is None
+    assert topic_key('device/did1/up/properties_changed/2/1/0') is None
+    assert topic_key('device/did1/state/#') is None
+
+    index: MIoTDispatchIndex = MIoTDispatchIndex()
+    index[('did1', 'p', '2', '1')] = 'did1/p/2/1'
+    assert not index.match(*topic_key('device/did1/up/properties_changed'))
+    index[topic_key('device/did1/up/properties_changed/#')] = 'did1/p/#'
+    assert index.match(*topic_key(
+        'device/did1/up/properties_changed')) == ['did1/p/#']
+    assert index.match(*topic_key(
+        'device/did1/up/properties_changed/2/1')) == [
+        'did1/p/2/1', 'did1/p/#']
+
+
+def test_miot_dispatch_index_benchmark():
+    """Matcher cost per message with 10k subscriptions."""
+    import random
+    import timeit
+    from miot.common import MIoTDispatchIndex, MIoTMatcher
+
+    matcher: MIoTMatcher = MIoTMatcher()
+    index: MIoTDispatchIndex = MIoTDispatchIndex()
+    for did in range(500):
+        for siid in range(2, 6):
+            for piid in range(1, 6):
+                matcher[f'{did}/p/{siid}/{piid}'] = True
+                index[(str(did), 'p', siid, piid)] = True
+    assert len(index) == 10000
+    rand = random.Random(0)
+    msgs = [
+        {'did': str(rand.randrange(500)), 'siid': rand.randrange(2, 6),
+         'piid': rand.randrange(1, 6)} for _ in range(10000)]
+
+    def match_matcher():
+        for msg in msgs:
+            list(matcher.iter_match(
+                f'{msg["did"]}/p/{msg["siid"]}/{msg["piid"]}'))
+
+    def match_index():
+        for msg in msgs:
+            index.match(msg['did'], 'p', msg['siid'], msg['piid'])
+    matcher_cost = min(timeit.repeat(match_matcher, number=1, repeat=3))
+    index_cost = min(timeit.repeat(match_index, number=1, repeat=3))
+    _LOGGER.info(
+        'matcher, %.3f us/msg, index, %.3f us/msg',
+        matcher_cost/len(msgs)*1e6, index_cost/len(msgs)*1e6)
+    for msg in msgs[:100]:
+        assert index.match(msg['did'], 'p', msg['siid'], msg['piid']) == list(
+            matcher.iter_match(
+                f'{msg["did"]}/p/{msg["siid"]}/{msg["piid"]}'))
+
+
+@pytest.mark.github
+@pytest.mark.asyncio
+async def test_miot_timer_wheel_async():
+    import asyncio
+    from miot.common import MIoTTimerWheel
+
+    loop = asyncio.get_running_loop()
+    wheel = MIoTTimerWheel(loop=loop, tick=0.01)
+    expired: list[str] = []
+    wheel.add('a', 0.02, expired.append, 'a')
+    wheel.add('b', 0.05, expired.append, 'b')
+    wheel.add('c', 0.02, expired.append, 'c')
+    wheel.add('dup', 0.02)
+    assert len(wheel) == 4 and 'dup' in wheel
+    assert wheel.cancel('c')
+    assert not wheel.cancel('c')
+    await asyncio.sleep(0.04)
+    assert expired == ['a']
+    assert 'dup' not in wheel
+    await asyncio.sleep(0.04)
+    assert expired == ['a', 'b']
+    assert len(wheel) == 0
+    wheel.clear()
+
+
+@pytest.mark.github
+@pytest.mark.asyncio
+async def test_miot_dispatcher_async():
+    import asyncio
+    import threading
+    import time
+    from miot.common import MIoTDispatcher
+
+    dispatcher = MIoTDispatcher(loop=asyncio.get_running_loop())
+    main_thread = threading.current_thread()
+    calls: list[int] = []
+
+    def on_call(value: int) -> None:
+        assert threading.current_thread() is main_thread
+        calls.append(value)
+
+    def on_error(value: int) -> None:
+        raise RuntimeError(f'error {value}')
+
+    # Calls from another thread wake up the loop once
+    def producer() -> None:
+        for value in range(100):
+            dispatcher.dispatch(on_call, value)
+        dispatcher.dispatch(on_error, 100)
+        dispatcher.dispatch(on_call, 101)
+    thread = threading.Thread(target=producer)
+    thread.start()
+    thread.join()
+    assert not calls and len(dispatcher) == 102
+    await asyncio.sleep(0.01)
+    # A handler error does not stop the drain
+    assert calls == [*range(100), 101]
+    stats = dispatcher.stats
+    assert stats['wakeups'] == 1
+    assert stats['callbacks'] == 102
+    assert stats['max_batch'] == 102 and stats['max_depth'] == 102
+    assert stats['deferred'] == 0 and stats['depth'] == 0
+
+    # Out of budget, the rest is deferred to the next loop iteration
+    def on_slow_call(value: int) -> None:
+        time.sleep(0.002)
+        calls.append(value)
+    calls.clear()
+    dispatcher.BUDGET_S = 0.001
+    for value in range(3):
+        dispatcher.dispatch(on_slow_call, value)
+    await asyncio.sleep(0)
+    assert calls == [0]
+    assert len(dispatcher) == 2
+    await asyncio.sleep(0.01)
+    assert calls == [0, 1, 2]
+    stats = dispatcher.stats
+    assert stats['wakeups'] == 4
+    assert stats['deferred'] == 2
+    assert stats['last_batch'] == 1 and stats['depth'] == 0
+
+
+@pytest.mark.asyncio
+async def test_miot_timer_wheel_benchmark_async():
+    """Loop heap size under a synthetic 5k msg/s dedupe load."""
+    import asyncio
+    from miot.common import MIoTTimerWheel
+
+    loop = asyncio.get_running_loop()
+    rate, duration, step = 5000, 1.0, 0.02
+    # pylint: disable=protected-access
+    handles: dict[int, asyncio.TimerHandle] = {}
+    max_heap = 0
+    for index in range(int(rate*duration)):
+        handles[index] = loop.call_later(5, handles.pop, index)
+        if index % int(rate*step) == 0:
+            await asyncio.sleep(step)
+            max_heap = max(max_heap, len(loop._scheduled))
+    for handle in handles.values():
+        handle.cancel()
+    await asyncio.sleep(0)
+    _LOGGER.info('call_later, max loop heap size, %d', max_heap)
+
+    wheel = MIoTTimerWheel(loop=loop)
+    max_heap = 0
+    for index in range(int(rate*duration)):
+        wheel.add(index, 5)
+        if index % int(rate*step) == 0:
+            await asyncio.sleep(step)
+            max_heap = max(max_heap, len(loop._scheduled))
+    wheel.clear()
+    _LOGGER.info('timer wheel, max loop heap size, %d', max_heap)
+    assert max_heap <= 2
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""Unit test for miot_entity.py."""
+import json
+import pytest
+
+# pylint: disable=import-outside-toplevel, unused-argument
+
+
+def _spec_dump_for_test() -> dict:
+    services = []
+    for siid in range(2, 5):
+        props = [{
+            'type': f'urn:miot-spec-v2:property:p-{piid}:000000{piid}:1',
+            'name': f'p-{piid}', 'iid': piid,
+            'description': f'Property {piid}', 'description_trans': '属性',
+            'format': 'bool' if piid == 1 else 'uint8',
+            'access': (
+                ['read', 'notify'] if piid == 3 else
+                [] if piid == 5 else ['read', 'write', 'notify']),
+            'unit': 'celsius' if piid == 3 else None,
+            'value_range': [0, 100, 1] if piid in (3, 4) else None,
+            'value_list': [
+                {'name': f'mode_{index}', 'value': index,
+                 'description': f'Mode {index}'} for index in range(4)
+            ] if piid == 2 else None} for piid in range(1, 6)]
+        services.append({
+            'type': f'urn:miot-spec-v2:service:test-{siid}:0000780{siid}:1',
+            'name': 'light' if siid == 2 else f'test-{siid}', 'iid': siid,
+            'description': f'Service {siid}', 'description_trans': '服务',
+            'properties': props,
+            'events': [{
+                'type': 'urn:miot-spec-v2:event:e-1:00005001:1',
+                'name': 'click' if siid == 3 else 'e-1', 'iid': 1,
+                'description': 'Event', 'description_trans': '事件',
+                'argument': [1]}],
+            'actions': [{
+                'type': f'urn:miot-spec-v2:action:a-{aiid}:0000280{aiid}:1',
+                'name': f'a-{aiid}', 'iid': aiid, 'description': 'Action',
+                'description_trans': '动作', 'in': [1] if aiid == 1 else [],
+                'out': []} for aiid in (1, 2)]})
+    return {
+        'urn': 'urn:miot-spec-v2:device:light:0000A001:test-plan:1',
+        'name': 'light', 'description': 'Light', 'description_trans': '灯',
+        'services': services}
+
+
+class _TestDevice:
+    """Stand-in for MIoTDevice, the transform sets the same spec fields
+    and lists as MIoTDevice.spec_transform() without Home Assistant."""
+
+    def __init__(self, spec_instance) -> None:
+        self.spec_instance = spec_instance
+        self.entity_list: dict = {}
+        self.prop_list: dict = {}
+        self.event_list: dict = {}
+        self.action_list: dict = {}
+
+    def append_entity(self, entity_data) -> None:
+        self.entity_list.setdefault(entity_data.platform, []).append(
+            entity_data)
+
+    def transform(self) -> None:
+        from miot.miot_entity import MIoTEntityData
+
+        for service in self.spec_instance.services:
+            if service.name == 'light':
+                # Service entity
+                entity_data = MIoTEntityData(platform='light', spec=service)
+                entity_data.device_class = 'light'
+                entity_data.props = {
+                    prop for prop in service.properties if prop.writable}
+                entity_data.actions = set(service.actions)
+                for prop in entity_data.props:
+                    prop.platform = 'light'
+                service.platform = 'light'
+                service.entity_category = 'config'
+                self.append_entity(entity_data=entity_data)
+            for prop in service.properties:
+                if prop.platform or not prop.access:
+                    continue
+                if prop.unit:
+                    prop.external_unit = '°C'
+                    prop.icon = 'mdi:temperature-celsius'
+                    prop.device_class = 'temperature'
+                    prop.state_class = 'measurement'
+                if prop.writable:
+                    prop.platform = (
+                        'switch' if prop.format_ == bool else
+                        'select' if prop.value_list else 'number')
+                else:
+                    prop.platform = 'sensor'
+                self.prop_list.setdefault(prop.platform, []).append(prop)
+            for event in service.events:
+                event.platform = 'event'
+                if event.name == 'click':
+                    event.device_class = 'button'
+                self.event_list.setdefault('event', []).append(event)
+            for action in service.actions:
+                if action.platform:
+                    continue
+                action.platform = 'notify' if action.in_ else 'button'
+                self.action_list.setdefault(action.platform, []).append(
+                    action)
+
+
+def _device_result(device: _TestDevice) -> dict:
+    from miot.miot_entity import MIoTEntityPlan
+
+    spec_key = MIoTEntityPlan.spec_key
+    spec_index = MIoTEntityPlan.index_spec(
+        spec_instance=device.spec_instance)
+    return {
+        'entities': {
+            platform: [(
+                spec_key(entity_data.spec), entity_data.device_class,
+                sorted(spec_key(prop) for prop in entity_data.props),
+                sorted(spec_key(event) for event in entity_data.events),
+                sorted(spec_key(action) for action in entity_data.actions))
+                for entity_data in entity_list]
+            for platform, entity_list in device.entity_list.items()},
+        'props': {
+            platform: [spec_key(prop) for prop in prop_list]
+            for platform, prop_list in device.prop_list.items()},
+        'events': {
+            platform: [spec_key(event) for event in event_list]
+            for platform, event_list in device.event_list.items()},
+        'actions': {
+            platform: [spec_key(action) for action in action_list]
+            for platform, action_list in device.action_list.items()},
+        'specs': {
+            key: (
+                spec.platform, spec.external_unit, spec.icon,
+                spec.device_class, spec.state_class, spec.entity_category)
+            for key, spec in spec_index.items() if key}}
+
+
+@pytest.mark.github
+def test_entity_plan():
+    from miot.miot_entity import MIoTEntityPlan
+    from miot.miot_spec import MIoTSpecInstance
+
+    dump = json.dumps(_spec_dump_for_test())
+    # Transform the first device of the urn and record the plan
+    device_first = _TestDevice(MIoTSpecInstance.load(json.loads(dump)))
+    device_first.transform()
+    plan = MIoTEntityPlan(device=device_first)
+    # Apply the plan to the second device, same result as the transform
+    device_plan = _TestDevice(MIoTSpecInstance.load(json.loads(dump)))
+    assert plan.apply(device=device_plan)
+    device_transform = _TestDevice(MIoTSpecInstance.load(json.loads(dump)))
+    device_transform.transform()
+    result = _device_result(device_transform)
+    assert _device_result(device_plan) == result
+    assert set(result['props']) == {'switch', 'select', 'number', 'sensor'}
+    assert result['specs'][('p', 3, 3)] == (
+        'sensor', '°C', 'mdi:temperature-celsius', 'temperature',
+        'measurement', None)
+    assert result['specs'][('e', 3, 1)][3] == 'button'
+    # The spec objects of the device are used, not those of the plan
+    index_plan = MIoTEntityPlan.index_spec(
+        spec_instance=device_plan.spec_instance)
+    index_first = MIoTEntityPlan.index_spec(
+        spec_instance=device_first.spec_instance)
+    for prop_list in device_plan.prop_list.values():
+        for prop in prop_list:
+            key = MIoTEntityPlan.spec_key(prop)
+            assert index_plan[key] is prop
+            assert index_first[key] is not prop
+    entity_data = device_plan.entity_list['light'][0]
+    assert entity_data.spec is index_plan[('s', 2)]
+
+    # The spec keys differ, the plan is not applied
+    spec = json.loads(dump)
+    spec['services'][1]['properties'].pop(3)
+    device_other = _TestDevice(MIoTSpecInstance.load(spec))
+    assert not plan.apply(device=device_other)
+    assert not device_other.entity_list and not device_other.prop_list
+    assert all(
+        prop.platform is None
+        for service in device_other.spec_instance.services
+        for prop in service.properties)
+    device_other.transform()
+    assert _device_result(device_other)['props'] != result['props']
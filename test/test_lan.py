@@ -154,3 +154,80 @@ async def test_lan_async(test_devices: dict):
     await miot_lan.deinit_async()
     await mips_service.deinit_async()
     await miot_network.deinit_async()
+
+
+@pytest.mark.github
+@pytest.mark.asyncio
+async def test_lan_packet_memoryview_async():
+    from miot.miot_lan import _MIoTLanDevice
+
+    class _Manager:
+        def schedule_keep_alive(self, did, delay, handler, *args):
+            pass
+
+        def cancel_keep_alive(self, did):
+            pass
+
+    device = _MIoTLanDevice(
+        manager=_Manager(), did='123456',
+        token='11223344556677d9a03d43936fc38420')
+    msg = {'id': 1, 'result': [{'siid': 2, 'piid': 1, 'value': True}]}
+    buffer = bytearray(1400)
+    data_len = device.gen_packet(
+        out_buffer=buffer, clear_data=msg, did='123456', offset=0)
+    # Decrypt in place from a view of the receive buffer
+    assert device.decrypt_packet(memoryview(buffer)[:data_len]) == msg
+    device.on_delete()
+
+
+@pytest.mark.github
+@pytest.mark.asyncio
+async def test_lan_keep_alive_probe_queue_async():
+    from miot.common import MIoTTimerWheel
+    from miot.miot_lan import MIoTLan, _MIoTLanDevice, _MIoTLanDeviceState
+
+    loop = asyncio.get_running_loop()
+    # Only the keep alive scheduler of the manager is used
+    miot_lan = MIoTLan.__new__(MIoTLan)
+    # pylint: disable=protected-access
+    miot_lan._internal_loop = loop
+    miot_lan._timer_wheel = MIoTTimerWheel(loop=loop)
+    miot_lan._ka_probe_queues = {}
+    miot_lan._ka_probe_timer = None
+    pings: list[str] = []
+    miot_lan.ping = lambda if_name, target_ip: pings.append(target_ip)
+    miot_lan.OT_KA_PROBE_RATE = 20
+
+    devices = [
+        _MIoTLanDevice(
+            manager=miot_lan, did=f'{index}',
+            token='11223344556677d9a03d43936fc38420',
+            ip=f'192.168.1.{index}')
+        for index in range(10)]
+    for device in devices:
+        device._if_name = 'eth0'
+        device._ka_internal = device.KA_INTERVAL_MIN
+        device._MIoTLanDevice__update_keep_alive(
+            state=_MIoTLanDeviceState.PING1)
+    # Probes are queued, the ping timeout is not armed yet
+    assert len(miot_lan._ka_probe_queues['eth0']) == 10
+    assert all(('ka', device.did) not in miot_lan._timer_wheel
+               for device in devices)
+    # A device that answers drops its queued probe
+    devices[9].keep_alive(ip='192.168.1.9', if_name='eth0')
+    assert '9' not in miot_lan._ka_probe_queues['eth0']
+
+    # 2 probes per tick, the timeout starts when the probe is sent
+    await asyncio.sleep(0)
+    assert pings == ['192.168.1.0', '192.168.1.1']
+    assert ('ka', '0') in miot_lan._timer_wheel
+    assert ('ka', '2') not in miot_lan._timer_wheel
+    while miot_lan._ka_probe_queues:
+        await asyncio.sleep(miot_lan.OT_KA_PROBE_TICK)
+    assert pings == [f'192.168.1.{index}' for index in range(9)]
+    assert all(('ka', device.did) in miot_lan._timer_wheel
+               for device in devices)
+    assert devices[0]._state == _MIoTLanDeviceState.PING1
+    for device in devices:
+        device.on_delete()
+    assert len(miot_lan._timer_wheel) == 0
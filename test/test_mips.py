@@ -262,3 +262,352 @@ async def test_mips_cloud_async(
     await mips_cloud.disconnect_async()
     await mips_cloud.deinit_async()
     await miot_http.deinit_async()
+
+
+@pytest.mark.github
+def test_mips_message_codec():
+    import random
+    import struct
+    from miot.miot_mips import _MipsMessage, _MipsMsgTypeOptions
+
+    def legacy_pack(
+        mid: int, payload: str, msg_from: str, ret_topic: str
+    ) -> bytes:
+        # Reference layout, ASCII only
+        msg = struct.pack('<IBI', 4, _MipsMsgTypeOptions.ID.value, mid)
+        for value_type, value in (
+            (_MipsMsgTypeOptions.FROM.value, msg_from),
+            (_MipsMsgTypeOptions.RET_TOPIC.value, ret_topic),
+            (_MipsMsgTypeOptions.PAYLOAD.value, payload)
+        ):
+            if value_type != _MipsMsgTypeOptions.PAYLOAD.value and not value:
+                continue
+            msg += struct.pack(
+                f'<IB{len(value)}sx', len(value)+1, value_type,
+                value.encode('utf-8'))
+        return msg
+
+    alphabet = 'abcXYZ019/{}":,._-'
+    alphabet_unicode = alphabet + '中文客厅灯é€😀'
+    rand = random.Random(20241018)
+    for index in range(500):
+        chars = alphabet if index % 2 else alphabet_unicode
+        mid = rand.randint(0, 0xFFFFFFFF)
+        payload = ''.join(rand.choices(chars, k=rand.randint(0, 256)))
+        msg_from = ''.join(rand.choices(chars, k=rand.randint(0, 16)))
+        ret_topic = ''.join(rand.choices(chars, k=rand.randint(0, 64)))
+        data = _MipsMessage.pack(
+            mid=mid, payload=payload, msg_from=msg_from or None,
+            ret_topic=ret_topic or None)
+        msg = _MipsMessage.unpack(data)
+        assert msg.mid == mid
+        assert msg.payload == payload
+        assert msg.msg_from == (msg_from or None)
+        assert msg.ret_topic == (ret_topic or None)
+        if chars is alphabet:
+            assert data == legacy_pack(mid, payload, msg_from, ret_topic)
+        # Also accept bytearray and memoryview
+        assert _MipsMessage.unpack(bytearray(data)).payload == payload
+        assert _MipsMessage.unpack(memoryview(data)).mid == mid
+
+    # Fields in any order, unknown types are skipped
+    data = (
+        struct.pack('<IB3sx', 4, _MipsMsgTypeOptions.PAYLOAD.value, b'{1}')
+        + struct.pack('<IB2s', 2, 0x7F, b'xx')
+        + struct.pack('<IBI', 4, _MipsMsgTypeOptions.ID.value, 42))
+    msg = _MipsMessage.unpack(data)
+    assert msg.mid == 42
+    assert msg.payload == '{1}'
+    assert msg.msg_from is None
+    with pytest.raises(struct.error):
+        _MipsMessage.unpack(b'\x01\x00')
+
+
+def test_mips_message_codec_benchmark():
+    import json
+    import struct
+    import timeit
+    from miot.miot_mips import _MipsMessage, _MipsMsgTypeOptions
+
+    def legacy_pack(
+        mid: int, payload: str, msg_from: str, ret_topic: str
+    ) -> bytes:
+        msg = struct.pack('<IBI', 4, _MipsMsgTypeOptions.ID.value, mid)
+        msg += struct.pack(
+            f'<IB{len(msg_from)}sx', len(msg_from)+1,
+            _MipsMsgTypeOptions.FROM.value, msg_from.encode('utf-8'))
+        msg += struct.pack(
+            f'<IB{len(ret_topic)}sx', len(ret_topic)+1,
+            _MipsMsgTypeOptions.RET_TOPIC.value, ret_topic.encode('utf-8'))
+        msg += struct.pack(
+            f'<IB{len(payload)}sx', len(payload)+1,
+            _MipsMsgTypeOptions.PAYLOAD.value, payload.encode('utf-8'))
+        return msg
+
+    def legacy_unpack(data: bytes) -> _MipsMessage:
+        mips_msg = _MipsMessage()
+        data_len = len(data)
+        data_start = 0
+        data_end = 0
+        while data_start < data_len:
+            data_end = data_start+5
+            unpack_len, unpack_type = struct.unpack(
+                '<IB', data[data_start:data_end])
+            unpack_data = data[data_end:data_end+unpack_len]
+            match unpack_type:
+                case _MipsMsgTypeOptions.ID.value:
+                    mips_msg.mid = int.from_bytes(
+                        unpack_data, byteorder='little')
+                case _MipsMsgTypeOptions.RET_TOPIC.value:
+                    mips_msg.ret_topic = str(
+                        unpack_data.strip(b'\x00'), 'utf-8')
+                case _MipsMsgTypeOptions.PAYLOAD.value:
+                    mips_msg.payload = str(unpack_data.strip(b'\x00'), 'utf-8')
+                case _MipsMsgTypeOptions.FROM.value:
+                    mips_msg.msg_from = str(
+                        unpack_data.strip(b'\x00'), 'utf-8')
+                case _:
+                    pass
+            data_start = data_end+unpack_len
+        return mips_msg
+
+    payload = json.dumps({
+        'did': '123456789', 'siid': 2, 'piid': 1, 'value': True,
+        'result': [{'did': '123456789', 'siid': 2, 'piid': i, 'value': i}
+                   for i in range(8)]})
+    args = (123456, payload, 'ha.xiaomi_home', 'ha/1/reply')
+    data = _MipsMessage.pack(*args)
+    assert data == legacy_pack(*args)
+    assert str(_MipsMessage.unpack(data)) == str(legacy_unpack(data))
+    count = 50000
+
+    def bench(func) -> float:
+        return min(timeit.repeat(func, number=1, repeat=3))
+
+    legacy_pack_cost = bench(
+        lambda: [legacy_pack(*args) for _ in range(count)])
+    pack_cost = bench(
+        lambda: [_MipsMessage.pack(*args) for _ in range(count)])
+    legacy_unpack_cost = bench(
+        lambda: [legacy_unpack(data) for _ in range(count)])
+    unpack_cost = bench(
+        lambda: [_MipsMessage.unpack(data) for _ in range(count)])
+    _LOGGER.info(
+        'pack, legacy %.0f msg/s, codec %.0f msg/s, '
+        'unpack, legacy %.0f msg/s, codec %.0f msg/s',
+        count/legacy_pack_cost, count/pack_cost,
+        count/legacy_unpack_cost, count/unpack_cost)
+
+
+@pytest.mark.github
+@pytest.mark.asyncio
+async def test_mips_local_get_prop_queue_async():
+    import json
+    from miot.miot_mips import MipsLocalClient
+
+    mips = MipsLocalClient(
+        did='123456789', host='127.0.0.1', group_id='group',
+        ca_file='', cert_file='', key_file='')
+    rtt_map = {'slow': 0.3, 'fast1': 0.02, 'fast2': 0.02, 'fast3': 0.02}
+    in_flight: dict[str, int] = {}
+    max_in_flight = {'total': 0, 'device': 0}
+    timeouts: list[int] = []
+    started: list[str] = []
+
+    async def request_async(topic: str, payload: str, timeout_ms: int):
+        param = json.loads(payload)
+        did = param['did']
+        in_flight[did] = in_flight.get(did, 0)+1
+        max_in_flight['total'] = max(
+            max_in_flight['total'], sum(in_flight.values()))
+        max_in_flight['device'] = max(
+            max_in_flight['device'], in_flight[did])
+        timeouts.append(timeout_ms)
+        started.append(did)
+        await asyncio.sleep(rtt_map[did])
+        in_flight[did] -= 1
+        return {'value': f'{did}.{param["siid"]}.{param["piid"]}'}
+    # pylint: disable=protected-access
+    mips._MipsLocalClient__request_async = request_async
+    mips.MIPS_GET_PROP_INFLIGHT_MAX = 3
+
+    fast_tasks = [
+        asyncio.create_task(mips.get_prop_safe_async(
+            did=did, siid=2, piid=piid))
+        for did in ('fast1', 'fast2', 'fast3') for piid in range(5)]
+    slow_task = asyncio.create_task(
+        mips.get_prop_safe_async(did='slow', siid=2, piid=1))
+    await asyncio.sleep(0)
+    stats = mips.get_prop_stats
+    assert stats['in_flight'] == 3
+    assert stats['queue_depth'] == 13
+    assert stats['max_queue_depth'] == 13
+    results = await asyncio.gather(*fast_tasks)
+    assert results == [
+        f'{did}.2.{piid}'
+        for did in ('fast1', 'fast2', 'fast3') for piid in range(5)]
+    # Round robin, the slow device gets the first free slot and does not
+    # hold back the others
+    assert started[:4] == ['fast1', 'fast2', 'fast3', 'slow']
+    assert started.count('slow') == 1
+    assert not slow_task.done()
+    assert await slow_task == 'slow.2.1'
+    assert max_in_flight == {'total': 3, 'device': 1}
+
+    stats = mips.get_prop_stats
+    assert stats['requests'] == 16
+    assert stats['in_flight'] == 0
+    assert stats['queue_depth'] == 0
+    # The timeout of the caller is the deadline
+    assert timeouts == [10000]*16
+    assert 0 < stats['srtt_ms'] < 300
+    assert 'rto_ms' not in stats
+
+
+@pytest.mark.github
+@pytest.mark.asyncio
+async def test_mips_shared_io_async():
+    import threading
+    import time
+    from types import SimpleNamespace
+    from miot.miot_mips import MipsLocalClient, _MipsIoThread
+
+    clients = [
+        MipsLocalClient(
+            did='123456789', host='127.0.0.1', group_id=f'group{index}',
+            ca_file='', cert_file='', key_file='', port=1,
+            shared_io=True)
+        for index in range(3)]
+    thread_count = threading.active_count()
+    for mips in clients:
+        mips.connect()
+    # pylint: disable=protected-access
+    io_thread = _MipsIoThread._instance
+    assert io_thread is not None
+    assert io_thread.refs == 3
+    assert threading.active_count() == thread_count+1
+    assert all(mips._mips_thread is io_thread.thread for mips in clients)
+    assert all(mips._internal_loop is io_thread.loop for mips in clients)
+    await asyncio.sleep(0.1)
+
+    clients[0].disconnect()
+    assert io_thread.refs == 2
+    assert io_thread.thread.is_alive()
+    for mips in clients[1:]:
+        mips.disconnect()
+    assert _MipsIoThread._instance is None
+    assert not io_thread.thread.is_alive()
+    assert threading.active_count() == thread_count
+    # Reconnect starts a new shared thread
+    clients[0].connect()
+    assert _MipsIoThread._instance is not None
+    assert _MipsIoThread._instance is not io_thread
+    clients[0].disconnect()
+    assert _MipsIoThread._instance is None
+
+    # Keepalive timer sleeps until the next paho keepalive deadline
+    mips = clients[0]
+    keepalive_delay = mips._MipsClient__mqtt_keepalive_delay
+    now = time.monotonic()
+    mips._mqtt = SimpleNamespace(
+        _keepalive=60, _last_msg_in=now-10, _last_msg_out=now-20, _ping_t=0)
+    assert 39 < keepalive_delay() <= 40
+    mips._mqtt._ping_t = now-50
+    assert 9 < keepalive_delay() <= 10
+    mips._mqtt._last_msg_out = now-70
+    assert keepalive_delay() < 0
+    mips._mqtt = SimpleNamespace()
+    assert keepalive_delay() == mips.MQTT_INTERVAL_S
+
+    # Queued output is flushed on socket readiness, not by the timer
+    writers: list[int] = []
+    mips._mips_thread = threading.current_thread()
+    mips._internal_loop = SimpleNamespace(
+        add_writer=lambda fd, handler: writers.append(fd))
+    mips._mqtt_fd = 7
+    mips._mqtt = SimpleNamespace(
+        is_connected=lambda: True, want_write=lambda: True,
+        publish=lambda topic, payload, qos: None,
+        unsubscribe=lambda topic: (0, 1))
+    assert mips._mips_publish_internal(topic='test', payload='{}')
+    mips._mips_unsub_internal(topic='test')
+    assert writers == [7, 7]
+    mips._mqtt = None
+
+
+@pytest.mark.github
+@pytest.mark.asyncio
+async def test_mips_cloud_parsed_dispatch_async():
+    import json
+    import threading
+    from miot.miot_mips import MipsCloudClient, _MipsBroadcast
+
+    mips = MipsCloudClient(
+        uuid='123456', cloud_server='cn', app_id='app', token='token')
+    broadcasts: dict = {}
+
+    def reg_broadcast(topic: str, handler, handler_ctx=None) -> bool:
+        broadcasts[topic] = (handler, handler_ctx)
+        return True
+    # pylint: disable=protected-access
+    mips._MipsCloudClient__reg_broadcast_external = reg_broadcast
+    main_thread = threading.current_thread()
+    props: list = []
+    events: list = []
+
+    def on_prop(params: dict, ctx: Any) -> None:
+        assert threading.current_thread() is main_thread
+        props.append((params, ctx))
+
+    def on_event(params: dict, ctx: Any) -> None:
+        events.append((params, ctx))
+    mips.sub_prop(did='1001', handler=on_prop, handler_ctx='cloud')
+    mips.sub_event(did='1001', handler=on_event)
+    for topic, (handler, handler_ctx) in broadcasts.items():
+        mips._msg_index[mips._MipsCloudClient__topic_key(topic)] = (
+            _MipsBroadcast(
+                topic=topic, handler=handler, handler_ctx=handler_ctx))
+
+    def mips_thread() -> None:
+        for piid in range(50):
+            mips._on_mips_message(
+                topic=f'device/1001/up/properties_changed/2/{piid}',
+                payload=json.dumps({'params': {
+                    'did': '1001', 'siid': 2, 'piid': piid,
+                    'value': piid % 2 == 0}}).encode('utf-8'))
+        # Invalid payloads are dropped in the mips thread
+        mips._on_mips_message(
+            topic='device/1001/up/properties_changed/2/1',
+            payload=b'{"params": ')
+        mips._on_mips_message(
+            topic='device/1001/up/properties_changed/2/1',
+            payload=b'{"params": {"did": "1001", "siid": 2}}')
+        mips._on_mips_message(
+            topic='device/1001/up/event_occured/3/1',
+            payload=json.dumps({'params': {
+                'did': '1001', 'siid': 3, 'eiid': 1,
+                'arguments': [{'piid': 1, 'value': '中文'}]}}).encode())
+        # Other devices are not subscribed
+        mips._on_mips_message(
+            topic='device/1002/up/properties_changed/2/1',
+            payload=b'{"params": {"did": "1002"}}')
+    thread = threading.Thread(target=mips_thread)
+    thread.start()
+    thread.join()
+    assert not props and not events
+    await asyncio.sleep(0.01)
+
+    assert props == [
+        ({'did': '1001', 'siid': 2, 'piid': piid, 'value': piid % 2 == 0},
+         'cloud')
+        for piid in range(50)]
+    assert events == [(
+        {'did': '1001', 'siid': 3, 'eiid': 1,
+         'arguments': [{'piid': 1, 'value': '中文'}], 'from': 'cloud'},
+        None)]
+    stats = mips.dispatch_stats
+    # One main loop wakeup for the whole batch
+    assert stats['wakeups'] == 1
+    assert stats['callbacks'] == 51
+    assert stats['max_batch'] == 51
+    assert stats['depth'] == 0
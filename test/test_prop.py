@@ -0,0 +1,427 @@
+# -*- coding: utf-8 -*-
+"""Unit test for miot_prop.py."""
+import asyncio
+import pytest
+
+# pylint: disable=import-outside-toplevel, unused-argument
+
+
+@pytest.mark.github
+@pytest.mark.asyncio
+async def test_prop_writer_async():
+    from miot.miot_error import MIoTClientError
+    from miot.miot_prop import MIoTPropWriter
+
+    sent: list[tuple] = []
+    release = asyncio.Event()
+
+    async def write(did: str, siid: int, piid: int, value):
+        sent.append((did, siid, piid, value))
+        await release.wait()
+        if value == 'error':
+            raise MIoTClientError('set prop error')
+
+    writer = MIoTPropWriter(loop=asyncio.get_running_loop(), write=write)
+    # The first write is sent at once
+    fut1 = writer.request(did='1', siid=2, piid=1, value=1)
+    await asyncio.sleep(0)
+    assert sent == [('1', 2, 1, 1)]
+    # Written while in flight, the last value wins and the superseded
+    # callers share its future
+    fut2 = writer.request(did='1', siid=2, piid=1, value=2)
+    fut3 = writer.request(did='1', siid=2, piid=1, value=3)
+    assert fut2 is fut3 and fut1 is not fut2
+    # Other properties are not coalesced
+    fut4 = writer.request(did='1', siid=2, piid=2, value=True)
+    await asyncio.sleep(0)
+    assert sent == [('1', 2, 1, 1), ('1', 2, 2, True)]
+    assert len(writer) == 2
+    release.set()
+    assert await fut1 == 1
+    assert await fut2 == 3
+    assert await fut4 is True
+    assert sent == [('1', 2, 1, 1), ('1', 2, 2, True), ('1', 2, 1, 3)]
+    # Pending writes are cleaned up
+    await asyncio.sleep(0)
+    assert len(writer) == 0
+
+    # Errors are raised to the callers of the value, the next value is
+    # still sent
+    release.clear()
+    sent.clear()
+    fut1 = writer.request(did='1', siid=2, piid=1, value='error')
+    fut2 = writer.request(did='1', siid=2, piid=1, value=4)
+    await asyncio.sleep(0)
+    release.set()
+    with pytest.raises(MIoTClientError):
+        await fut1
+    assert await fut2 == 4
+    fut3 = writer.request(did='1', siid=2, piid=1, value='error')
+    with pytest.raises(MIoTClientError):
+        await fut3
+    await asyncio.sleep(0)
+    assert len(writer) == 0
+    assert [item[3] for item in sent] == ['error', 4, 'error']
+
+    # deinit cancels the writes in flight and the pending callers
+    release.clear()
+    fut1 = writer.request(did='1', siid=2, piid=1, value=5)
+    fut2 = writer.request(did='1', siid=2, piid=1, value=6)
+    await asyncio.sleep(0)
+    writer.deinit()
+    await asyncio.sleep(0)
+    assert fut1.cancelled() and fut2.cancelled()
+    assert len(writer) == 0
+
+
+@pytest.mark.github
+@pytest.mark.asyncio
+async def test_refresh_prop_queue_async():
+    from miot.miot_prop import (
+        MIoTRefreshPriority, MIoTRefreshPropQueue, REFRESH_PROPS_AGING_S)
+
+    loop = asyncio.get_running_loop()
+    queue = MIoTRefreshPropQueue(loop=loop)
+    assert queue.push(
+        did='1', siid=2, piid=1, priority=MIoTRefreshPriority.LOW)
+    assert queue.push(did='1', siid=2, piid=2)
+    assert queue.push(
+        did='2', siid=2, piid=1, priority=MIoTRefreshPriority.HIGH)
+    # Deduplicated, the highest priority is kept
+    assert not queue.push(
+        did='1', siid=2, piid=2, priority=MIoTRefreshPriority.HIGH)
+    assert not queue.push(
+        did='2', siid=2, piid=1, priority=MIoTRefreshPriority.LOW)
+    assert len(queue) == 3
+    assert [item.key for item in queue.ordered()] == [
+        ('1', 2, 2), ('2', 2, 1), ('1', 2, 1)]
+    stats = queue.stats
+    assert (stats['length'], stats['devices']) == (3, 2)
+    assert (stats['high'], stats['normal'], stats['low']) == (2, 0, 1)
+
+    # Aging, a low priority request waiting long enough goes first
+    low = queue.ordered()[-1]
+    low.enqueue_ts -= 2*REFRESH_PROPS_AGING_S + 0.1
+    assert queue.ordered()[0] is low
+    queue.push(did='3', siid=2, piid=1, priority=MIoTRefreshPriority.NORMAL)
+    queue.ordered()[-1].enqueue_ts -= REFRESH_PROPS_AGING_S + 0.1
+    assert [item.key for item in queue.ordered()][:2] == [
+        ('1', 2, 1), ('3', 2, 1)]
+
+    # Served requests update the wait stats
+    queue.pop(low)
+    queue.pop(low)
+    stats = queue.stats
+    assert stats['length'] == 3 and stats['served'] == 1
+    assert stats['max_wait'] >= 2*REFRESH_PROPS_AGING_S
+    assert not any(item is low for item in queue.ordered())
+    # Requeued with its age, a failure counts as a retry
+    assert queue.has_fresh()
+    queue.requeue(item=low, failed=True)
+    assert low.retry_count == 1 and queue.ordered()[0] is low
+    # Requested again while in flight, the queued request keeps the oldest
+    # age and the highest priority
+    item = queue.ordered()[1]
+    queue.pop(item)
+    queue.push(did=item.did, siid=item.siid, piid=item.piid)
+    queue.requeue(item=item, failed=False)
+    assert len(queue) == 4
+    queued = next(
+        queued for queued in queue.ordered() if queued.key == item.key)
+    assert queued.enqueue_ts == item.enqueue_ts
+    assert queue.stats['served'] == 2
+    for item in queue.ordered():
+        if item.retry_count == 0:
+            queue.pop(item)
+    assert not queue.has_fresh() and len(queue) == 1
+    queue.clear()
+    assert not queue and queue.stats['devices'] == 0
+
+
+@pytest.mark.github
+def test_refresh_split_props():
+    import json
+    from miot.miot_lan import MIoTLan
+    from miot.miot_prop import (
+        MIoTPropRefresher, MIoTRefreshPriority, MIoTRefreshPropItem,
+        REFRESH_PROPS_BATCH_OVERHEAD)
+
+    def gen_items(count: int) -> list:
+        return [
+            MIoTRefreshPropItem(
+                did='1234567890', siid=siid, piid=piid,
+                priority=MIoTRefreshPriority.NORMAL, enqueue_ts=0)
+            for siid in range(2, 100) for piid in range(1, 100)][:count]
+
+    assert not MIoTPropRefresher.split_props_request(items=[])
+    chunks = MIoTPropRefresher.split_props_request(items=gen_items(3))
+    assert chunks == [[
+        {'siid': 2, 'piid': 1}, {'siid': 2, 'piid': 2},
+        {'siid': 2, 'piid': 3}]]
+    items = gen_items(300)
+    chunks = MIoTPropRefresher.split_props_request(items=items)
+    assert len(chunks) > 1
+    assert [
+        (item['siid'], item['piid']) for chunk in chunks for item in chunk
+    ] == [(item.siid, item.piid) for item in items]
+    budget = MIoTLan.OT_MSG_LEN - REFRESH_PROPS_BATCH_OVERHEAD
+    for chunk in chunks:
+        # Params of the request sent to the device
+        assert sum(
+            len(json.dumps({'did': '1234567890', **item})) + 2
+            for item in chunk) <= budget
+    # Full chunks, the first param of the next chunk would not fit
+    lens = [
+        [len(json.dumps({'did': '1234567890', **item})) + 2 for item in chunk]
+        for chunk in chunks]
+    for index in range(len(chunks) - 1):
+        assert sum(lens[index]) + lens[index+1][0] > budget
+
+
+@pytest.mark.github
+@pytest.mark.asyncio
+async def test_refresh_limiter_async():
+    from miot.miot_prop import MIoTRefreshLimiter
+
+    loop = asyncio.get_running_loop()
+    # Concurrency
+    limiter = MIoTRefreshLimiter(concurrency=2, rate=1000, loop=loop)
+    running: list[int] = [0, 0]
+
+    async def work():
+        async with limiter:
+            running[0] += 1
+            running[1] = max(running[1], running[0])
+            await asyncio.sleep(0.02)
+            running[0] -= 1
+    await asyncio.gather(*[work() for _ in range(6)])
+    assert running == [0, 2]
+    # Rate
+    limiter = MIoTRefreshLimiter(concurrency=8, rate=20, loop=loop)
+    starts: list[float] = []
+
+    async def start():
+        async with limiter:
+            starts.append(loop.time())
+    await asyncio.gather(*[start() for _ in range(4)])
+    assert starts[-1] - starts[0] >= 3/20 - 0.01
+
+
+@pytest.mark.github
+@pytest.mark.asyncio
+async def test_prop_refresher_async(monkeypatch):
+    import time
+    from miot import miot_prop
+    from miot.miot_error import MIoTErrorCode, MIoTLanError
+    from miot.miot_prop import (
+        MIoTPropRefresher, REFRESH_PROPS_ROUTE_LIMITS,
+        REFRESH_PROPS_SINGLE_MODEL_TTL)
+
+    monkeypatch.setattr(miot_prop, 'REFRESH_PROPS_DELAY', 0.01)
+    monkeypatch.setattr(miot_prop, 'REFRESH_PROPS_RETRY_DELAY', 0.05)
+    loop = asyncio.get_running_loop()
+    # did: (route, model)
+    devices = {
+        'lan1': ('lan', 'xiaomi.light.v1'),
+        'gw1': ('group1', 'xiaomi.plug.v1'),
+        'gw2': ('group2', 'xiaomi.plug.v2'),
+        'fail1': ('lan', 'xiaomi.fan.v1')}
+    routes: list[tuple] = []
+    received: list[tuple] = []
+    calls: list[tuple] = []
+
+    class _LocalRoute:
+        def __init__(self, route: str) -> None:
+            self.route = route
+
+        async def get_props_async(
+            self, did: str, props_list: list, timeout_ms: int
+        ) -> list:
+            calls.append((self.route, did, len(props_list)))
+            if devices[did][1] == 'xiaomi.plug.v1':
+                raise MIoTLanError(
+                    'invalid params', MIoTErrorCode.CODE_INVALID_PARAMS)
+            return [
+                {**prop, 'code': -1 if did == 'fail1' else 0, 'value': 1}
+                for prop in props_list]
+
+        async def get_prop_async(
+            self, did: str, siid: int, piid: int, timeout_ms: int
+        ):
+            calls.append((self.route, did, 1))
+            return False
+
+    local_routes = {
+        route: _LocalRoute(route) for route in ('lan', 'group1', 'group2')}
+
+    async def get_cloud_props(params: list):
+        calls.append(('cloud', params[0]['did'], len(params)))
+        return [{**param, 'value': 2} for param in params]
+
+    def get_route(did: str, retry: bool):
+        routes.append((did, retry))
+        if did == 'offline':
+            return None
+        return 'cloud' if retry else devices[did][0]
+
+    refresher = MIoTPropRefresher(
+        loop=loop, get_route=get_route, get_local=local_routes.get,
+        get_cloud_props=get_cloud_props,
+        on_prop=lambda params, route: received.append((
+            route, params['did'], params['siid'], params['piid'],
+            params['value'])),
+        get_model=lambda did: devices[did][1])
+
+    async def wait_done():
+        for _ in range(100):
+            await asyncio.sleep(0.02)
+            # pylint: disable=protected-access
+            if not refresher and refresher._timer is None:
+                return
+        raise TimeoutError(refresher.stats)
+
+    # One batched read of a device on lan and on a gateway
+    for piid in range(1, 4):
+        refresher.request(did='lan1', siid=2, piid=piid)
+        refresher.request(did='gw2', siid=2, piid=piid)
+    await wait_done()
+    assert sorted(calls) == [('group2', 'gw2', 3), ('lan', 'lan1', 3)]
+    assert sorted(received)[0] == ('group2', 'gw2', 2, 1, 1)
+    assert len(received) == 6
+    # pylint: disable=protected-access
+    assert set(refresher._limiters) == {'lan', 'group2'}
+
+    # A failed local read is retried on cloud
+    calls.clear()
+    received.clear()
+    routes.clear()
+    refresher.request(did='fail1', siid=2, piid=1)
+    refresher.request(did='fail1', siid=2, piid=2)
+    await wait_done()
+    assert calls == [('lan', 'fail1', 2), ('cloud', 'fail1', 2)]
+    assert routes == [
+        ('fail1', False), ('fail1', False), ('fail1', True), ('fail1', True)]
+    assert sorted(received) == [
+        ('cloud', 'fail1', 2, 1, 2), ('cloud', 'fail1', 2, 2, 2)]
+    # Each gateway and the lan get their own limiter
+    assert set(refresher._limiters) == {'lan', 'group2', 'cloud'}
+    assert refresher._limiters['cloud']._semaphore._value == (
+        REFRESH_PROPS_ROUTE_LIMITS['cloud'][0])
+    assert refresher._limiters['group2']._semaphore._value == (
+        REFRESH_PROPS_ROUTE_LIMITS['gw'][0])
+
+    # Batched reads rejected, read one property per cycle for 6 hours
+    calls.clear()
+    received.clear()
+    for piid in range(1, 4):
+        refresher.request(did='gw1', siid=2, piid=piid)
+    await wait_done()
+    assert calls == [
+        ('group1', 'gw1', 3), ('group1', 'gw1', 1), ('group1', 'gw1', 1),
+        ('group1', 'gw1', 1)]
+    assert [item[3:] for item in received] == [
+        (1, False), (2, False), (3, False)]
+    assert not refresher.batch_read_enabled(did='gw1')
+    assert refresher.batch_read_enabled(did='gw2')
+    assert refresher._single_models['xiaomi.plug.v1'] == pytest.approx(
+        time.time() + REFRESH_PROPS_SINGLE_MODEL_TTL, abs=10)
+    refresher._single_models['xiaomi.plug.v1'] = time.time() - 1
+    assert refresher.batch_read_enabled(did='gw1')
+    assert not refresher._single_models
+
+    # No route, dropped after the retries
+    routes.clear()
+    refresher.request(did='offline', siid=2, piid=1)
+    await wait_done()
+    assert routes == [('offline', False)] + [('offline', True)]*3
+    assert refresher.stats['served'] == 12
+    refresher.deinit()
+
+
+@pytest.mark.github
+@pytest.mark.asyncio
+async def test_prop_shadow_async(test_cache_path):
+    import time
+    from miot.miot_prop import MIoTPropShadowTable
+    from miot.miot_storage import MIoTStorage
+
+    storage = MIoTStorage(test_cache_path)
+    shadow = MIoTPropShadowTable(
+        storage=storage, name='test_shadow', snapshot_ttl=60)
+    assert shadow.get(did='1', siid=2, piid=1) is None
+    assert shadow.update(did='1', siid=2, piid=1, value=1, source='lan')
+    # Unchanged report dropped, the age and the source are renewed
+    item = shadow.get(did='1', siid=2, piid=1)
+    item.ts -= 100
+    assert not shadow.update(
+        did='1', siid=2, piid=1, value=1, source='cloud')
+    assert item.age < 1 and item.source == 'cloud'
+    # Same value of another type is a change, 1 == True
+    assert shadow.update(did='1', siid=2, piid=1, value=True, source='lan')
+    assert shadow.get(did='1', siid=2, piid=1).value is True
+    assert shadow.update(did='1', siid=2, piid=1, value=1, source='lan')
+    assert shadow.update(did='1', siid=2, piid=1, value=1.0, source='lan')
+    assert not shadow.update(
+        did='1', siid=2, piid=1, value=1.0, source='lan')
+    # A written value is not taken as a report
+    shadow.set(did='1', siid=2, piid=1, value=2)
+    assert shadow.get(did='1', siid=2, piid=1).source is None
+    assert shadow.update(did='1', siid=2, piid=1, value=1.0, source='lan')
+    assert shadow.stats == {'length': 1, 'delivered': 5, 'suppressed': 2}
+    # Not restored, refreshed
+    assert not shadow.fresh_restored(did='1', siid=2, piid=1)
+
+    # Snapshot round trip, old values and removed devices are not restored
+    shadow.update(did='1', siid=2, piid=2, value='text', source='lan')
+    shadow.update(did='1', siid=3, piid=1, value=[1, 2], source='group1')
+    shadow.update(did='2', siid=2, piid=1, value=False, source='cloud')
+    shadow.update(did='3', siid=2, piid=1, value=0, source='cloud')
+    shadow.get(did='1', siid=3, piid=1).ts -= 3600*24 + 10
+    shadow.get(did='2', siid=2, piid=1).ts -= 120
+    assert await shadow.save_async()
+    restored = MIoTPropShadowTable(
+        storage=storage, name='test_shadow', snapshot_ttl=60)
+    assert await restored.load_async(dids={'1': {}, '2': {}}) == 3
+    assert len(restored) == 3
+    for did, siid, piid in (('1', 2, 1), ('1', 2, 2), ('2', 2, 1)):
+        item = restored.get(did=did, siid=siid, piid=piid)
+        origin = shadow.get(did=did, siid=siid, piid=piid)
+        assert item.source == 'snapshot'
+        assert item.value == origin.value
+        assert type(item.value) is type(origin.value)
+        assert item.ts == pytest.approx(origin.ts, abs=0.1)
+    assert restored.get(did='1', siid=3, piid=1) is None
+    assert restored.get(did='3', siid=2, piid=1) is None
+    # Restored values younger than the ttl are not refreshed
+    assert restored.fresh_restored(did='1', siid=2, piid=1)
+    assert not restored.fresh_restored(did='2', siid=2, piid=1)
+    # A report, even unchanged, clears the restored mark
+    assert not restored.update(
+        did='1', siid=2, piid=1, value=1.0, source='lan')
+    assert not restored.fresh_restored(did='1', siid=2, piid=1)
+    assert restored.get(did='1', siid=2, piid=1).source == 'lan'
+    restored.remove_device(did='1')
+    assert len(restored) == 1
+
+    # Malformed records are skipped
+    assert await storage.save_async(
+        domain='miot_props', name='test_shadow', data={
+            'ts': int(time.time()), 'props': {
+                '1': [
+                    [2, 1, 10, time.time()], [2, 2, 10], ['2', 3, 10, 0],
+                    [2, 4, 10, 'ts'], {'siid': 2}, [2, 5, None, time.time()]],
+                '2': {'siid': 2}}})
+    restored = MIoTPropShadowTable(
+        storage=storage, name='test_shadow', snapshot_ttl=60)
+    assert await restored.load_async(dids={'1', '2'}) == 2
+    assert restored.get(did='1', siid=2, piid=1).value == 10
+    assert restored.get(did='1', siid=2, piid=5).value is None
+    assert await storage.save_async(
+        domain='miot_props', name='test_shadow', data={'props': []})
+    assert await restored.load_async(dids={'1'}) == 0
+    # Nothing changed, not saved again
+    assert await restored.save_async()
+    assert await storage.load_async(
+        domain='miot_props', name='test_shadow', type_=dict) == {'props': []}
+    assert await storage.remove_async(
+        domain='miot_props', name='test_shadow', type_=dict)
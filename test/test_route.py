@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""Unit test for miot_route.py."""
+import asyncio
+import pytest
+
+# pylint: disable=import-outside-toplevel, unused-argument
+
+
+@pytest.mark.github
+@pytest.mark.asyncio
+async def test_route_sort_async():
+    from miot.miot_route import MIoTRouter, ROUTE_FAIL_MAX
+
+    router = MIoTRouter(loop=asyncio.get_running_loop())
+    did = '123456'
+    # Unmeasured routes keep the default order, cloud first for reads
+    assert router.sort(did=did, routes=['cloud', 'gw', 'lan']) == [
+        'cloud', 'gw', 'lan']
+    # A measured local route does not pass the unmeasured cloud route
+    router.record(did=did, route='gw', rtt=0.05)
+    assert router.sort(did=did, routes=['cloud', 'gw', 'lan']) == [
+        'cloud', 'gw', 'lan']
+    # Measured faster than cloud, the local route goes first
+    router.record(did=did, route='cloud', rtt=0.5)
+    assert router.sort(did=did, routes=['cloud', 'gw', 'lan']) == [
+        'gw', 'cloud', 'lan']
+    # Measured slower than cloud, the default order is kept
+    router.record(did=did, route='lan', rtt=1)
+    assert router.sort(did=did, routes=['cloud', 'lan']) == [
+        'cloud', 'lan']
+    # Writes keep the default order whatever the latency
+    assert router.sort(
+        did=did, routes=['gw', 'lan', 'cloud'], by_latency=False) == [
+        'gw', 'lan', 'cloud']
+    # Unhealthy routes last, in reads and writes
+    for _ in range(ROUTE_FAIL_MAX):
+        router.record(did=did, route='gw', rtt=None)
+    assert router.sort(did=did, routes=['cloud', 'gw', 'lan']) == [
+        'cloud', 'lan', 'gw']
+    assert router.sort(
+        did=did, routes=['gw', 'lan', 'cloud'], by_latency=False) == [
+        'lan', 'cloud', 'gw']
+    # A success makes the route healthy again
+    router.record(did=did, route='gw', rtt=0.05)
+    assert router.sort(did=did, routes=['cloud', 'gw']) == ['gw', 'cloud']
+    # Other devices are not affected
+    assert router.sort(did='654321', routes=['cloud', 'gw']) == [
+        'cloud', 'gw']
+    router.remove_device(did=did)
+    assert router.sort(did=did, routes=['cloud', 'gw']) == ['cloud', 'gw']
+
+
+@pytest.mark.github
+@pytest.mark.asyncio
+async def test_route_latency_async():
+    from miot.miot_route import (
+        MIoTRouteLatency, MIoTRouter, ROUTE_LATENCY_ALPHA,
+        ROUTE_LATENCY_WINDOW, GET_PROP_HEDGE_DELAY, GET_PROP_HEDGE_DELAY_MIN,
+        GET_PROP_HEDGE_DELAY_MAX)
+
+    latency = MIoTRouteLatency()
+    assert latency.ewma is None and latency.p95 is None
+    latency.record(rtt=1)
+    assert latency.ewma == 1
+    latency.record(rtt=2)
+    assert latency.ewma == pytest.approx(1 + ROUTE_LATENCY_ALPHA)
+    # p95 of the last samples only
+    for index in range(ROUTE_LATENCY_WINDOW):
+        latency.record(rtt=(index+1)/100)
+    assert latency.p95 == pytest.approx(
+        ROUTE_LATENCY_WINDOW*0.95//1/100 + 0.01)
+    latency.record_failure(now=0)
+    assert latency.stats(now=0) == {
+        'ewma_ms': round(latency.ewma*1000, 1),
+        'p95_ms': round(latency.p95*1000, 1),
+        'total': ROUTE_LATENCY_WINDOW+3, 'failures': 1, 'healthy': True}
+
+    # Hedge delay, the p95 of the route within the bounds
+    router = MIoTRouter(loop=asyncio.get_running_loop())
+    assert router.hedge_delay(did='1', route='gw') == GET_PROP_HEDGE_DELAY
+    router.record(did='1', route='gw', rtt=0.5)
+    assert router.hedge_delay(did='1', route='gw') == 0.5
+    router.record(did='1', route='lan', rtt=0.001)
+    assert router.hedge_delay(
+        did='1', route='lan') == GET_PROP_HEDGE_DELAY_MIN
+    router.record(did='1', route='cloud', rtt=60)
+    assert router.hedge_delay(
+        did='1', route='cloud') == GET_PROP_HEDGE_DELAY_MAX
+    assert set(router.stats['1']) == {'gw', 'lan', 'cloud'}
+
+
+@pytest.mark.github
+@pytest.mark.asyncio
+async def test_route_read_async():
+    from miot.miot_route import MIoTRouter
+
+    router = MIoTRouter(loop=asyncio.get_running_loop())
+    did = '123456'
+    delays = {'cloud': 0.3, 'gw': 0.01, 'lan': 0.01}
+    values: dict = {'cloud': 'cloud', 'gw': 0, 'lan': None}
+    calls: list[str] = []
+    finished: list[str] = []
+
+    async def read(route: str):
+        calls.append(route)
+        await asyncio.sleep(delays[route])
+        finished.append(route)
+        if isinstance(values[route], Exception):
+            raise values[route]
+        return values[route]
+
+    # In order, a falsy value is a result
+    assert await router.read_async(
+        did=did, routes=['gw', 'cloud'], read=read) == 0
+    assert calls == ['gw']
+    # A failure or an error tries the next route
+    calls.clear()
+    values['gw'] = RuntimeError('gw error')
+    assert await router.read_async(
+        did=did, routes=['gw', 'lan', 'cloud'], read=read) == 'cloud'
+    assert calls == ['gw', 'lan', 'cloud']
+    assert router.stats[did]['gw']['failures'] == 1
+    assert router.stats[did]['lan']['failures'] == 1
+    assert router.stats[did]['cloud']['total'] == 1
+
+    # Hedged read, the next route starts after the p95 of the slow one and
+    # the slow read keeps running to measure the route
+    router = MIoTRouter(loop=asyncio.get_running_loop(), hedged_reads=True)
+    router.record(did=did, route='cloud', rtt=0.05)
+    router.record(did=did, route='gw', rtt=0.1)
+    values['gw'] = 'gw'
+    calls.clear()
+    finished.clear()
+    assert await router.read_async(
+        did=did, routes=['cloud', 'gw'], read=read) == 'gw'
+    assert calls == ['cloud', 'gw']
+    assert finished == ['gw']
+    # pylint: disable=protected-access
+    assert len(router._hedged_tasks) == 1
+    await asyncio.sleep(0.35)
+    assert finished == ['gw', 'cloud']
+    assert not router._hedged_tasks
+    assert router.stats[did]['cloud']['total'] == 2
+
+    # Cancel the caller, every read in flight is cancelled
+    router.remove_device(did=did)
+    router.record(did=did, route='cloud', rtt=0.05)
+    router.record(did=did, route='gw', rtt=0.1)
+    calls.clear()
+    finished.clear()
+    delays['gw'] = 0.3
+    task = asyncio.create_task(router.read_async(
+        did=did, routes=['cloud', 'gw'], read=read))
+    await asyncio.sleep(0.25)
+    assert calls == ['cloud', 'gw']
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    await asyncio.sleep(0.4)
+    assert finished == []
+    # deinit cancels the hedged reads left
+    delays['gw'] = 0.01
+    assert await router.read_async(
+        did=did, routes=['cloud', 'gw'], read=read) == 'gw'
+    assert len(router._hedged_tasks) == 1
+    router.deinit()
+    await asyncio.sleep(0.35)
+    assert finished == ['gw']
+
+
+@pytest.mark.github
+@pytest.mark.asyncio
+async def test_route_write_async():
+    from miot.miot_error import MIoTError, MIoTErrorCode, MIoTLanError
+    from miot.miot_route import MIoTRouter
+
+    router = MIoTRouter(loop=asyncio.get_running_loop())
+    did = '123456'
+    results: dict = {}
+    calls: list[str] = []
+
+    async def write(route: str):
+        calls.append(route)
+        if isinstance(results[route], Exception):
+            raise results[route]
+        return results[route]
+
+    # The first route answers
+    results.update({'gw': 0, 'lan': 0, 'cloud': 0})
+    assert await router.write_async(
+        did=did, routes=['gw', 'lan', 'cloud'], write=write) == ('gw', 0)
+    assert calls == ['gw']
+    # Not sent, fall back to the next route
+    calls.clear()
+    results.update({
+        'gw': None,
+        'lan': MIoTLanError(
+            'lan unavailable', MIoTErrorCode.CODE_LAN_UNAVAILABLE),
+        'cloud': 1})
+    assert await router.write_async(
+        did=did, routes=['gw', 'lan', 'cloud'], write=write) == ('cloud', 1)
+    assert calls == ['gw', 'lan', 'cloud']
+    # A timeout or a device error is not sent again
+    router.remove_device(did=did)
+    calls.clear()
+    results.update({'gw': MIoTErrorCode.CODE_TIMEOUT.value, 'lan': 0})
+    assert await router.write_async(
+        did=did, routes=['gw', 'lan'], write=write) == (
+        'gw', MIoTErrorCode.CODE_TIMEOUT.value)
+    assert calls == ['gw']
+    calls.clear()
+    results.update({'gw': -704002000})
+    assert await router.write_async(
+        did=did, routes=['gw', 'lan'], write=write) == ('gw', -704002000)
+    assert calls == ['gw']
+    # An error that may come after the send is raised
+    router.remove_device(did=did)
+    calls.clear()
+    results.update({'gw': MIoTError(
+        'timeout', MIoTErrorCode.CODE_TIMEOUT)})
+    with pytest.raises(MIoTError):
+        await router.write_async(
+            did=did, routes=['gw', 'lan'], write=write)
+    assert calls == ['gw']
+    # No route sent the request
+    router.remove_device(did=did)
+    calls.clear()
+    results.update({
+        'gw': MIoTErrorCode.CODE_INTERNAL_ERROR.value, 'lan': None})
+    assert await router.write_async(
+        did=did, routes=['gw', 'lan'], write=write) == (
+        None, MIoTErrorCode.CODE_INTERNAL_ERROR.value)
+    assert calls == ['gw', 'lan']
+    results.update({'lan': MIoTLanError(
+        'lan unavailable', MIoTErrorCode.CODE_LAN_UNAVAILABLE)})
+    with pytest.raises(MIoTLanError):
+        await router.write_async(
+            did=did, routes=['gw', 'lan'], write=write)
+    assert await router.write_async(
+        did=did, routes=[], write=write) == (None, None)
+    # Routes that failed twice are tried last
+    router.record(did=did, route='lan', rtt=0.05)
+    calls.clear()
+    results.update({'gw': 0, 'lan': 0})
+    assert await router.write_async(
+        did=did, routes=['gw', 'lan'], write=write) == ('lan', 0)
+    assert calls == ['lan']
+    # Writes measure the routes, timeouts count as failures
+    router.remove_device(did=did)
+    results.update({'gw': MIoTErrorCode.CODE_TIMEOUT.value})
+    await router.write_async(did=did, routes=['gw'], write=write)
+    results.update({'gw': 0})
+    await router.write_async(did=did, routes=['gw'], write=write)
+    stats = router.stats[did]['gw']
+    assert stats['failures'] == 1
+    assert stats['total'] == 2
+    assert stats['ewma_ms'] is not None
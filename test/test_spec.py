@@ -54,6 +54,27 @@ async def test_spec_refresh_async(test_cache_path, test_lang, urn_list):
     assert await spec_parser.refresh_async(urn_list=urn_list) == len(urn_list)
 
 
+@pytest.mark.parametrize('urn_list', [[
+    'urn:miot-spec-v2:device:gateway:0000A019:xiaomi-hub1:3',
+    'urn:miot-spec-v2:device:light:0000A001:philips-strip3:2',
+    'urn:miot-spec-v2:device:gateway:0000A019:xiaomi-hub1:3',
+    'urn:miot-spec-v2:device:light:0000A001:philips-strip3:2']])
+@pytest.mark.asyncio
+@pytest.mark.dependency()
+async def test_spec_parse_many_async(test_cache_path, test_lang, urn_list):
+    from miot.miot_spec import MIoTSpecParser
+    from miot.miot_storage import MIoTStorage
+
+    storage = MIoTStorage(test_cache_path)
+    spec_parser = MIoTSpecParser(lang=test_lang, storage=storage)
+    await spec_parser.init_async()
+    result = await spec_parser.parse_many_async(urn_list=urn_list)
+    assert set(result.keys()) == set(urn_list)
+    assert all(result.values())
+    stats = spec_parser.cache_stats
+    assert stats['hits'] + stats['misses'] == len(set(urn_list))
+
+
 @pytest.mark.asyncio
 @pytest.mark.dependency()
 async def test_spec_random_parse_async(test_cache_path, test_lang):
@@ -89,3 +110,252 @@ async def test_spec_random_parse_async(test_cache_path, test_lang):
         assert result is not None
     end_ts = time.time()*1000
     _LOGGER.info('takes time, %s, %s', test_count, end_ts-start_ts)
+
+
+@pytest.mark.github
+def test_spec_shared_cache():
+    from miot.miot_spec import MIoTSpecCache
+
+    cache = MIoTSpecCache()
+    cache.CAPACITY = 2
+    cache.put(urn='urn:a', lang='en', specs={'urn': 'urn:a'})
+    cache.put(urn='urn:b', lang='en', specs={'urn': 'urn:b'})
+    assert cache.get(urn='urn:a', lang='en') == {'urn': 'urn:a'}
+    # Least recently used first
+    cache.put(urn='urn:b', lang='zh-Hans', specs={'urn': 'urn:b'})
+    assert cache.get(urn='urn:b', lang='en') is None
+    assert cache.get(urn='urn:a', lang='en') == {'urn': 'urn:a'}
+    assert len(cache) == 2
+    # Refreshed specs are dropped in every language
+    cache.put(urn='urn:a', lang='zh-Hans', specs={'urn': 'urn:a'})
+    cache.invalidate(urn='urn:a')
+    assert cache.get(urn='urn:a', lang='en') is None
+    assert len(cache) == 0
+    assert cache.stats == {'length': 0, 'hits': 2, 'misses': 2}
+
+
+@pytest.mark.github
+@pytest.mark.asyncio
+async def test_spec_multi_lang_cache_async(test_cache_path):
+    from miot.miot_spec import _MIoTSpecMultiLang
+    from miot.miot_storage import MIoTStorage
+
+    urn = 'urn:miot-spec-v2:device:light:0000A001:test-multilang:1'
+    storage = MIoTStorage(test_cache_path)
+    assert await storage.save_async(
+        domain='miot_specs_multi_lang_cloud', name='zh-Hans',
+        data={urn: {
+            'ts': int(time.time()),
+            'data': {'service:002': '灯', 'service:002:property:001': '开关'},
+            'default': {'service:002': 'Light'}}})
+    multi_lang = _MIoTSpecMultiLang(lang='zh-Hans', storage=storage)
+    await multi_lang.init_async()
+    # The bundled multi_lang.json is loaded once per process
+    bundled_data = _MIoTSpecMultiLang.load_bundled_data()
+    assert bundled_data
+    assert _MIoTSpecMultiLang.load_bundled_data() is bundled_data
+    # Translations are served from the cache without the cloud request
+    await multi_lang.set_spec_async(urn=urn)
+    assert multi_lang.translate('s:2') == '灯'
+    assert multi_lang.translate('p:2:1') == '开关'
+    await multi_lang.deinit_async()
+
+
+@pytest.mark.github
+def test_spec_expr():
+    from os import path
+    import yaml
+    from miot.miot_error import MIoTSpecError
+    from miot.miot_spec import MIoTSpecExpr
+
+    assert MIoTSpecExpr('round(src_value/10, 1)')(123) == 12.3
+    assert MIoTSpecExpr('(src_value!=1)')(1) is False
+    assert MIoTSpecExpr('(100-src_value)')(30) == 70
+    for expr in [
+            'src_value.__class__', '__import__("os")', 'open(src_value)',
+            'round(src_value, ndigits=1)', '"a"', 'src_value +', 'x*2']:
+        with pytest.raises(MIoTSpecError):
+            MIoTSpecExpr(expr)
+    # All expressions in spec_modify.yaml are supported
+    with open(path.join(
+            path.dirname(path.abspath(__file__)),
+            '../custom_components/xiaomi_home/miot/specs/spec_modify.yaml'),
+            'r', encoding='utf-8') as file:
+        spec_modify = yaml.safe_load(file)
+    for urn_data in spec_modify.values():
+        if not isinstance(urn_data, dict):
+            continue
+        for item in urn_data.values():
+            if isinstance(item, dict) and 'expr' in item:
+                MIoTSpecExpr(item['expr'])
+
+
+def test_spec_expr_benchmark():
+    """Per value cost of eval() and the compiled expression."""
+    import timeit
+    from miot.miot_spec import MIoTSpecExpr
+
+    expr = 'round(src_value*6/1000000, 2)'
+    count = 100000
+    compiled = MIoTSpecExpr(expr)
+    # pylint: disable=eval-used
+    eval_cost = timeit.timeit(
+        lambda: eval(expr, {'src_value': 123456}), number=count)
+    compiled_cost = timeit.timeit(lambda: compiled(123456), number=count)
+    _LOGGER.info(
+        'eval, %.3f us/value, compiled, %.3f us/value',
+        eval_cost/count*1e6, compiled_cost/count*1e6)
+    assert compiled(123456) == eval(expr, {'src_value': 123456})
+
+
+def _spec_props_for_test() -> list:
+    from miot.miot_spec import MIoTSpecProperty, MIoTSpecService
+
+    service = MIoTSpecService(spec={
+        'iid': 2, 'type': 'urn:miot-spec-v2:service:test:00000001:test:1',
+        'description': 'test'})
+    props = []
+    for iid, (format_, value_range, expr) in enumerate([
+            ('bool', None, None),
+            ('uint8', [0, 100, 1], None),
+            ('int32', [0, 1000, 5], '(100-src_value)'),
+            ('float', [0, 100, 0.01], None),
+            ('uint32', [0, 4294967295, 1], 'round(src_value/100, 2)'),
+            ('float', [0, 1000, 0.1], 'round(src_value*6/1000000, 2)'),
+            ('string', None, None)], start=1):
+        props.append(MIoTSpecProperty(
+            spec={
+                'iid': iid, 'description': 'test',
+                'type': 'urn:miot-spec-v2:property:test:00000001:test:1'},
+            service=service, format_=format_, access=['read', 'notify'],
+            value_range=value_range, expr=expr))
+    return props
+
+
+@pytest.mark.github
+def test_spec_prop_value_convert():
+    props = _spec_props_for_test()
+    for value in [
+            None, True, False, 0, 1, 42, 12345, 3.14159, '1', 'true', 'False',
+            '17', '2.5']:
+        for prop in props:
+            if isinstance(value, str) and prop.format_ in (int, float) and (
+                    not value.replace('.', '').isdigit()):
+                continue
+            expected = prop.value_precision(
+                prop.eval_expr(prop.value_format(value)))
+            assert prop.value_convert(value) == expected
+            assert type(prop.value_convert(value)) is type(expected)
+    # Rebuilt when the spec is modified
+    prop = props[1]
+    assert prop.value_convert(42) == 42
+    prop.expr = '(src_value*2)'
+    assert prop.value_convert(42) == 84
+
+
+def test_spec_prop_value_convert_benchmark():
+    """Per update cost of the step by step conversion and the converter."""
+    import timeit
+
+    props = _spec_props_for_test()
+    rand = random.Random(0)
+    stream = [
+        (props[index], rand.randint(0, 100))
+        for index in [rand.randrange(len(props) - 1) for _ in range(100000)]]
+
+    def convert_steps():
+        for prop, value in stream:
+            value = prop.value_format(value)
+            value = prop.eval_expr(value)
+            prop.value_precision(value)
+
+    def convert_once():
+        for prop, value in stream:
+            prop.value_convert(value)
+    steps_cost = min(timeit.repeat(convert_steps, number=1, repeat=3))
+    once_cost = min(timeit.repeat(convert_once, number=1, repeat=3))
+    _LOGGER.info(
+        'steps, %.1f ms, converter, %.1f ms, %d updates',
+        steps_cost*1000, once_cost*1000, len(stream))
+    assert [prop.value_convert(value) for prop, value in stream[:1000]] == [
+        prop.value_precision(prop.eval_expr(prop.value_format(value)))
+        for prop, value in stream[:1000]]
+
+
+def _spec_dump_for_test() -> dict:
+    services = []
+    for siid in range(2, 8):
+        service_type = f'urn:miot-spec-v2:service:test-{siid}:0000780{siid}:1'
+        props = []
+        for piid in range(1, 11):
+            props.append({
+                'type': f'urn:miot-spec-v2:property:p-{piid}:000000{piid}:1',
+                'name': f'p-{piid}', 'iid': piid,
+                'description': f'Property {piid}', 'description_trans': '属性',
+                'proprietary': False, 'need_filter': False,
+                'format': 'uint8', 'access': ['read', 'write', 'notify'],
+                'unit': 'percentage',
+                'value_range': [0, 100, 1] if piid % 2 else None,
+                'value_list': None if piid % 2 else [
+                    {'name': f'mode_{index}', 'value': index,
+                     'description': f'Mode {index}'} for index in range(4)],
+                'precision': 0, 'expr': None, 'icon': None})
+        services.append({
+            'type': service_type, 'name': f'test-{siid}', 'iid': siid,
+            'description': f'Service {siid}', 'description_trans': '服务',
+            'proprietary': False, 'need_filter': False,
+            'properties': props,
+            'events': [{
+                'type': 'urn:miot-spec-v2:event:e-1:00005001:1',
+                'name': 'e-1', 'iid': 1, 'description': 'Event',
+                'description_trans': '事件', 'proprietary': False,
+                'need_filter': False, 'argument': [1, 2]}],
+            'actions': [{
+                'type': 'urn:miot-spec-v2:action:a-1:00002801:1',
+                'name': 'a-1', 'iid': 1, 'description': 'Action',
+                'description_trans': '动作', 'proprietary': False,
+                'need_filter': False, 'in': [1], 'out': []}]})
+    return {
+        'urn': 'urn:miot-spec-v2:device:test:0000A000:test-memory:1',
+        'name': 'test', 'description': 'Test', 'description_trans': '测试',
+        'services': services}
+
+
+@pytest.mark.github
+def test_spec_compact_objects():
+    from miot.miot_spec import MIoTSpecInstance
+
+    dump = _spec_dump_for_test()
+    instances = [
+        MIoTSpecInstance.load(specs=json.loads(json.dumps(dump)))
+        for _ in range(2)]
+    prop_a = instances[0].services[0].properties[1]
+    prop_b = instances[1].services[0].properties[1]
+    assert not hasattr(prop_a, '__dict__')
+    assert prop_a.value_list is prop_b.value_list
+    assert prop_a.description is prop_b.description
+    assert instances[0].services[0].properties[0].value_range is (
+        instances[1].services[0].properties[0].value_range)
+    assert instances[0].dump() == instances[1].dump()
+    # bool and int value lists are not shared
+    assert prop_a.value_list.values == [0, 1, 2, 3]
+
+
+def test_spec_memory_benchmark():
+    """Memory of the spec objects of 500 devices with the same model."""
+    import gc
+    import tracemalloc
+    from miot.miot_spec import MIoTSpecInstance
+
+    dump = json.dumps(_spec_dump_for_test())
+    gc.collect()
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    instances = [
+        MIoTSpecInstance.load(specs=json.loads(dump)) for _ in range(500)]
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    _LOGGER.info(
+        'spec objects, %d devices, %.1f KiB/device',
+        len(instances), (current - start)/len(instances)/1024)
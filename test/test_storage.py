@@ -207,6 +207,48 @@ async def test_user_config_async(
     assert await storage.remove_domain_async(domain='miot_config')
 
 
+@pytest.mark.asyncio
+@pytest.mark.github
+@pytest.mark.dependency()
+async def test_spec_store_async(test_cache_path):
+    from miot.miot_storage import MIoTStorage, MIoTSpecStore
+
+    storage = MIoTStorage(path.join(test_cache_path, 'spec_store'))
+    await storage.remove_domain_async(domain=MIoTSpecStore.DOMAIN)
+    # Legacy per-urn cache files
+    legacy_urn = 'urn:miot-spec-v2:device:light:0000A001:test-light:1'
+    legacy_spec = {'urn': legacy_urn, 'services': []}
+    assert await storage.save_async(
+        MIoTSpecStore.DOMAIN, f'{legacy_urn}_en', legacy_spec)
+    assert await storage.save_async(
+        MIoTSpecStore.DOMAIN, 'spec_std_lib', {'data': {}, 'ts': 0})
+
+    store = storage.spec_store
+    await store.init_async()
+    assert await store.get_async(
+        urn=legacy_urn, lang='en', version=1) == legacy_spec
+    assert storage.get_names(
+        domain=MIoTSpecStore.DOMAIN, type_=dict) == ['spec_std_lib']
+
+    specs = {
+        f'urn:test:{index}': {'urn': f'urn:test:{index}', 'services': []}
+        for index in range(300)}
+    for urn, data in specs.items():
+        assert await store.set_async(
+            urn=urn, lang='zh-Hans', data=data, version=1)
+    result = await store.get_many_async(
+        keys=[(urn, 'zh-Hans') for urn in specs] + [('urn:none', 'en')],
+        version=1)
+    assert result == {(urn, 'zh-Hans'): data for urn, data in specs.items()}
+    # Records of another spec version are ignored
+    assert await store.get_async(
+        urn='urn:test:0', lang='zh-Hans', version=2) is None
+    assert await store.remove_async(urn='urn:test:0')
+    assert await store.get_async(
+        urn='urn:test:0', lang='zh-Hans', version=1) is None
+    assert await storage.remove_domain_async(domain=MIoTSpecStore.DOMAIN)
+
+
 @pytest.mark.asyncio
 @pytest.mark.skip(reason='clean')
 @pytest.mark.dependency()